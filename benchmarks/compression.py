@@ -0,0 +1,105 @@
+"""
+Measures the compression ratio of the stored emails and the throughput of reading their bodies back, for every
+compression of the pack storage.
+
+Usage: python -m benchmarks.compression [--emails 10000] [--body-size 800] [--output results.json]
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+from mail_manager import utils
+from mail_manager.database import DatabaseConfiguration
+from mail_manager.migrate import migrate
+
+from .generator import generate_mailbox
+from .run import git_revision
+
+
+CODECS = (
+    ("none", None, False),
+    ("zlib", "zlib", False),
+    ("lzma", "lzma", False),
+    ("zlib-dict", "zlib", True),
+)
+
+
+def measure(name, compression, dictionary, source_dir, args):
+    directory = tempfile.mkdtemp(prefix="mail-manager-compression-")
+    try:
+        db_config = DatabaseConfiguration(directory, storage="pack", compression=compression,
+                                          compression_dictionary=dictionary, dictionary_threshold=args.threshold,
+                                          lazy_bodies=True)
+        migrate(DatabaseConfiguration(source_dir, lazy_bodies=True), db_config)
+        db = utils.load_database(db_config)
+
+        decoded = 0
+        start = time.perf_counter()
+        for email in db.emails:
+            decoded += len(email.read_body() or "")
+        elapsed = time.perf_counter() - start
+
+        raw = stored = small_raw = small_stored = 0
+        for email in db.emails:
+            raw_size = len(str(email).encode())
+            stored_size = db.storage.index[email.id][2]
+            raw += raw_size
+            stored += stored_size
+            if len((email.body or "").encode()) <= args.threshold:
+                small_raw += raw_size
+                small_stored += stored_size
+        db.close()
+
+        return {
+            "codec": name,
+            "emails": len(db.emails),
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "ratio": raw / stored,
+            "small_ratio": small_raw / small_stored if small_stored else None,
+            "decode_mb_per_second": decoded / elapsed / 1e6,
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--emails", type=int, default=10000)
+    parser.add_argument("--folders", type=int, default=8)
+    parser.add_argument("--body-size", type=int, default=800)
+    parser.add_argument("--body-sigma", type=float, default=1.0)
+    parser.add_argument("--multipart", type=float, default=0.1)
+    parser.add_argument("--threshold", type=int, default=4096, help="biggest body compressed with the dictionary")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file where the JSON results are written, defaults to stdout")
+    args = parser.parse_args()
+
+    source_dir = tempfile.mkdtemp(prefix="mail-manager-compression-source-")
+    try:
+        generate_mailbox(source_dir, args.emails, args.folders, body_size=args.body_size,
+                         body_sigma=args.body_sigma, multipart=args.multipart, seed=args.seed)
+        results = [measure(name, compression, dictionary, source_dir, args)
+                   for name, compression, dictionary in CODECS]
+    finally:
+        shutil.rmtree(source_dir, ignore_errors=True)
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "parameters": dict(vars(args), output=None),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Generates synthetic email databases in the emailDB format: an EMConfig.txt file plus one .txt file per email.
+
+Usage: python -m benchmarks.generator DIRECTORY [--emails 1000] [--folders 5] [--overlap 0.2] [--body-size 800]
+"""
+import argparse
+import math
+import os
+import random
+
+
+WORDS = ("the", "bank", "manager", "message", "meeting", "report", "project", "course", "data", "structures",
+         "algorithms", "test", "invoice", "please", "find", "attached", "regards", "thanks", "tomorrow", "week",
+         "account", "update", "review", "deadline", "schedule", "question", "answer", "practice", "exam", "lab",
+         "list", "folder", "email", "server", "client", "database", "search", "index", "python", "linked")
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def random_text(rng, size):
+    """
+    Returns random words until the text is about the given number of characters, in lines of about 70 characters.
+    """
+    lines = []
+    line = []
+    length = line_length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        line.append(word)
+        length += len(word) + 1
+        line_length += len(word) + 1
+        if line_length > 70:
+            lines.append(" ".join(line))
+            line = []
+            line_length = 0
+    if line:
+        lines.append(" ".join(line))
+    return "\n".join(lines) + "\n"
+
+
+def random_address(rng, n_people):
+    person = rng.randrange(n_people)
+    return "\"User {0}\" <user{0}@example.com>".format(person)
+
+
+def random_date(rng):
+    return "{}, {:02d} {} {} {:02d}:{:02d}:{:02d} +0100 (CET)".format(
+        rng.choice(DAYS), rng.randint(1, 28), rng.choice(MONTHS), rng.randint(2010, 2020),
+        rng.randrange(24), rng.randrange(60), rng.randrange(60))
+
+
+def random_body(rng, size, multipart):
+    """
+    Returns a plain text body, or a multipart/alternative body with the same text as text/plain and text/html.
+    """
+    text = random_text(rng, size)
+    if not multipart:
+        return text
+
+    boundary = "%028x" % rng.getrandbits(112)
+    html = "<div dir=\"ltr\">" + text.replace("\n", "<br>") + "</div>\n"
+    return ("--{0}\nContent-Type: text/plain; charset=UTF-8\n\n{1}\n"
+            "--{0}\nContent-Type: text/html; charset=UTF-8\n\n{2}\n"
+            "--{0}--\n").format(boundary, text, html)
+
+
+def body_size_sampler(rng, median, sigma):
+    """
+    Returns a function that draws body sizes from a log-normal distribution with the given median.
+    """
+    mu = math.log(max(median, 1))
+    return lambda: max(1, int(rng.lognormvariate(mu, sigma)))
+
+
+def generate_mailbox(directory, n_emails, n_folders=5, overlap=0.2, body_size=800, body_sigma=1.0,
+                     multipart=0.1, n_people=500, seed=0):
+    """
+    Writes a synthetic email database in the given directory.
+
+    The database always has the Inbox and OutBox folders, plus n_folders - 2 extra folders. Every email is placed in
+    one random folder and, with probability overlap, also in a second one.
+
+    :param directory: Directory where the database is written. It is created if it doesn't exist.
+    :param n_emails: Number of emails.
+    :param n_folders: Number of folders, at least 2.
+    :param overlap: Probability of an email to belong to a second folder.
+    :param body_size: Median size of the bodies in characters.
+    :param body_sigma: Sigma of the log-normal distribution of the body sizes.
+    :param multipart: Fraction of the emails with a multipart body (text/plain and text/html).
+    :param n_people: Number of different senders and receivers.
+    :param seed: Seed of the random generator.
+    :return: the list of generated email ids.
+    """
+    rng = random.Random(seed)
+    sizes = body_size_sampler(rng, body_size, body_sigma)
+    os.makedirs(directory, exist_ok=True)
+
+    folder_names = ["Inbox", "OutBox"] + ["Folder" + str(i) for i in range(max(n_folders, 2) - 2)]
+    folders = {name: [] for name in folder_names}
+
+    email_ids = []
+    for i in range(n_emails):
+        email_id = "bench" + str(i)
+        email_ids.append(email_id)
+        with open(os.path.join(directory, email_id + ".txt"), 'w') as f:
+            f.write("Date: " + random_date(rng) + "\n")
+            f.write("From: " + random_address(rng, n_people) + "\n")
+            f.write("To: " + random_address(rng, n_people) + "\n")
+            f.write("Message-ID: " + email_id + "\n")
+            f.write("Subject: " + random_text(rng, 30).strip().replace("\n", " ") + "\n\n")
+            f.write(random_body(rng, sizes(), rng.random() < multipart))
+
+        first = rng.choice(folder_names)
+        folders[first].append(email_id)
+        if len(folder_names) > 1 and rng.random() < overlap:
+            second = rng.choice([name for name in folder_names if name != first])
+            folders[second].append(email_id)
+
+    with open(os.path.join(directory, "EMConfig.txt"), 'w') as f:
+        f.write("Message-ID: " + str(n_emails) + "\n\n")
+        f.write("Folders:\n")
+        for name in folder_names:
+            f.write(name + "\n")
+        for name in folder_names:
+            f.write("\n" + name + " Messages:\n")
+            for email_id in folders[name]:
+                f.write(email_id + "\n")
+        f.write("\nEnd\n")
+
+    return email_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--folders", type=int, default=5)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--body-size", type=int, default=800)
+    parser.add_argument("--body-sigma", type=float, default=1.0)
+    parser.add_argument("--multipart", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_mailbox(args.directory, args.emails, args.folders, args.overlap, args.body_size, args.body_sigma,
+                     args.multipart, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
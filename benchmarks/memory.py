@@ -0,0 +1,161 @@
+"""
+Measures the memory used per email by a loaded database, and what the same database would use with dict-based
+objects and without interned senders and receivers.
+
+The other layouts are measured with tracemalloc too, on copies of the emails, the nodes of the lists and the
+folders of the loaded database built with each layout. The bodies and the other strings are shared with the
+database, so a copy only measures the objects that change between the layouts.
+
+Usage: python -m benchmarks.memory [--emails 10000 100000] [--output results.json]
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from mail_manager import utils
+from mail_manager.database import DatabaseConfiguration
+
+from .generator import generate_mailbox
+from .run import git_revision
+
+
+class DictObject:
+    """
+    Plain object whose attributes are stored in a __dict__, used to measure the layout before __slots__.
+    """
+
+
+def slot_names(cls):
+    names = []
+    for klass in cls.__mro__:
+        slots = klass.__dict__.get("__slots__", ())
+        names.extend((slots,) if isinstance(slots, str) else slots)
+    return names
+
+
+def is_copied(value):
+    return type(value).__module__.startswith("mail_manager.")
+
+
+def copy_structure(db, slots, intern):
+    """
+    Copies the emails, the lists and the folders of a database, and every object they refer to that belongs to
+    mail_manager.
+
+    :param db: the loaded database.
+    :param slots: if True the objects keep the classes of mail_manager, with __slots__, otherwise their attributes
+     are stored in the __dict__ of DictObjects.
+    :param intern: if False every email gets its own copy of its sender and receiver.
+    :return: the copy of the list of emails, the copy of the folders and the number of copied objects.
+    """
+    # The objects are found first and filled afterwards, as the linked lists are too long to be copied recursively
+    copies = {}
+    pending = [db.emails, db.folders]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, (list, set, tuple)):
+            pending.extend(value)
+        elif is_copied(value) and id(value) not in copies:
+            names = slot_names(type(value))
+            copy = object.__new__(type(value)) if not names or slots else DictObject()
+            copies[id(value)] = (value, copy, names)
+            if not names:
+                pending.extend(value.__dict__.values())
+            else:
+                pending.extend(getattr(value, name, None) for name in names)
+
+    def copy_value(value):
+        if isinstance(value, dict):
+            return {key: copy_value(item) for key, item in value.items()}
+        if isinstance(value, (list, set, tuple)):
+            return type(value)(copy_value(item) for item in value)
+        if is_copied(value):
+            return copies[id(value)][1]
+        return value
+
+    for value, copy, names in copies.values():
+        if not names:
+            copy.__dict__.update((name, copy_value(item)) for name, item in value.__dict__.items())
+            continue
+        for name in names:
+            if hasattr(value, name):
+                item = getattr(value, name)
+                if not intern and name in ("sender", "receiver") and item:
+                    item = item.encode().decode()
+                setattr(copy, name, copy_value(item))
+    return copy_value(db.emails), copy_value(db.folders), len(copies)
+
+
+def measure_structure(db, slots, intern):
+    """
+    Returns the bytes taken by a copy of the structure of the database with the given layout, see copy_structure.
+    """
+    tracemalloc.start()
+    copy = copy_structure(db, slots, intern)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copy
+    return size
+
+
+def measure(scale, args):
+    directory = tempfile.mkdtemp(prefix="mail-manager-memory-")
+    try:
+        generate_mailbox(directory, scale, args.folders, args.overlap, args.body_size, seed=args.seed)
+        db_config = DatabaseConfiguration(directory, lazy_bodies=args.lazy_bodies)
+
+        tracemalloc.start()
+        db = utils.load_database(db_config)
+        loaded = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        current = measure_structure(db, True, True)
+        without_slots = measure_structure(db, False, True)
+        without_interning = measure_structure(db, True, False)
+        before = measure_structure(db, False, False)
+
+        emails = len(db.emails)
+        return {
+            "scale": scale,
+            "emails": emails,
+            "bytes_per_email": loaded / emails,
+            "bytes_per_email_without_slots": (loaded - current + without_slots) / emails,
+            "bytes_per_email_without_interning": (loaded - current + without_interning) / emails,
+            "bytes_per_email_before": (loaded - current + before) / emails,
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--emails", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--folders", type=int, default=8)
+    parser.add_argument("--overlap", type=float, default=0.5)
+    parser.add_argument("--body-size", type=int, default=800)
+    parser.add_argument("--lazy-bodies", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file where the JSON results are written, defaults to stdout")
+    args = parser.parse_args()
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "parameters": dict(vars(args), output=None),
+        "results": [measure(scale, args) for scale in args.emails],
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Times the main Database operations on synthetic databases of several sizes and prints the results as JSON.
+
+Usage: python -m benchmarks.run [--scales 1000 10000 100000] [--output results.json] [--search-index] ...
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from mail_manager import utils
+from mail_manager.database import DatabaseConfiguration
+from mail_manager.email import Email
+from mail_manager.migrate import migrate
+
+from .generator import generate_mailbox
+
+
+QUERIES = ("bank manager", "deadline", "anag", "user12@example.com", "Subject that does not exist")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Timer:
+    """
+    Collects the time spent on each operation at a given scale.
+    """
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.results = []
+
+    def record(self, operation, count, seconds):
+        self.results.append({
+            "scale": self.scale,
+            "operation": operation,
+            "count": count,
+            "seconds": seconds,
+            "us_per_op": seconds / count * 1e6 if count else None,
+        })
+
+    def time(self, operation, function, items):
+        """
+        Calls the function with every item and records the total time.
+        """
+        items = list(items)
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        self.record(operation, len(items), time.perf_counter() - start)
+
+
+def run_scale(scale, args, config_options):
+    """
+    Generates a database with the given number of emails and times every operation on it.
+    """
+    rng = random.Random(args.seed)
+    timer = Timer(scale)
+    directory = tempfile.mkdtemp(prefix="mail-manager-bench-")
+    try:
+        generate_mailbox(directory, scale, args.folders, args.overlap, args.body_size, args.body_sigma,
+                         args.multipart, seed=args.seed)
+        db_config = DatabaseConfiguration(directory, **config_options)
+        if db_config.storage != "files":
+            migrate(DatabaseConfiguration(directory), db_config)
+
+        start = time.perf_counter()
+        db = utils.load_database(db_config)
+        timer.record("load_database", scale, time.perf_counter() - start)
+
+        folder_names = db.get_folder_names()
+        timer.time("get_email_ids", lambda name: db.get_email_ids(name), [None] + folder_names)
+        timer.time("search", db.search, QUERIES)
+
+        operations = min(args.operations, scale)
+        new_emails = [Email("new" + str(i), "\"New\" <new@example.com>", "me <me@example.com>", "new email " + str(i),
+                            "Tue, 07 Feb 2017 21:32:46 +0100 (CET)", "body of the new email " + str(i) + "\n")
+                      for i in range(operations)]
+        timer.time("add_email", lambda email: db.add_email(email, rng.choice(folder_names)), new_emails)
+
+        in_folders = [(db.get_email(email_id), name) for name in folder_names
+                      for email_id in db.get_email_ids(name)]
+        removed = rng.sample(in_folders, min(operations, len(in_folders)))
+        timer.time("remove_email_from_folder", lambda pair: db.remove_email(*pair), removed)
+
+        emails = [db.get_email(email_id) for email_id in rng.sample(db.get_email_ids(), operations // 2)]
+        timer.time("remove_email", db.remove_email, emails)
+
+        timer.time("write_database", utils.write_database, [db])
+
+        extra_folders = [name for name in folder_names if name not in ("Inbox", "OutBox")]
+        timer.time("remove_folder", db.remove_folder, extra_folders)
+        db.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return timer.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--operations", type=int, default=1000,
+                        help="number of emails added and removed at every scale")
+    parser.add_argument("--folders", type=int, default=8)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--body-size", type=int, default=800)
+    parser.add_argument("--body-sigma", type=float, default=1.0)
+    parser.add_argument("--multipart", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search-index", action="store_true")
+    parser.add_argument("--trigram-index", action="store_true")
+    parser.add_argument("--lazy-bodies", action="store_true")
+    parser.add_argument("--load-workers", type=int)
+    parser.add_argument("--load-mode", choices=("threads", "processes"), default="threads")
+    parser.add_argument("--storage", choices=("files", "pack"), default="files")
+    parser.add_argument("--output", help="file where the JSON results are written, defaults to stdout")
+    args = parser.parse_args()
+
+    config_options = {
+        "search_index": args.search_index,
+        "trigram_index": args.trigram_index,
+        "lazy_bodies": args.lazy_bodies,
+        "load_workers": args.load_workers,
+        "load_mode": args.load_mode,
+        "storage": args.storage,
+    }
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "parameters": dict(vars(args), output=None),
+        "results": [],
+    }
+    for scale in args.scales:
+        report["results"].extend(run_scale(scale, args, config_options))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
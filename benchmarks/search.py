@@ -0,0 +1,87 @@
+"""
+Compares Database.search with a linear scan, the inverted search index and the trigram index, and optionally with
+scans on several worker processes.
+
+Usage: python -m benchmarks.search [--sizes 10000 100000 1000000] [--queries 20] [--workers 2 4 8]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from mail_manager.database import Database, DatabaseConfiguration
+from mail_manager.email import Email
+
+
+def make_vocabulary(rng, size=5000):
+    """
+    Builds a vocabulary of random lower case words.
+    """
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def make_database(n_emails, vocabulary, seed, **indexes):
+    """
+    Creates an in-memory database with n_emails random emails in the Inbox folder.
+    """
+    rng = random.Random(seed)
+    db = Database(DatabaseConfiguration(tempfile.gettempdir(), **indexes), 0)
+    db.create_folder("Inbox")
+    for i in range(n_emails):
+        email = Email(email_id="bench" + str(i),
+                      sender=rng.choice(vocabulary) + " <" + rng.choice(vocabulary) + "@example.com>",
+                      receiver="me <me@example.com>",
+                      subject=" ".join(rng.choices(vocabulary, k=5)),
+                      date="Tue, 07 Feb 2017 21:32:46 +0100 (CET)",
+                      body=" ".join(rng.choices(vocabulary, k=80)))
+        db.add_email(email, "Inbox")
+    return db
+
+
+def time_queries(db, queries):
+    start = time.perf_counter()
+    found = 0
+    for query in queries:
+        found += len(db.search(query))
+    return time.perf_counter() - start, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, nargs="*", default=[],
+                        help="numbers of search worker processes to compare with the linear scan")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng)
+    queries = [" ".join(rng.choices(vocabulary, k=2)) for _ in range(args.queries // 2)]
+    queries += [rng.choice(vocabulary)[1:] for _ in range(args.queries - len(queries))]
+
+    modes = [("scan", {}), ("words", {"search_index": True}), ("trigrams", {"trigram_index": True})]
+    modes += [(str(workers) + " procs", {"search_workers": workers}) for workers in args.workers]
+
+    print("{:>10} {:>10} {:>12} {:>12} {:>10}".format("emails", "mode", "build (s)", "search (s)", "speedup"))
+    for size in args.sizes:
+        scan_time = scan_found = None
+        for mode, indexes in modes:
+            start = time.perf_counter()
+            db = make_database(size, vocabulary, args.seed, **indexes)
+            build_time = time.perf_counter() - start
+            search_time, found = time_queries(db, queries)
+            db.close()
+            del db
+
+            if scan_time is None:
+                scan_time, scan_found = search_time, found
+            elif found != scan_found:
+                raise AssertionError("The " + mode + " search returned different results than the scan")
+            print("{:>10} {:>10} {:>12.3f} {:>12.3f} {:>9.1f}x".format(
+                size, mode, build_time, search_time, scan_time / search_time if search_time else float("inf")))
+
+
+if __name__ == "__main__":
+    main()
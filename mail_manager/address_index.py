@@ -0,0 +1,111 @@
+import sys
+from email.utils import getaddresses
+from functools import lru_cache
+
+from .index import Index
+
+
+@lru_cache(maxsize=4096)
+def parse_addresses(field):
+    """
+    Parses a sender or receiver field, like '"Bank" <bank@bank.bank.com>' or 'bank@bank.bank.com', which may
+    contain several addresses separated by commas.
+
+    :param field: the field, it can be None.
+    :return: a tuple of (name, address) pairs, both in lowercase.
+    """
+    if not field:
+        return ()
+    pairs = []
+    for name, address in getaddresses([field]):
+        if name or address:
+            pairs.append((sys.intern(name.strip().lower()), sys.intern(address.strip().lower())))
+    return tuple(pairs)
+
+
+def normalize_address(address):
+    """
+    Normalizes an address given by the user, so it can be compared with the addresses of parse_addresses.
+
+    :param address: the address, with or without a name and angle brackets, or part of an address or a name.
+    :return: the address in lowercase.
+    """
+    value = address.strip().lower()
+    if '@' in value:
+        pairs = parse_addresses(value)
+        if pairs and '@' in pairs[0][1]:
+            return pairs[0][1]
+    return value
+
+
+def address_matches(field, value):
+    """
+    Checks if a sender or receiver field matches a value. A value with an '@' must be equal to one of the
+    addresses of the field, other values only need to appear in one of its names or addresses. Case is ignored.
+
+    :param field: the sender or receiver field.
+    :param value: the value to look for.
+    :return: True if the field matches the value, False otherwise.
+    """
+    value = normalize_address(value)
+    if '@' in value:
+        return any(address == value for name, address in parse_addresses(field))
+    return any(value in name or value in address for name, address in parse_addresses(field))
+
+
+class AddressIndex(Index):
+    """
+    Index from the normalized addresses of the sender or of the receiver field to the emails that have them, so
+    finding the emails of an address takes O(k). Names are indexed as well, so a value without an '@' can be
+    matched against the distinct names and addresses instead of against every email.
+
+    The emails of each address are kept in a dictionary by id, which keeps the order in which they were added,
+    that is the database order.
+    """
+
+    def __init__(self, field):
+        """
+        Initializes an empty index.
+
+        :param field: name of the indexed attribute of the emails, 'sender' or 'receiver'.
+        """
+        self.field = field
+        self.addresses = {}
+        self.names = {}
+
+    def add_email(self, email):
+        for name, address in parse_addresses(getattr(email, self.field)):
+            if address:
+                self.addresses.setdefault(address, {})[email.id] = email
+            if name:
+                self.names.setdefault(name, {})[email.id] = email
+
+    def remove_email(self, email):
+        for name, address in parse_addresses(getattr(email, self.field)):
+            self._discard(self.addresses, address, email)
+            self._discard(self.names, name, email)
+
+    def lookup(self, value):
+        """
+        Returns the emails whose field matches the value, following the rules of address_matches.
+
+        :param value: the value to look for.
+        :return: a dictionary from email id to email. It must not be modified.
+        """
+        value = normalize_address(value)
+        if '@' in value:
+            return self.addresses.get(value, {})
+        found = {}
+        for vocabulary in (self.addresses, self.names):
+            for key, emails in vocabulary.items():
+                if value in key:
+                    found.update(emails)
+        return found
+
+    @staticmethod
+    def _discard(vocabulary, key, email):
+        emails = vocabulary.get(key)
+        if emails is not None:
+            emails.pop(email.id, None)
+            if not emails:
+                del vocabulary[key]
@@ -0,0 +1,66 @@
+import sys
+
+from .index import Index
+
+
+class BodyPool(Index):
+    """
+    Pool of the loaded bodies of a database, so emails with identical bodies, like mailing-list traffic or
+    forwarded mail, share a single string instead of keeping a copy each.
+
+    The pool is kept up to date like an index: the body of every new email is looked up by its content and, if an
+    equal body is already in the pool, the email is made to share it. Every body counts the emails sharing it, and
+    it is dropped from the pool when the last of them is removed. Bodies that are not loaded yet are left alone,
+    lazy emails share their bodies through the body cache instead.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty pool.
+        """
+        self.bodies = {}
+        self.lookups = 0
+        self.hits = 0
+        self.saved_bytes = 0
+
+    def add_email(self, email):
+        if email.body_path is not None or email.body is None:
+            return
+        body = email.body
+        self.lookups += 1
+        entry = self.bodies.get(body)
+        if entry is None:
+            self.bodies[body] = [body, 1]
+            return
+        entry[1] += 1
+        self.hits += 1
+        self.saved_bytes += sys.getsizeof(body)
+        email.share_body(entry[0])
+
+    def remove_email(self, email):
+        if email.body_path is not None or email.body is None:
+            return
+        body = email.body
+        entry = self.bodies.get(body)
+        # Bodies read on demand after the email was added were never pooled, they are equal but not the same string
+        if entry is None or entry[0] is not body:
+            return
+        entry[1] -= 1
+        if entry[1]:
+            self.saved_bytes -= sys.getsizeof(body)
+        else:
+            del self.bodies[body]
+
+    def stats(self):
+        """
+        Returns how much the pool saves.
+
+        :return: a dictionary with the number of distinct bodies in the pool, the number of looked up bodies, the
+         fraction of them that were already in the pool, and the bytes of the copies that are not kept.
+        """
+        return {
+            "bodies": len(self.bodies),
+            "lookups": self.lookups,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "saved_bytes": self.saved_bytes,
+        }
@@ -0,0 +1,61 @@
+"""
+Thin client of server.DatabaseServer. It only needs the standard library, so a command sent to a running server
+starts quickly.
+"""
+import json
+import socket
+
+from .exceptions import MailManagerException
+
+
+class Client:
+    """
+    Connection to a DatabaseServer.
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        """
+        Connects to the server. It raises an OSError if there is no server listening on the path.
+
+        :param socket_path: path of the Unix domain socket of the server.
+        :param timeout: optional timeout of the requests, in seconds.
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.settimeout(timeout)
+            self.socket.connect(socket_path)
+        except OSError:
+            self.socket.close()
+            raise
+        self.file = self.socket.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def request(self, command, **args):
+        """
+        Sends a request and waits for its response. It raises a MailManagerException if the command fails.
+
+        :param command: name of the command, like 'list' or 'add-to-folder'.
+        :param args: arguments of the command.
+        :return: the result of the command.
+        """
+        self.file.write(json.dumps({"command": command, "args": args}).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise MailManagerException("The server closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise MailManagerException(response["error"])
+        return response["result"]
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        self.file.close()
+        self.socket.close()
@@ -0,0 +1,151 @@
+import hashlib
+import lzma
+import os
+import zlib
+from collections import Counter
+
+from .exceptions import MailManagerException
+
+
+CODECS = ("zlib", "lzma")
+
+DICTIONARY_PREFIX = "zlib-dict:"
+
+_dictionaries = {}
+
+
+def compress(data, codec, level=None, dictionary=None):
+    """
+    Compresses the body of an email.
+
+    :param data: the body, as bytes.
+    :param codec: 'zlib' or 'lzma'.
+    :param level: compression level, defaults to the one of the codec.
+    :param dictionary: optional Dictionary used as preset dictionary, only for zlib.
+    :return: a tuple with the compressed data and the encoding to be written in the email, like 'zlib' or
+     'zlib-dict:<id>'.
+    """
+    if codec == "lzma":
+        return lzma.compress(data, preset=level), "lzma"
+    if codec != "zlib":
+        raise MailManagerException("Invalid compression \'" + str(codec) + "\'")
+
+    level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+    if dictionary is None:
+        return zlib.compress(data, level), "zlib"
+    compressor = zlib.compressobj(level, zdict=dictionary.data)
+    return compressor.compress(data) + compressor.flush(), DICTIONARY_PREFIX + dictionary.id
+
+
+def decompress(data, encoding, directory):
+    """
+    Decompresses the body of an email.
+
+    :param data: the compressed body, as bytes or as any object supporting the buffer protocol.
+    :param encoding: encoding written in the email.
+    :param directory: directory where the dictionaries of the storage are kept.
+    :return: the body, as bytes.
+    """
+    if encoding == "zlib":
+        return zlib.decompress(data)
+    if encoding == "lzma":
+        return lzma.decompress(data)
+    if encoding.startswith(DICTIONARY_PREFIX):
+        dictionary = load_dictionary(directory, encoding[len(DICTIONARY_PREFIX):])
+        decompressor = zlib.decompressobj(zdict=dictionary.data)
+        return decompressor.decompress(data) + decompressor.flush()
+    raise MailManagerException("Unknown body encoding \'" + encoding + "\'")
+
+
+class Dictionary:
+    """
+    Preset dictionary for zlib, made of the strings that appear most often in a sample of bodies. Small bodies
+    don't have enough data for zlib to find repetitions, but with a dictionary they can refer to the strings they
+    share with the rest of the bodies.
+
+    The dictionary is identified by a hash of its content, written in the encoding of every email compressed with
+    it, so old emails can still be read when a new dictionary is trained.
+    """
+
+    __slots__ = ("data", "id")
+
+    def __init__(self, data):
+        """
+        :param data: content of the dictionary.
+        """
+        self.data = data
+        self.id = hashlib.sha1(data).hexdigest()[:16]
+
+    @staticmethod
+    def train(samples, size=32 * 1024):
+        """
+        Builds a dictionary from a sample of bodies. Repeated lines are taken first, then repeated words, ranked by
+        the number of bytes they would save. The most valuable strings go at the end of the dictionary, where zlib
+        reaches them with the shortest distances.
+
+        :param samples: iterable of bodies, as bytes.
+        :param size: maximum size of the dictionary in bytes, zlib only uses the last 32 KiB.
+        :return: the Dictionary, or None if the samples have nothing repeated.
+        """
+        lines = Counter()
+        words = Counter()
+        for sample in samples:
+            for line in sample.splitlines(keepends=True):
+                if len(line) > 8:
+                    lines[line] += 1
+                words.update(word + b" " for word in line.split() if len(word) > 3)
+
+        candidates = [(count * len(line), line) for line, count in lines.items() if count > 1]
+        candidates.sort(reverse=True)
+        ranked_words = [(count * len(word), word) for word, count in words.items() if count > 1]
+        ranked_words.sort(reverse=True)
+
+        pieces = []
+        total = 0
+        for _, piece in candidates + ranked_words:
+            if total + len(piece) <= size:
+                pieces.append(piece)
+                total += len(piece)
+        if not pieces:
+            return None
+        return Dictionary(b"".join(reversed(pieces)))
+
+    def save(self, directory):
+        """
+        Writes the dictionary to the given directory, as dict-<id>.zdict, and makes it the current one.
+
+        :param directory: directory of the storage.
+        """
+        path = os.path.join(directory, "dict-" + self.id + ".zdict")
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        with open(os.path.join(directory, "current.zdict") + ".tmp", 'w') as f:
+            f.write(self.id)
+        os.replace(os.path.join(directory, "current.zdict") + ".tmp", os.path.join(directory, "current.zdict"))
+        _dictionaries[self.id] = self
+
+
+def load_dictionary(directory, dictionary_id=None):
+    """
+    Loads a dictionary of a storage. Dictionaries are kept in memory once loaded.
+
+    :param directory: directory of the storage.
+    :param dictionary_id: id of the dictionary, defaults to the current dictionary of the directory.
+    :return: the Dictionary, or None if no id is given and the directory has no current dictionary.
+    """
+    if dictionary_id is None:
+        try:
+            with open(os.path.join(directory, "current.zdict")) as f:
+                dictionary_id = f.read().strip()
+        except OSError:
+            return None
+
+    dictionary = _dictionaries.get(dictionary_id)
+    if dictionary is None:
+        try:
+            with open(os.path.join(directory, "dict-" + dictionary_id + ".zdict"), 'rb') as f:
+                dictionary = Dictionary(f.read())
+        except OSError:
+            raise MailManagerException("The compression dictionary \'" + dictionary_id + "\' is missing")
+        _dictionaries[dictionary_id] = dictionary
+    return dictionary
@@ -1,10 +1,22 @@
 import logging
 import os
-
-from .email import Email
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from functools import wraps
+
+from .address_index import AddressIndex
+from .body_pool import BodyPool
+from .date_index import DateIndex
+from .email import BodyCache, Email
 from .folder import Folder
 from .exceptions import MailManagerException
-from .linked_list import LinkedList
+from .linked_list import IndexedLinkedList, LinkedList
+from .metadata import MetadataStore
+from .query import parse_query
+from .search_index import SearchIndex
+from .storage import open_storage
+from .trigram_index import TrigramIndex
 
 
 class DatabaseConfiguration:
@@ -12,7 +24,13 @@ class DatabaseConfiguration:
     This class allow us to configure all the different parameters of the database such as its location.
     """
 
-    def __init__(self, database_dir, config_filename="EMConfig.txt", email_dir=None, email_extension=".txt"):
+    def __init__(self, database_dir, config_filename="EMConfig.txt", email_dir=None, email_extension=".txt",
+                 search_index=False, trigram_index=False, trigram_memory_limit=None, lazy_bodies=False,
+                 body_cache_size=None, load_workers=None, load_mode="threads", journal=False, journal_sync_every=32,
+                 journal_compact_threshold=10000, snapshot=False, metadata_store=False,
+                 date_index=False, address_index=False, storage="files", pack_segment_size=64 * 1024 * 1024,
+                 compression=None, compression_level=None, compression_dictionary=False, dictionary_threshold=4096,
+                 deduplicate_bodies=False, thread_safe=False, search_workers=None):
         """
         Initializes the database configuration with the database directory, where the configuration file is located.
         Also it allows to configure a different email directory and email extension.
@@ -21,6 +39,46 @@ class DatabaseConfiguration:
         :param config_filename: Name of the configuration file, defaults to 'EMConfig.txt'.
         :param email_dir: Path of the email directory, defaults to the base directory (database_dir).
         :param email_extension: Extension fo the email files, defaults to '.txt'.
+        :param search_index: If True, the database keeps an inverted index of words to speed up searches.
+        :param trigram_index: If True, the database keeps a trigram index to speed up substring searches.
+        :param trigram_memory_limit: Maximum number of bytes of the trigram posting lists, defaults to no limit.
+        :param lazy_bodies: If True, only the headers of the emails are loaded and the bodies are read on demand.
+        :param body_cache_size: Maximum number of bodies kept in memory when lazy_bodies is enabled. If not provided
+         every body stays in its email once it has been read.
+        :param load_workers: Number of workers used to load the email files concurrently. If not provided the files
+         are loaded one after another.
+        :param load_mode: Kind of workers used to load the email files, 'threads' or 'processes'.
+        :param journal: If True, every change is appended to a journal next to the configuration file as soon as it
+         happens, and the journal is replayed when the database is loaded.
+        :param journal_sync_every: Number of journal entries written between two syncs to disk.
+        :param journal_compact_threshold: Number of journal entries after which the journal is folded into a new
+         configuration file.
+        :param snapshot: If True, a binary snapshot of the folders and the email headers is kept next to the
+         configuration file, and the database is loaded from it while the configuration and email files don't change.
+        :param metadata_store: If True, the database keeps a columnar store of the email headers for bulk queries
+         like counting emails per sender or filtering by date.
+        :param date_index: If True, the database keeps its emails sorted by date, for the whole database and for
+         every folder, to list them by date and to find the newest ones or the ones in a range of dates.
+        :param address_index: If True, the database keeps indexes of the sender and receiver addresses, used by the
+         from: and to: terms of Database.query.
+        :param storage: How the emails are stored in the email directory: 'files' keeps a text file per email,
+         'pack' appends them to a few large segment files (see storage.PackStorage).
+        :param pack_segment_size: Size in bytes after which the 'pack' storage starts a new segment file.
+        :param compression: Compression of the bodies of the emails written from now on, 'zlib' or 'lzma'. Headers
+         are never compressed, and emails written without compression can always be read.
+        :param compression_level: Compression level, defaults to the one of the codec.
+        :param compression_dictionary: If True, bodies smaller than dictionary_threshold are compressed with the
+         zlib dictionary trained for the storage (see storage.Storage.train_dictionary), if there is one.
+        :param dictionary_threshold: Size in bytes of the biggest body compressed with the dictionary.
+        :param deduplicate_bodies: If True, identical bodies are kept once. The bodies of the emails written from
+         now on are stored apart, addressed by the hash of their content, and the loaded bodies of the database
+         are shared between the emails that have equal ones (see body_pool.BodyPool).
+        :param thread_safe: If True, the database can be shared by several threads. Changes are made one at a time
+         under the lock of the database, and searches and views read a consistent state of it without holding
+         the lock while they check the emails (see Database.view).
+        :param search_workers: Number of worker processes that scan the emails when Database.search or
+         Database.query can't narrow them with an index (see parallel.ParallelSearch). If not provided the emails
+         are scanned in this process.
         """
 
         self.database_dir = database_dir
@@ -32,6 +90,41 @@ class DatabaseConfiguration:
             self.email_dir = database_dir
 
         self.email_extension = email_extension
+        self.search_index = search_index
+        self.trigram_index = trigram_index
+        self.trigram_memory_limit = trigram_memory_limit
+        self.lazy_bodies = lazy_bodies
+        self.body_cache_size = body_cache_size
+
+        if load_mode not in ("threads", "processes"):
+            raise MailManagerException("Invalid load mode \'" + str(load_mode) + "\'")
+        self.load_workers = load_workers
+        self.load_mode = load_mode
+
+        self.journal = journal
+        self.journal_sync_every = journal_sync_every
+        self.journal_compact_threshold = journal_compact_threshold
+        self.snapshot = snapshot
+        self.metadata_store = metadata_store
+        self.date_index = date_index
+        self.address_index = address_index
+
+        if storage not in ("files", "pack"):
+            raise MailManagerException("Invalid storage \'" + str(storage) + "\'")
+        self.storage = storage
+        self.pack_segment_size = pack_segment_size
+
+        if compression not in (None, "zlib", "lzma"):
+            raise MailManagerException("Invalid compression \'" + str(compression) + "\'")
+        if compression_dictionary and compression != "zlib":
+            raise MailManagerException("Compression dictionaries are only supported by zlib")
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_dictionary = compression_dictionary
+        self.dictionary_threshold = dictionary_threshold
+        self.deduplicate_bodies = deduplicate_bodies
+        self.thread_safe = thread_safe
+        self.search_workers = search_workers
 
     def get_config_path(self):
         """
@@ -41,6 +134,22 @@ class DatabaseConfiguration:
         """
         return os.path.join(self.database_dir, self.config_filename)
 
+    def get_journal_path(self):
+        """
+        Returns the path where the journal of the database is located
+
+        :return The journal file path
+        """
+        return self.get_config_path() + ".journal"
+
+    def get_snapshot_path(self):
+        """
+        Returns the path where the binary snapshot of the database is located
+
+        :return The snapshot file path
+        """
+        return self.get_config_path() + ".snapshot"
+
     def get_email_path(self, email_id):
         """
         Given an email id it returns its location
@@ -52,10 +161,112 @@ class DatabaseConfiguration:
         return os.path.join(self.email_dir, filename)
 
 
+def synchronized(method):
+    """
+    Decorates a method of Database that changes it. The method runs under the lock of the database, if it has one,
+    and counts as a new version of the database, so the next view is built again.
+
+    :param method: the method.
+    :return: the decorated method.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.lock is None:
+            self.version += 1
+            return method(self, *args, **kwargs)
+        with self.lock:
+            self.version += 1
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class DatabaseView:
+    """
+    Read-only view of the emails and folders of a database as they were at a given version. Views are immutable,
+    the emails are kept in tuples, so they can be read while other threads change the database. The emails
+    themselves are shared with the database.
+    """
+
+    __slots__ = ("version", "emails", "folders", "email_index")
+
+    def __init__(self, version, emails, folders):
+        """
+        :param version: version of the database.
+        :param emails: tuple of the emails of the database, in database order.
+        :param folders: dictionary from folder name to the tuple of its emails, in folder order.
+        """
+        self.version = version
+        self.emails = emails
+        self.folders = folders
+        self.email_index = None
+
+    def get_email(self, email_id):
+        """
+        Returns the email with the given id. The index of the ids is built the first time it is needed.
+
+        :param email_id:
+        :return: the email, or None if it was not in the database.
+        """
+        if self.email_index is None:
+            self.email_index = {email.id: email for email in self.emails}
+        return self.email_index.get(email_id)
+
+    def get_emails(self, folder_name=None):
+        """
+        Returns the emails of a folder, or of the whole database. If the folder is not found it raises a
+        MailManagerException.
+
+        :param folder_name:
+        :return: a tuple of emails.
+        """
+        if folder_name is None:
+            return self.emails
+        if folder_name not in self.folders:
+            raise MailManagerException("There is not folder in the Database with that name")
+        return self.folders[folder_name]
+
+    def get_email_ids(self, folder_name=None):
+        """
+        Returns the ids of the emails of a folder, or of the whole database. If the folder is not found it raises a
+        MailManagerException.
+
+        :param folder_name:
+        :return: a list of email ids.
+        """
+        return [email.id for email in self.get_emails(folder_name)]
+
+    def get_folder_names(self):
+        """
+        :return: a list of folder names.
+        """
+        return list(self.folders)
+
+    def search(self, text):
+        """
+        Searches the text in every email of the view, see Database.contains_text.
+
+        :param text: the text to be searched
+        :return: the linked list of emails containing that text.
+        """
+        founds = LinkedList()
+        for email in self.emails:
+            if Database.contains_text(email, text):
+                founds.append(email)
+        return founds
+
+    def __len__(self):
+        return len(self.emails)
+
+
 class Database:
     """
     This class is the one in charge of managing the different operations of the database like
     adding and removing emails and folders
+
+    If the configuration makes it thread safe, every method that changes the database holds its lock, so changes
+    are made one at a time. Readers don't walk the linked lists, which change under them: searches take the
+    candidates of the indexes under the lock and check them outside of it, and the emails and folders are read
+    from a view (see view). Other reads, like the ones of the indexes, must hold the lock.
     """
 
     def __init__(self, db_config, seed):
@@ -67,10 +278,177 @@ class Database:
         """
 
         self.db_config = db_config
+        self.lock = threading.RLock() if db_config.thread_safe else None
+        self.version = 0
+        self._view = None
+        self.storage = open_storage(db_config)
+        self.journal = None
         self.email_id_seed = seed
         self.folders = {}
-        self.emails = LinkedList()
+        self.emails = IndexedLinkedList()
+        self.email_index = {}
+        self.email_ids = None
+        self.email_tuple = None
+        self.body_cache = None
+        if db_config.lazy_bodies and db_config.body_cache_size:
+            self.body_cache = BodyCache(db_config.body_cache_size)
+
+        self.indexes = []
+        self.body_pool = None
+        if db_config.deduplicate_bodies:
+            self.body_pool = BodyPool()
+            self.indexes.append(self.body_pool)
+        self.search_index = None
+        if db_config.search_index:
+            self.search_index = SearchIndex()
+            self.indexes.append(self.search_index)
+        self.trigram_index = None
+        if db_config.trigram_index:
+            self.trigram_index = TrigramIndex(db_config.trigram_memory_limit)
+            self.indexes.append(self.trigram_index)
+        self.metadata = None
+        if db_config.metadata_store:
+            self.metadata = MetadataStore()
+            self.indexes.append(self.metadata)
+        self.date_index = None
+        if db_config.date_index:
+            self.date_index = DateIndex()
+            self.indexes.append(self.date_index)
+        self.sender_index = None
+        self.receiver_index = None
+        if db_config.address_index:
+            self.sender_index = AddressIndex("sender")
+            self.receiver_index = AddressIndex("receiver")
+            self.indexes.extend((self.sender_index, self.receiver_index))
+        self.parallel = None
+        if db_config.search_workers:
+            from .parallel import ParallelSearch
+            self.parallel = ParallelSearch(db_config.search_workers)
+
+    @property
+    def email_id_seed(self):
+        """
+        Seed used for email id generation.
+        """
+        return self._email_id_seed
+
+    @email_id_seed.setter
+    @synchronized
+    def email_id_seed(self, seed):
+        self._email_id_seed = seed
+        self.log("seed", seed)
+
+    def locked(self):
+        """
+        Returns the lock of the database, to hold it in a with block, or a context that does nothing if the database
+        is not thread safe.
+        """
+        return self.lock if self.lock is not None else nullcontext()
+
+    def view(self):
+        """
+        Returns a DatabaseView with the current emails and folders. The view is kept until the database changes, and
+        the folders that have not changed since the previous view share their tuple of emails with it, so only the
+        folders that changed are copied.
+
+        :return: the view.
+        """
+        view = self._view
+        if view is not None and view.version == self.version:
+            return view
+        with self.locked():
+            return self._current_view()
+
+    def _current_view(self):
+        # The lock must be held
+        if self._view is None or self._view.version != self.version:
+            # The tuple of emails is kept until emails are added or removed, so the views share it meanwhile
+            if self.email_tuple is None:
+                self.email_tuple = tuple(self.email_index.values())
+            self._view = DatabaseView(self.version, self.email_tuple,
+                                      {name: folder.get_emails() for name, folder in self.folders.items()})
+        return self._view
+
+    def log(self, operation, *args):
+        """
+        Records a change in the journal of the database, if it has one. When the journal grows past the threshold
+        of the configuration it is folded into a new configuration file.
+
+        :param operation: name of the operation.
+        :param args: arguments of the operation.
+        """
+        if self.journal is None:
+            return
+        self.journal.append(operation, *args)
+        if self.journal.entries >= self.db_config.journal_compact_threshold:
+            self.checkpoint()
+
+    @synchronized
+    def commit(self):
+        """
+        Makes sure every change recorded in the journal is stored on disk.
+        """
+        if self.journal is not None:
+            self.journal.commit()
+
+    @synchronized
+    def close(self):
+        """
+        Syncs and closes the journal of the database, if it has one, and the storage of its emails. The workers of
+        the parallel search are stopped.
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.storage.close()
+        if self.parallel is not None:
+            self.parallel.close()
+
+    @synchronized
+    def compact_storage(self):
+        """
+        Reclaims the space taken by the deleted and replaced emails in the storage of the database.
+        """
+        self.storage.compact()
+
+    def stats(self):
+        """
+        Returns statistics of the database, mainly how much the deduplication of the bodies saves.
 
+        On disk, the emails whose body is stored apart are counted by reference: every email that refers to an
+        already referenced body is a hit, and saves the stored size of that body.
+
+        :return: a dictionary with the number of emails and folders, the 'memory' stats of the body pool (None if
+         bodies are not deduplicated), the 'disk' stats of the stored bodies, and the stats of the storage.
+        """
+        with self.locked():
+            counts = Counter(email.body_ref for email in self.emails if email.body_ref is not None)
+            emails = len(self.emails)
+            storage = self.storage.stats()
+        references = sum(counts.values())
+        saved = sum((count - 1) * (self.storage.body_size(reference) or 0) for reference, count in counts.items())
+        return {
+            "emails": emails,
+            "folders": len(self.folders),
+            "memory": self.body_pool.stats() if self.body_pool is not None else None,
+            "disk": {
+                "bodies": len(counts),
+                "references": references,
+                "hit_rate": (references - len(counts)) / references if references else 0.0,
+                "saved_bytes": saved,
+            },
+            "storage": storage,
+        }
+
+    @synchronized
+    def checkpoint(self):
+        """
+        Writes the configuration file with the current state of the database and empties the journal.
+        """
+        from .utils import write_database
+        write_database(self)
+
+    @synchronized
     def add_email(self, email, folder_name=None):
         """
         Add the given email to the database and to the specified folder. If the folder is not found in the Database
@@ -86,12 +464,21 @@ class Database:
         if not folder_name in self.folders:
             raise MailManagerException("The folder \'" + folder_name + "\' does not exist")
 
-        if email.id not in self.get_email_ids():
+        if email.id not in self.email_index:
             self.emails.append(email)
-        if email.id not in self.get_email_ids(folder_name):
-            self.folders[folder_name].append(email)
-        self.get_email(email.id).references += 1
-
+            self.email_index[email.id] = email
+            self.email_ids = None
+            self.email_tuple = None
+            for index in self.indexes:
+                index.add_email(email)
+        email = self.email_index[email.id]
+        if self.folders[folder_name].append(email):
+            email.folders.add(folder_name)
+            for index in self.indexes:
+                index.add_to_folder(folder_name, email)
+        self.log("add_email", email.id, folder_name)
+
+    @synchronized
     def remove_email(self, email, folder_name=None):
         """
          Remove given email from the given folder. If the folder is not found in the Database
@@ -105,25 +492,231 @@ class Database:
         """
 
         if not folder_name:
-            try:
-                for folder in self.folders:
-                    current = self.folders[folder].first
-                    while current is not None:
-                        if current.data.id == email.id:
-                            self.folders[folder].remove(email)
-                            break
-                        current = current.next
-                self.emails.remove(email)
-
-            except:
+            if email.id not in self.email_index:
                 raise MailManagerException("There is no email with that id")
+            email = self.email_index[email.id]
+            for name in email.folders:
+                self.folders[name].remove(email)
+                for index in self.indexes:
+                    index.remove_from_folder(name, email)
+            email.folders.clear()
+            del self.email_index[email.id]
+            self.emails.remove(email)
+            self.email_ids = None
+            self.email_tuple = None
+            for index in self.indexes:
+                index.remove_email(email)
         else:
             if not folder_name in self.folders:
                 raise MailManagerException("The folder \'" + folder_name + "\' does not exist")
+            if email.id not in self.folders[folder_name]:
+                raise MailManagerException("The email is not in the folder \'" + folder_name + "\'")
+            email = self.email_index[email.id]
             self.folders[folder_name].remove(email)
+            email.folders.discard(folder_name)
+            for index in self.indexes:
+                index.remove_from_folder(folder_name, email)
+
+        self.log("remove_email", email.id, folder_name or None)
+        return email.references
+
+    @synchronized
+    def move_email(self, email, source_folder, target_folder):
+        """
+        Moves the given email from one folder to another. If any of the folders is not found in the Database, or the
+        email is not in the source folder, it raises a MailManagerException.
+
+        :param email: The email to be moved.
+        :param source_folder: The name of the folder that contains the email.
+        :param target_folder: The name of the folder where the email is moved.
+        """
+        if not target_folder in self.folders:
+            raise MailManagerException("The folder \'" + target_folder + "\' does not exist")
+        self.remove_email(email, source_folder)
+        self.add_email(email, target_folder)
+
+    @synchronized
+    def add_emails(self, emails, folder_name=None):
+        """
+        Adds several emails to the database and to the specified folder in a single pass. The indexes are updated
+        once for the whole batch, and the batch is recorded as a single journal entry.
+
+        If the folder is not found in the Database it raises a MailManagerException before adding anything. Errors
+        of single emails don't stop the batch, they are returned as the result of that email.
+
+        :param emails: iterable of emails, or of ids of emails already in the database.
+        :param folder_name: Name of the folder to which the emails are added. If not provided, defaults to outbox
+         folder.
+        :return: a list with the result of every email, in the same order: True if it has been added to the
+         folder, False if it was already there (or repeated in the batch), or a MailManagerException.
+        """
+        if not folder_name:
+            folder_name = "OutBox"
+        if not folder_name in self.folders:
+            raise MailManagerException("The folder \'" + folder_name + "\' does not exist")
+        folder = self.folders[folder_name]
+
+        results = []
+        new = []
+        added = []
+        for email in emails:
+            email = self._resolve(email, new_allowed=True)
+            if isinstance(email, MailManagerException):
+                results.append(email)
+                continue
+            if email.id not in self.email_index:
+                self.emails.append(email)
+                self.email_index[email.id] = email
+                new.append(email)
+            if folder.append(email):
+                email.folders.add(folder_name)
+                added.append(email)
+                results.append(True)
+            else:
+                results.append(False)
+
+        if new:
+            self.email_ids = None
+            self.email_tuple = None
+        for index in self.indexes:
+            index.add_emails(new)
+            index.add_emails_to_folder(folder_name, added)
+        if added:
+            self.log("add_emails", folder_name, [email.id for email in added])
+        return results
+
+    @synchronized
+    def remove_emails(self, emails, folder_name=None):
+        """
+         Removes several emails from the given folder, or completely from the database if no folder is provided,
+         in a single pass. The indexes are updated once for the whole batch, and the batch is recorded as a single
+         journal entry.
+
+        If the folder is not found in the Database it raises a MailManagerException before removing anything.
+        Errors of single emails, like an email that is not in the folder, don't stop the batch, they are returned
+        as the result of that email.
+
+        :param emails: iterable of emails or email ids.
+        :param folder_name: The name of the folder from which the emails should be removed. If no folder name is
+         provided, the emails are removed from all the folders and from the database.
+        :return: a list with the result of every email, in the same order: the number of folders still
+         referencing the email, or a MailManagerException. An email repeated in the batch gets the result of its
+         first occurrence.
+        """
+        if folder_name and not folder_name in self.folders:
+            raise MailManagerException("The folder \'" + folder_name + "\' does not exist")
 
-        self.get_email(email.id).references -= 1
+        results = []
+        seen = {}
+        removed = []
+        from_folders = {}
+        for email in emails:
+            email_id = email.id if isinstance(email, Email) else email
+            if email_id in seen:
+                results.append(results[seen[email_id]])
+                continue
+            seen[email_id] = len(results)
+            email = self._resolve(email)
+            if isinstance(email, MailManagerException):
+                results.append(email)
+            elif folder_name:
+                if email.id not in self.folders[folder_name]:
+                    results.append(MailManagerException("The email is not in the folder \'" + folder_name + "\'"))
+                    continue
+                self.folders[folder_name].remove(email)
+                email.folders.discard(folder_name)
+                from_folders.setdefault(folder_name, []).append(email)
+                removed.append(email)
+                results.append(email.references)
+            else:
+                for name in email.folders:
+                    self.folders[name].remove(email)
+                    from_folders.setdefault(name, []).append(email)
+                email.folders.clear()
+                del self.email_index[email.id]
+                self.emails.remove(email)
+                removed.append(email)
+                results.append(0)
+
+        if removed and not folder_name:
+            self.email_ids = None
+            self.email_tuple = None
+        for index in self.indexes:
+            for name, folder_emails in from_folders.items():
+                index.remove_emails_from_folder(name, folder_emails)
+            if not folder_name:
+                index.remove_emails(removed)
+        if removed:
+            self.log("remove_emails", folder_name or None, [email.id for email in removed])
+        return results
+
+    @synchronized
+    def move_emails(self, emails, source_folder, target_folder):
+        """
+        Moves several emails from one folder to another in a single pass. The indexes are updated once for the
+        whole batch, and the batch is recorded as a single journal entry.
+
+        If any of the folders is not found in the Database it raises a MailManagerException before moving anything.
+        Errors of single emails, like an email that is not in the source folder, don't stop the batch, they are
+        returned as the result of that email.
+
+        :param emails: iterable of emails or email ids.
+        :param source_folder: The name of the folder that contains the emails.
+        :param target_folder: The name of the folder where the emails are moved.
+        :return: a list with the result of every email, in the same order: True if it has been moved, or a
+         MailManagerException. An email repeated in the batch gets the result of its first occurrence.
+        """
+        for folder_name in (source_folder, target_folder):
+            if not folder_name in self.folders:
+                raise MailManagerException("The folder \'" + folder_name + "\' does not exist")
+        source, target = self.folders[source_folder], self.folders[target_folder]
+
+        results = []
+        seen = {}
+        moved = []
+        added = []
+        for email in emails:
+            email_id = email.id if isinstance(email, Email) else email
+            if email_id in seen:
+                results.append(results[seen[email_id]])
+                continue
+            seen[email_id] = len(results)
+            email = self._resolve(email)
+            if isinstance(email, MailManagerException):
+                results.append(email)
+                continue
+            if email.id not in source:
+                results.append(MailManagerException("The email is not in the folder \'" + source_folder + "\'"))
+                continue
+            source.remove(email)
+            email.folders.discard(source_folder)
+            moved.append(email)
+            if target.append(email):
+                email.folders.add(target_folder)
+                added.append(email)
+            results.append(True)
+
+        for index in self.indexes:
+            index.remove_emails_from_folder(source_folder, moved)
+            index.add_emails_to_folder(target_folder, added)
+        if moved:
+            self.log("move_emails", source_folder, target_folder, [email.id for email in moved])
+        return results
+
+    def _resolve(self, email, new_allowed=False):
+        """
+        Returns the email of the database with the id of the given email or id. Used by the batch operations.
 
+        :param email: an email or an email id.
+        :param new_allowed: if True, an email that is not in the database is returned as it is.
+        :return: the email, or a MailManagerException if there is no such email.
+        """
+        if isinstance(email, Email):
+            if new_allowed or email.id in self.email_index:
+                return self.email_index.get(email.id, email)
+        elif email in self.email_index:
+            return self.email_index[email]
+        return MailManagerException("There is no email with the id \'" + str(getattr(email, "id", email)) + "\'")
 
     def get_email(self, email_id):
         """
@@ -132,42 +725,39 @@ class Database:
         :param email_id:
         :return: If email id is found in the database it returns it. If it is not found it returns None.
         """
-        current = self.emails.first
-        while current is not None:
-            if current.data.id == email_id:
-                return current.data
-            current = current.next
-        return None
+        return self.email_index.get(email_id)
+
+    def has_email(self, email_id):
+        """
+        Checks if an email with the given id is stored in the database.
+
+        :param email_id:
+        :return: True if the email is in the database, False otherwise.
+        """
+        return email_id in self.email_index
 
     def get_email_ids(self, folder_name=None):
         """
         Get email ids from a given folder. If the folder is not found in the Database
         it should raise a MailManagerException.
 
+        The returned list is cached until the database (or the folder) changes, so it must not be modified.
+
         :param folder_name:
         :return: Returns the list of email ids of a given folder. If the folder_name parameter is not passed
          it returns the list of emails of the database.
         """
-        emails = []
-        current = None
-        try:
+        with self.locked():
             if folder_name is None:
-                current = self.emails.first
-            elif len(self.folders[folder_name]) > 0:
-                current = self.folders[folder_name].first
-            else:
-                emails = []
-        except:
-            raise MailManagerException("There is not folder in the Database with that name")
-        finally:
-            while current is not None:
-                email = current.data.id
-                if email not in emails:
-                    emails.append(email)
-                current = current.next
-        return emails
+                if self.email_ids is None:
+                    self.email_ids = list(self.email_index)
+                return self.email_ids
+            if folder_name not in self.folders:
+                raise MailManagerException("There is not folder in the Database with that name")
+            return self.folders[folder_name].get_email_ids()
 
 
+    @synchronized
     def create_folder(self, folder_name):
         """
         Adds a folder to the database
@@ -177,10 +767,14 @@ class Database:
 
         folder = Folder(folder_name)
 
-        self.folders[folder.name] = folder.emails
+        self.folders[folder.name] = folder
+        for index in self.indexes:
+            index.create_folder(folder_name)
+        self.log("create_folder", folder_name)
 
         return folder_name
 
+    @synchronized
     def remove_folder(self, folder_name):
         """
         Remove given folder from database. If the folder is not found in the Database
@@ -189,42 +783,160 @@ class Database:
 
         :param folder_name: the name of the folder to be removed
         """
-        try:
-            current = self.folders[folder_name].first
-            while current is not None:
-                self.get_email(current.data.id).references -= 1
-                if current.data.references == 0:
-                    self.emails.remove(self.get_email(current.data.id))
-
-                current = current.next
-            self.folders.pop(folder_name)
-        except:
+        if folder_name not in self.folders:
             raise MailManagerException("Folder does not exist!")
 
+        for index in self.indexes:
+            index.remove_folder(folder_name)
+        for email in self.folders[folder_name].emails:
+            email.folders.discard(folder_name)
+            if not email.folders:
+                self.emails.remove(email)
+                del self.email_index[email.id]
+                self.email_ids = None
+                self.email_tuple = None
+                for index in self.indexes:
+                    index.remove_email(email)
+        self.folders.pop(folder_name)
+        self.log("remove_folder", folder_name)
+
     def search(self, text):
         """
         Searches the text into the titles and bodies of the emails, returning the emails that contains said text.
 
+        If the database has indexes, they are used to narrow the emails that may contain the text, and only
+        those candidates are checked. Otherwise every email is checked, on the worker processes of the parallel
+        search if the configuration sets search_workers. In a thread safe database only the candidates are taken
+        under the lock, the emails are checked outside of it.
+
         :param text: the text to be searched
         :return: the linked list of emails containing that text.
         """
 
+        with self.locked():
+            emails = self._scanned_emails()
+            candidates = emails
+            for index in self.indexes:
+                found = index.candidates(text)
+                if found is not None and len(found) < len(candidates):
+                    candidates = found
+
+        matches = None
+        if candidates is emails and self.parallel is not None:
+            matches = self.parallel.scan(emails, text, False, self._shared_locks())
+        if matches is None:
+            matches = (email for email in candidates if Database.contains_text(email, text))
+
         founds = LinkedList()
-        if len(self.emails) > 0:
-            current = self.emails.first
-            while current is not None:
-                if current.data.subject.find(text) > -1 or current.data.sender.find(text) > -1 or current.data.body.find(text) > -1 or current.data.receiver.find(text) > -1:
-                    founds.append(current.data)
-                current = current.next
+        for email in matches:
+            founds.append(email)
 
         return founds
 
+    def search_words(self, text):
+        """
+        Searches the emails that contain every word of the text as a whole word, in any order and in any field,
+        with the search index. It raises a MailManagerException if the database has no search index.
+
+        :param text: the words to be searched.
+        :return: the linked list of emails containing the words, in database order.
+        """
+        if self.search_index is None:
+            raise MailManagerException("The database has no search index")
+        with self.locked():
+            matches = self.search_index.search_terms(text)
+        founds = LinkedList()
+        for email in matches:
+            founds.append(email)
+        return founds
+
+    def search_phrase(self, phrase):
+        """
+        Searches the emails that contain the words of the phrase consecutively in the same field, with the search
+        index. It raises a MailManagerException if the database has no search index.
+
+        :param phrase: the phrase to be searched.
+        :return: the linked list of emails containing the phrase, in database order.
+        """
+        if self.search_index is None:
+            raise MailManagerException("The database has no search index")
+        with self.locked():
+            matches = self.search_index.search_phrase(phrase)
+        founds = LinkedList()
+        for email in matches:
+            founds.append(email)
+        return founds
+
+    def query(self, text):
+        """
+        Searches the emails matching a query with the syntax of parse_query, like
+        'from:bank@bank.bank.com AND subject:invoice'.
+
+        The indexes of the database are used to find the emails that may match each term, and those candidates are
+        combined following the AND and OR operators. Only the emails left are checked against the query, or every
+        email if some term can't be narrowed.
+
+        :param text: the query.
+        :return: the linked list of emails matching the query, in database order.
+        """
+        query = parse_query(text)
+        with self.locked():
+            candidates = query.plan(self)
+            if candidates is None:
+                candidates = self._scanned_emails()
+            else:
+                candidates = sorted(candidates.values(), key=lambda email: self.emails.get_position(
+                    self.emails.get_node(email)))
+
+        matches = None
+        if isinstance(candidates, tuple) and self.parallel is not None:
+            matches = self.parallel.scan(candidates, text, True, self._shared_locks())
+        if matches is None:
+            matches = (email for email in candidates if query.matches(email))
+
+        founds = LinkedList()
+        for email in matches:
+            founds.append(email)
+
+        return founds
+
+    def _scanned_emails(self):
+        # The emails scanned when no index narrows a search. The lock must be held. Other threads and the workers
+        # of the parallel search need the immutable tuple of a view, a single thread can walk the list itself
+        if self.lock is None and self.parallel is None:
+            return self.emails
+        return self._current_view().emails
+
+    def _shared_locks(self):
+        # Objects with locks used to read lazy bodies, which the forked workers of the parallel search share
+        owners = list(getattr(self.storage, "segments", {}).values())
+        if hasattr(self.storage, "lock"):
+            owners.append(self.storage)
+        if self.body_cache is not None:
+            owners.append(self.body_cache)
+        return owners
+
+    @staticmethod
+    def contains_text(email, text):
+        """
+        Checks if the text appears in the subject, the sender, the body or the receiver of the email.
+
+        :param email: email to be checked.
+        :param text: the text to be searched.
+        :return: True if the email contains the text, False otherwise.
+        """
+        for field in (email.subject, email.sender, email.body, email.receiver):
+            if field is not None and field.find(text) > -1:
+                return True
+        return False
+
     def get_folder_names(self):
         """
         Returns a list with the folder names stored in the database.
         :return: a list of folder names.
         """
-        list = []
-        for name in self.folders:
-            list.append(name)
-        return list
+        with self.locked():
+            list = []
+            for name in self.folders:
+                list.append(name)
+            return list
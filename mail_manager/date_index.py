@@ -0,0 +1,208 @@
+from bisect import bisect_left, insort
+from itertools import islice
+
+from .exceptions import MailManagerException
+from .index import Index
+
+
+class SortedList:
+    """
+    Sorted list split in blocks of at most 2 * block_size items, with the last item of every block kept in a
+    separate list. Finding a position is a binary search over the block maxima followed by another one inside a
+    block, so adding and removing items only moves the items of one block.
+    """
+
+    block_size = 512
+
+    def __init__(self):
+        """
+        Initializes an empty list.
+        """
+        self.blocks = []
+        self.maxes = []
+        self.size = 0
+
+    def add(self, item):
+        """
+        Inserts an item keeping the list sorted.
+
+        :param item: item to insert.
+        """
+        if not self.blocks:
+            self.blocks.append([item])
+            self.maxes.append(item)
+        else:
+            position = bisect_left(self.maxes, item)
+            if position == len(self.maxes):
+                position -= 1
+                self.blocks[position].append(item)
+                self.maxes[position] = item
+            else:
+                insort(self.blocks[position], item)
+            block = self.blocks[position]
+            if len(block) > 2 * self.block_size:
+                half = block[self.block_size:]
+                del block[self.block_size:]
+                self.maxes[position] = block[-1]
+                self.blocks.insert(position + 1, half)
+                self.maxes.insert(position + 1, half[-1])
+        self.size += 1
+
+    def remove(self, item):
+        """
+        Removes an item from the list.
+
+        :param item: item to remove.
+        """
+        position = bisect_left(self.maxes, item)
+        if position == len(self.maxes):
+            raise ValueError("The item is not in the list")
+        block = self.blocks[position]
+        i = bisect_left(block, item)
+        if block[i] != item:
+            raise ValueError("The item is not in the list")
+        del block[i]
+        self.size -= 1
+        if not block:
+            del self.blocks[position]
+            del self.maxes[position]
+        elif i == len(block):
+            self.maxes[position] = block[-1]
+
+    def irange(self, start, end):
+        """
+        Iterates over the items that are greater or equal than start and lower than end, in order.
+
+        :param start: lower bound of the range.
+        :param end: upper bound of the range (not included).
+        """
+        position = bisect_left(self.maxes, start)
+        if position == len(self.maxes):
+            return
+        i = bisect_left(self.blocks[position], start)
+        for block in islice(self.blocks, position, None):
+            for item in islice(block, i, None):
+                if item >= end:
+                    return
+                yield item
+            i = 0
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __reversed__(self):
+        for block in reversed(self.blocks):
+            yield from reversed(block)
+
+    def __len__(self):
+        return self.size
+
+
+class DateIndex(Index):
+    """
+    Index of the emails sorted by date, for the whole database and for every folder.
+
+    The entries are (timestamp, sequence, email) tuples, where the sequence is the order in which the emails were
+    added, so emails with the same date keep the database order. Emails whose date can't be parsed are not part of
+    the sorted lists; they are kept apart in database order and go after the dated ones when listing.
+
+    Every query does a binary search to find where it starts and then walks the k emails it returns, so it takes
+    O(log n + k).
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty index.
+        """
+        self.keys = {}
+        self.sequence = 0
+        self.dated = SortedList()
+        self.undated = {}
+        self.folders = {}
+
+    def add_email(self, email):
+        if email.id in self.keys:
+            return
+        key = (email.timestamp, self.sequence)
+        self.sequence += 1
+        self.keys[email.id] = key
+        self._add(self.dated, self.undated, key, email)
+
+    def remove_email(self, email):
+        key = self.keys.pop(email.id, None)
+        if key is not None:
+            self._remove(self.dated, self.undated, key, email)
+
+    def create_folder(self, folder_name):
+        self.folders[folder_name] = (SortedList(), {})
+
+    def remove_folder(self, folder_name):
+        self.folders.pop(folder_name, None)
+
+    def add_to_folder(self, folder_name, email):
+        dated, undated = self.folders.setdefault(folder_name, (SortedList(), {}))
+        self._add(dated, undated, self.keys[email.id], email)
+
+    def remove_from_folder(self, folder_name, email):
+        key = self.keys.get(email.id)
+        if key is not None and folder_name in self.folders:
+            dated, undated = self.folders[folder_name]
+            self._remove(dated, undated, key, email)
+
+    def newest(self, n, folder_name=None):
+        """
+        Returns the newest emails, newest first. Emails whose date can't be parsed are never returned.
+
+        :param n: maximum number of emails to return.
+        :param folder_name: if provided, only the emails of that folder are considered.
+        :return: a list of emails.
+        """
+        dated, undated = self._lists(folder_name)
+        return [entry[2] for entry in islice(reversed(dated), n)]
+
+    def between(self, start, end, folder_name=None):
+        """
+        Returns the emails whose date is in the given range, oldest first. Emails whose date can't be parsed are
+        never returned.
+
+        :param start: first timestamp of the range.
+        :param end: timestamp where the range ends (not included).
+        :param folder_name: if provided, only the emails of that folder are considered.
+        :return: a list of emails.
+        """
+        dated, undated = self._lists(folder_name)
+        return [entry[2] for entry in dated.irange((start, -1), (end, -1))]
+
+    def sorted_emails(self, folder_name=None, newest_first=False):
+        """
+        Iterates over the emails sorted by date. Emails whose date can't be parsed go at the end, in database order.
+
+        :param folder_name: if provided, only the emails of that folder are listed.
+        :param newest_first: if True the newest emails go first.
+        """
+        dated, undated = self._lists(folder_name)
+        for entry in reversed(dated) if newest_first else dated:
+            yield entry[2]
+        yield from undated.values()
+
+    def _lists(self, folder_name):
+        if folder_name is None:
+            return self.dated, self.undated
+        if folder_name not in self.folders:
+            raise MailManagerException("There is not folder in the Database with that name")
+        return self.folders[folder_name]
+
+    @staticmethod
+    def _add(dated, undated, key, email):
+        if key[0] is None:
+            undated[key[1]] = email
+        else:
+            dated.add((key[0], key[1], email))
+
+    @staticmethod
+    def _remove(dated, undated, key, email):
+        if key[0] is None:
+            undated.pop(key[1], None)
+        else:
+            dated.remove((key[0], key[1], email))
@@ -1,15 +1,153 @@
 
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import mktime_tz, parsedate_tz
+
+from .compression import decompress
+
+
+def parse_date(date):
+    """
+    Parses the date of an email into a POSIX timestamp. It accepts RFC 2822 dates, like
+    'Tue, 07 Feb 2017 21:32:46 +0100 (CET)', and ISO dates like '2018-10-29 22:48:33.828143', which are taken as UTC.
+
+    :param date: date string, it can be None.
+    :return: the timestamp in seconds, or None if the date can't be parsed.
+    """
+    if not date:
+        return None
+    parsed = parsedate_tz(date)
+    if parsed is not None:
+        try:
+            return float(mktime_tz(parsed))
+        except (OverflowError, ValueError):
+            return None
+    try:
+        parsed = datetime.fromisoformat(date.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def decode_body(data):
+    """
+    Decodes the raw bytes of an email body, translating the line endings as a file opened in text mode would.
+
+    :param data: raw bytes of the body, as bytes or as any object supporting the buffer protocol.
+    :return: the body text, or None if the body is empty.
+    """
+    if not data:
+        return None
+    return str(data, 'utf-8').replace('\r\n', '\n')
+
+
+ENCODING_HEADER = "X-Body-Encoding: "
+
+REFERENCE_HEADER = "X-Body-Ref: "
+
+
+def parse_headers(lines, email):
+    """
+    Parses the headers of an email file, up to the blank line that separates them from the body.
+
+    Senders and receivers are interned, so every email from the same address shares the same string. If the body
+    is compressed, its encoding is kept in the body_encoding attribute of the email, and if it is stored apart, the
+    reference to it is kept in the body_ref attribute.
+
+    :param lines: iterable of the raw lines of the file, as bytes.
+    :param email: email where the headers are stored.
+    :return: the number of bytes of the headers, that is, the offset where the body starts.
+    """
+    offset = 0
+    for raw_line in lines:
+        offset += len(raw_line)
+        line = raw_line.decode().replace('\r\n', '\n')
+        if line.startswith('Date: '):
+            email.date = line[6:len(line)].strip('\n')
+        elif line.startswith('From: '):
+            email.sender = sys.intern(line[6:len(line)].strip('\n'))
+        elif line.startswith('To: '):
+            email.receiver = sys.intern(line[4:len(line)].strip('\n'))
+        elif line.startswith('Subject: '):
+            email.subject = line[9:len(line)].strip('\n')
+        elif line.startswith(ENCODING_HEADER):
+            email.body_encoding = sys.intern(line[len(ENCODING_HEADER):].strip('\n'))
+        elif line.startswith(REFERENCE_HEADER):
+            email.body_ref = sys.intern(line[len(REFERENCE_HEADER):].strip('\n'))
+        elif line.startswith('\n'):
+            break
+    return offset
+
+
+class BodyCache:
+    """
+    Bounded cache of email bodies that discards the least recently used body when it is full. It can be used by
+    several threads at the same time.
+    """
+
+    __slots__ = ("capacity", "bodies", "lock")
+
+    def __init__(self, capacity):
+        """
+        Initializes an empty cache.
+
+        :param capacity: Maximum number of bodies kept in the cache.
+        """
+        self.capacity = capacity
+        self.bodies = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.bodies
+
+    def get(self, key):
+        """
+        Returns the cached body and marks it as the most recently used one.
+
+        :param key: key of the body.
+        :return: the body, or None if it is not cached.
+        """
+        with self.lock:
+            if key not in self.bodies:
+                return None
+            self.bodies.move_to_end(key)
+            return self.bodies[key]
+
+    def put(self, key, body):
+        """
+        Stores a body in the cache, discarding the least recently used one if the cache is full.
+
+        :param key: key of the body.
+        :param body: body to be stored.
+        """
+        with self.lock:
+            self.bodies[key] = body
+            self.bodies.move_to_end(key)
+            if len(self.bodies) > self.capacity:
+                self.bodies.popitem(last=False)
+
+
 class Email:
     """
     The email class contains all the information related to an email like the subject, the sender, etc.
     """
 
-    template = """Date: {0.date}
+    __slots__ = ("id", "sender", "receiver", "subject", "_date", "timestamp", "_body", "body_path", "body_offset",
+                 "body_encoding", "body_ref", "body_cache", "folders")
+
+    header_template = """Date: {0.date}
 From: {0.sender}
 To: {0.receiver}
 Message-ID: {0.id}
 Subject: {0.subject}
+"""
 
+    template = header_template + """
 {0.body}"""
 
     def __init__(self, email_id=None, sender=None, receiver=None, subject=None, date=None, body=None):
@@ -30,11 +168,109 @@ Subject: {0.subject}
         self.subject = subject
         self.date = date
         self.body = body
-        self.references = 0
+        self.folders = set()
+
+    @property
+    def references(self):
+        """
+        Number of folders that contain the email.
+        """
+        return len(self.folders)
+
+    @property
+    def date(self):
+        """
+        Date of creation of the email, as it is written in the email file. It is parsed when it is set, and the
+        result is kept in the timestamp attribute (None if the date can't be parsed).
+        """
+        return self._date
+
+    @date.setter
+    def date(self, date):
+        self._date = date
+        self.timestamp = parse_date(date)
+
+    @property
+    def body(self):
+        """
+        Body content of the email. If the email was loaded without its body, the body is read from the email file
+        (or from its storage) the first time it is needed. Then it is kept in the email, or in the body cache if the email has one.
+        Bodies stored apart are cached by their reference, so emails sharing a body share the cached copy too.
+        """
+        if self.body_path is None:
+            return self._body
+        if self.body_cache is None:
+            self._body = self.read_body()
+            self.body_path = None
+            return self._body
+
+        key = self.body_ref or (self.body_path, self.id)
+        body = self.body_cache.get(key)
+        if body is None:
+            body = self.read_body()
+            self.body_cache.put(key, body)
+        return body
+
+    @body.setter
+    def body(self, body):
+        self._body = body
+        self.body_path = None
+        self.body_offset = None
+        self.body_encoding = None
+        self.body_ref = None
+        self.body_cache = None
+
+    def share_body(self, body):
+        """
+        Replaces the loaded body of the email by an equal string, keeping where the body is stored. It lets emails
+        with identical bodies keep a single copy of them.
+
+        :param body: string equal to the body of the email.
+        """
+        self._body = body
+
+    def set_lazy_body(self, path, offset, body_cache=None):
+        """
+        Makes the body of the email to be read on demand from the given file. If the body is compressed, its
+        encoding must be set in body_encoding, and if it is stored apart, its reference in body_ref.
+
+        :param path: path of the file containing the body, or the storage that keeps the email.
+        :param offset: byte offset where the body starts in the file, or in the email if it is kept in a storage.
+        :param body_cache: optional BodyCache where the read bodies are kept instead of in the email.
+        """
+        self._body = None
+        self.body_path = path
+        self.body_offset = offset
+        self.body_cache = body_cache
+
+    def read_body(self):
+        """
+        Reads the body of the email from its file, or from the storage that keeps it.
+
+        :return: the body of the email.
+        """
+        body_path = self.body_path
+        if body_path is None:
+            # Another thread has read the body in the meantime
+            return self._body
+        if not isinstance(body_path, str):
+            data = body_path.read(self.id, self.body_offset)
+            directory = body_path.directory
+        else:
+            with open(body_path, 'rb') as f:
+                f.seek(self.body_offset)
+                data = f.read()
+            directory = os.path.dirname(body_path)
+        if self.body_encoding is not None:
+            data = decompress(data, self.body_encoding, directory)
+        return decode_body(data)
 
     def __eq__(self, other):
         return self.id == other.id
 
+    def __hash__(self):
+        return hash(self.id)
+
     def __str__(self):
         """
         This function is called when the menu wants to show the content of the email to the user.
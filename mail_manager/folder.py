@@ -1,4 +1,4 @@
-from .linked_list import LinkedList
+from .linked_list import IndexedLinkedList
 
 
 class Folder:
@@ -7,11 +7,80 @@ class Folder:
     Add as many methods as you consider.
     """
 
+    __slots__ = ("name", "emails", "email_index", "email_ids", "email_tuple")
+
     def __init__(self, name):
         """
         Initializes a folder assigning it a name.
 
+        Besides the linked list of emails, the folder keeps an index of the ids it contains (in insertion order)
+        so membership checks don't need to walk the list.
+
         :param name: Name of the folder
         """
         self.name = name
-        self.emails = LinkedList()
+        self.emails = IndexedLinkedList()
+        self.email_index = {}
+        self.email_ids = None
+        self.email_tuple = None
+
+    def append(self, email):
+        """
+        Adds the email to the end of the folder, unless the folder already contains it.
+
+        :param email: email to be added.
+        :return: True if the email has been added, False if it was already in the folder.
+        """
+        if email.id in self.email_index:
+            return False
+        self.emails.append(email)
+        self.email_index[email.id] = email
+        self.email_ids = None
+        self.email_tuple = None
+        return True
+
+    def remove(self, email):
+        """
+        Removes the email from the folder.
+
+        Raises ValueError if the folder does not contain the email.
+
+        :param email: email to be removed.
+        """
+        if email.id not in self.email_index:
+            raise ValueError("There is no such email in the folder")
+        self.emails.remove(email)
+        del self.email_index[email.id]
+        self.email_ids = None
+        self.email_tuple = None
+
+    def get_email_ids(self):
+        """
+        Returns the ids of the emails of the folder. The list is built once and cached until the folder changes,
+        so it must not be modified by the caller.
+
+        :return: the list of email ids of the folder.
+        """
+        if self.email_ids is None:
+            self.email_ids = list(self.email_index)
+        return self.email_ids
+
+    def get_emails(self):
+        """
+        Returns the emails of the folder as a tuple. The tuple is built once and cached until the folder changes,
+        so the views of the database share it while the folder doesn't change.
+
+        :return: the tuple of emails of the folder.
+        """
+        if self.email_tuple is None:
+            self.email_tuple = tuple(self.email_index.values())
+        return self.email_tuple
+
+    def __contains__(self, email_id):
+        return email_id in self.email_index
+
+    def __len__(self):
+        return len(self.email_index)
+
+    def __str__(self):
+        return str(self.emails)
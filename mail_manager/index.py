@@ -0,0 +1,100 @@
+class Index:
+    """
+    Base class of the indexes kept by a Database.
+
+    The database calls these methods every time its content changes, so the index can keep itself up to date.
+    Every method does nothing by default, so each index only overrides the changes it cares about. The batch
+    methods, called by the batch operations of the database, call the single ones for every email by default, so
+    an index only overrides them when it can do some work once per batch instead of once per email.
+    """
+
+    def add_email(self, email):
+        """
+        Called when an email is added to the database.
+
+        :param email: the new email.
+        """
+
+    def remove_email(self, email):
+        """
+        Called when an email is removed from the database.
+
+        :param email: the removed email.
+        """
+
+    def add_emails(self, emails):
+        """
+        Called when several emails are added to the database at once.
+
+        :param emails: list of new emails.
+        """
+        for email in emails:
+            self.add_email(email)
+
+    def remove_emails(self, emails):
+        """
+        Called when several emails are removed from the database at once.
+
+        :param emails: list of removed emails.
+        """
+        for email in emails:
+            self.remove_email(email)
+
+    def create_folder(self, folder_name):
+        """
+        Called when a folder is created.
+
+        :param folder_name: name of the new folder.
+        """
+
+    def remove_folder(self, folder_name):
+        """
+        Called when a folder is removed, before the emails that only belonged to it are removed.
+
+        :param folder_name: name of the removed folder.
+        """
+
+    def add_to_folder(self, folder_name, email):
+        """
+        Called when an email of the database is added to a folder.
+
+        :param folder_name: name of the folder.
+        :param email: the email.
+        """
+
+    def remove_from_folder(self, folder_name, email):
+        """
+        Called when an email is removed from a folder.
+
+        :param folder_name: name of the folder.
+        :param email: the email.
+        """
+
+    def add_emails_to_folder(self, folder_name, emails):
+        """
+        Called when several emails of the database are added to a folder at once.
+
+        :param folder_name: name of the folder.
+        :param emails: list of emails.
+        """
+        for email in emails:
+            self.add_to_folder(folder_name, email)
+
+    def remove_emails_from_folder(self, folder_name, emails):
+        """
+        Called when several emails are removed from a folder at once.
+
+        :param folder_name: name of the folder.
+        :param emails: list of emails.
+        """
+        for email in emails:
+            self.remove_from_folder(folder_name, email)
+
+    def candidates(self, text):
+        """
+        Returns the emails that may contain the text, used to narrow Database.search.
+
+        :param text: text to be searched.
+        :return: the list of candidate emails in database order, or None if the index cannot narrow the search.
+        """
+        return None
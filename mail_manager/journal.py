@@ -0,0 +1,93 @@
+import json
+import os
+
+
+class Journal:
+    """
+    Append-only journal of the changes done to a database since its configuration file was last written.
+
+    Every change is written as a small JSON list in its own line, for example ["add_email", "message1", "Inbox"].
+    Lines are flushed to the operating system as soon as they are written, but they are only synced to disk once
+    every few entries or when commit is called, so several changes share the cost of a single fsync.
+    """
+
+    def __init__(self, path, sync_every=32):
+        """
+        Initializes a journal stored in the given path. The file is not opened until open is called.
+
+        :param path: Path of the journal file.
+        :param sync_every: Number of entries written between two syncs to disk.
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.file = None
+        self.entries = 0
+        self.pending = 0
+
+    def read(self):
+        """
+        Reads the entries stored in the journal file. A truncated last line, left by a crash while it was being
+        written, is ignored.
+
+        :return: the list of entries, each one as a list with the operation name followed by its arguments.
+        """
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+        return entries
+
+    def open(self):
+        """
+        Opens the journal file to append new entries to it.
+        """
+        self.entries = len(self.read())
+        self.file = open(self.path, 'a')
+
+    def append(self, operation, *args):
+        """
+        Writes an entry to the journal.
+
+        :param operation: name of the operation, for example 'add_email'.
+        :param args: arguments of the operation.
+        """
+        self.file.write(json.dumps([operation] + list(args), separators=(',', ':')) + '\n')
+        self.file.flush()
+        self.entries += 1
+        self.pending += 1
+        if self.pending >= self.sync_every:
+            self.commit()
+
+    def commit(self):
+        """
+        Syncs the pending entries of the journal to disk.
+        """
+        if self.file is not None and self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+    def truncate(self):
+        """
+        Removes every entry of the journal. It should be called once the changes are stored in the configuration
+        file.
+        """
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.path, 'w')
+        self.entries = 0
+        self.pending = 0
+
+    def close(self):
+        """
+        Syncs the pending entries and closes the journal file.
+        """
+        if self.file is not None:
+            self.commit()
+            self.file.close()
+            self.file = None
@@ -3,6 +3,8 @@ class Node:
     The nodes are the separated objects that will conform the Linked List.
     """
 
+    __slots__ = ("next", "data")
+
     def __init__(self, data=None):
         """
         Initializes a node instance that will contain some data.
@@ -105,8 +107,11 @@ class LinkedList:
         current = self.first
 
         if self.size == 1:
+            if current.data != item:
+                raise ValueError("There is no such item")
             self.first = None
             self.last = None
+            self.size = 0
 
         else:
             previous = None
@@ -169,6 +174,7 @@ class LinkedList:
                 if current == self.last:
                     self.last = previous
 
+        self.size -= 1
         return current.data
 
     def clear(self):
@@ -229,6 +235,15 @@ class LinkedList:
         """
         return self.size
 
+    def __iter__(self):
+        """
+        Iterates over the items stored in the linked list, from the first to the last one.
+        """
+        current = self.first
+        while current is not None:
+            yield current.data
+            current = current.next
+
     def __str__(self):
         """
         Returns a string representation of the linked list.
@@ -242,3 +257,467 @@ class LinkedList:
 
             current = current.next
         return str_aux
+
+
+class DoubleNode(Node):
+    """
+    Node of a doubly linked list, that also keeps a pointer to the previous node.
+    """
+
+    __slots__ = ("prev",)
+
+    def __init__(self, data=None):
+        """
+        Initializes a node instance that will contain some data.
+
+        :param data: content of the node.
+        """
+        super().__init__(data)
+        self.prev = None
+
+
+class DoublyLinkedList(LinkedList):
+    """
+    This class implements a doubly linked list with the same interface as LinkedList.
+
+    Every node points to the previous and the next node, and the list keeps a map from each item to the nodes that
+    contain it. That way removing a known item, or popping from either end, doesn't need to walk the list.
+    Items must be hashable.
+    """
+
+    node_class = DoubleNode
+
+    def __init__(self):
+        """
+        Initializes an empty doubly linked list.
+        """
+        super().__init__()
+        self.nodes = {}
+
+    def append(self, item):
+        """
+        Add an item to the end of the list.
+        """
+        node = self.node_class(item)
+        self._link(node, self.last, None)
+        self.nodes.setdefault(item, []).append(node)
+
+    def insert(self, index, item):
+        """
+        Insert an item at a given position.
+
+        The first argument is the index of the element before which to insert, so a.insert(0, item) inserts
+        at the front of the list and a.insert(len(a), item) is equivalent to a.append(item).
+
+        :param index: index where the item should be stored.
+        :param item: object to be stored into the linked list.
+        """
+        if index > self.size or index < 0:
+            raise IndexError("Index is out of range")
+
+        if index == self.size:
+            self.append(item)
+            return
+
+        # Count the occurrences of the item before the index, so its nodes stay in list order
+        current = self.first
+        occurrences = 0
+        for _ in range(index):
+            if current.data == item:
+                occurrences += 1
+            current = current.next
+
+        node = self.node_class(item)
+        self._link(node, current.prev, current)
+        self.nodes.setdefault(item, []).insert(occurrences, node)
+
+    def remove(self, item):
+        """
+        Remove from the list the first occurrence of item.
+
+        Raises ValueError if there is no such item.
+
+        :param item: object to be removed from the linked list.
+        """
+        if not self.size:
+            raise IndexError("The list is empty")
+        nodes = self.nodes.get(item)
+        if not nodes:
+            raise ValueError("There is no such item")
+        return self.remove_node(nodes[0])
+
+    def remove_node(self, node):
+        """
+        Remove the given node from the list.
+
+        :param node: node of this list, as returned by get_node.
+        :return: the item stored in the node.
+        """
+        self._unlink(node)
+        nodes = self.nodes[node.data]
+        nodes.remove(node)
+        if not nodes:
+            del self.nodes[node.data]
+        return node.data
+
+    def get_node(self, item):
+        """
+        Returns the node of the first occurrence of item.
+
+        :param item: object to be searched in the linked list.
+        :return: the node containing the item, or None if the item is not in the list.
+        """
+        nodes = self.nodes.get(item)
+        return nodes[0] if nodes else None
+
+    def pop(self, index=-1):
+        """
+        Remove the item at the given position in the list, and return it.
+        If no index is specified, a.pop() removes and returns the last item in the list.
+
+        Raises IndexError if list is empty or index is out of range.
+
+        :param index: index where the item should be popped (removed and returned).
+        """
+        if not self.size:
+            raise IndexError("The list is empty")
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("Index is out of range")
+
+        if index < self.size // 2:
+            node = self.first
+            for _ in range(index):
+                node = node.next
+        else:
+            node = self.last
+            for _ in range(self.size - 1 - index):
+                node = node.prev
+        return self.remove_node(node)
+
+    def clear(self):
+        """
+        Remove all items from the list.
+        """
+        super().clear()
+        self.nodes = {}
+
+    def exist(self, item):
+        """
+        Return if the item is in the linked list or not.
+        :param item: object to be searched in the linked list.
+        :return: True if appears in the linked list, False otherwise
+        """
+        for node in self.nodes.get(item, ()):
+            if node.data is item:
+                return True
+        return False
+
+    def _link(self, node, previous, following):
+        node.prev = previous
+        node.next = following
+        if previous is None:
+            self.first = node
+        else:
+            previous.next = node
+        if following is None:
+            self.last = node
+        else:
+            following.prev = node
+        self.size += 1
+
+    def _unlink(self, node):
+        if node.prev is None:
+            self.first = node.next
+        else:
+            node.prev.next = node.next
+        if node.next is None:
+            self.last = node.prev
+        else:
+            node.next.prev = node.prev
+        node.prev = node.next = None
+        self.size -= 1
+
+
+class IndexedNode(DoubleNode):
+    """
+    Node of an indexed linked list, that also knows the block of the list it belongs to.
+    """
+
+    __slots__ = ("block",)
+
+    def __init__(self, data=None):
+        """
+        Initializes a node instance that will contain some data.
+
+        :param data: content of the node.
+        """
+        super().__init__(data)
+        self.block = None
+
+
+class Block:
+    """
+    Run of consecutive nodes of an indexed linked list.
+    """
+
+    __slots__ = ("first", "count", "position")
+
+    def __init__(self, first, count):
+        """
+        Initializes a block.
+
+        :param first: first node of the block.
+        :param count: number of nodes of the block.
+        """
+        self.first = first
+        self.count = count
+        self.position = 0
+
+
+class IndexedLinkedList(DoublyLinkedList):
+    """
+    This class implements a doubly linked list with positional access.
+
+    The nodes are grouped in blocks of consecutive nodes, and a Fenwick tree over the sizes of the blocks gives the
+    position where each block starts. Accessing or inserting at a position finds its block in O(log n) and then
+    walks at most one block, and the position of a known item is found the same way. The blocks are only built the
+    first time a position is needed, so a list that is never accessed by position costs the same as a
+    DoublyLinkedList.
+    """
+
+    node_class = IndexedNode
+    block_size = 256
+
+    def __init__(self):
+        """
+        Initializes an empty indexed linked list.
+        """
+        super().__init__()
+        self.blocks = None
+        self.tree = None
+
+    def insert(self, index, item):
+        """
+        Insert an item at a given position.
+
+        The first argument is the index of the element before which to insert, so a.insert(0, item) inserts
+        at the front of the list and a.insert(len(a), item) is equivalent to a.append(item).
+
+        :param index: index where the item should be stored.
+        :param item: object to be stored into the linked list.
+        """
+        if index > self.size or index < 0:
+            raise IndexError("Index is out of range")
+
+        if index == self.size:
+            self.append(item)
+            return
+
+        current = self.get_node_at(index)
+        nodes = self.nodes.setdefault(item, [])
+        occurrences = sum(1 for node in nodes if self.get_position(node) < index)
+        node = self.node_class(item)
+        self._link(node, current.prev, current)
+        nodes.insert(occurrences, node)
+
+    def pop(self, index=-1):
+        """
+        Remove the item at the given position in the list, and return it.
+        If no index is specified, a.pop() removes and returns the last item in the list.
+
+        Raises IndexError if list is empty or index is out of range.
+
+        :param index: index where the item should be popped (removed and returned).
+        """
+        if not self.size:
+            raise IndexError("The list is empty")
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("Index is out of range")
+        return self.remove_node(self.get_node_at(index))
+
+    def index(self, item, start=0, end=None):
+        """
+        Return first index of value.
+
+        Raises a ValueError if there is no such item.
+
+        :param item: object to be searched in the linked list.
+        :param start: position from which the search is going to start.
+        :param end: position at which the search is going to end.
+        """
+        end = self.size - 1 if end is None else end
+        for node in self.nodes.get(item, ()):
+            position = self.get_position(node)
+            if start <= position <= end:
+                return str(position)
+        raise ValueError("There is no such item")
+
+    def clear(self):
+        """
+        Remove all items from the list.
+        """
+        super().clear()
+        self.blocks = None
+        self.tree = None
+
+    def get_node_at(self, index):
+        """
+        Returns the node at the given position.
+
+        :param index: position of the node, negative positions count from the end.
+        :return: the node at that position.
+        """
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("Index is out of range")
+
+        self._build_blocks()
+        block, offset = self._find_block(index)
+        node = block.first
+        for _ in range(offset):
+            node = node.next
+        return node
+
+    def get_position(self, node):
+        """
+        Returns the position of the given node in the list.
+
+        :param node: node of this list.
+        :return: the position of the node.
+        """
+        self._build_blocks()
+        position = self._prefix(node.block.position)
+        current = node.block.first
+        while current is not node:
+            current = current.next
+            position += 1
+        return position
+
+    def __getitem__(self, index):
+        """
+        Returns the item at the given position, or the list of items of a slice.
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            count = len(range(start, stop, step))
+            items = []
+            if not count:
+                return items
+            node = self.get_node_at(start)
+            while True:
+                items.append(node.data)
+                if len(items) == count:
+                    return items
+                for _ in range(abs(step)):
+                    node = node.next if step > 0 else node.prev
+        return self.get_node_at(index).data
+
+    def _build_blocks(self):
+        if self.blocks is not None:
+            return
+
+        self.blocks = []
+        node = self.first
+        while node is not None:
+            block = Block(node, 0)
+            while node is not None and block.count < self.block_size:
+                node.block = block
+                block.count += 1
+                node = node.next
+            self.blocks.append(block)
+        self._build_tree()
+
+    def _build_tree(self):
+        self.tree = [0] * (len(self.blocks) + 1)
+        for position, block in enumerate(self.blocks):
+            block.position = position
+            i = position + 1
+            self.tree[i] += block.count
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def _add_count(self, block, delta):
+        block.count += delta
+        i = block.position + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, position):
+        total = 0
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+    def _find_block(self, index):
+        position = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if position + step < len(self.tree) and self.tree[position + step] <= index:
+                position += step
+                index -= self.tree[position]
+            step >>= 1
+        return self.blocks[position], index
+
+    def _append_block(self, block):
+        block.position = len(self.blocks)
+        self.blocks.append(block)
+        i = len(self.tree)
+        self.tree.append(block.count + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+
+    def _link(self, node, previous, following):
+        super()._link(node, previous, following)
+        if self.blocks is None:
+            return
+
+        if previous is None and following is None:
+            node.block = Block(node, 0)
+            self._append_block(node.block)
+        elif following is None and previous.block.count >= self.block_size:
+            node.block = Block(node, 1)
+            self._append_block(node.block)
+            return
+        elif previous is None:
+            node.block = following.block
+            node.block.first = node
+        else:
+            node.block = previous.block
+        self._add_count(node.block, 1)
+
+        if node.block.count > 2 * self.block_size:
+            self._split(node.block)
+
+    def _unlink(self, node):
+        block = node.block
+        if self.blocks is not None and block.first is node:
+            block.first = node.next if node.next is not None and node.next.block is block else None
+        super()._unlink(node)
+        if self.blocks is None:
+            return
+
+        self._add_count(block, -1)
+        if not block.count:
+            del self.blocks[block.position]
+            self._build_tree()
+
+    def _split(self, block):
+        half = block.count // 2
+        middle = block.first
+        for _ in range(half):
+            middle = middle.next
+
+        new_block = Block(middle, block.count - half)
+        node = middle
+        for _ in range(new_block.count):
+            node.block = new_block
+            node = node.next
+        block.count = half
+        self.blocks.insert(block.position + 1, new_block)
+        self._build_tree()
@@ -0,0 +1,59 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Lock that several readers can hold at the same time, while a writer holds it alone. Writers waiting for the lock
+    go before the readers that arrive after them, so a steady stream of reads doesn't starve the writes.
+
+    The thread that holds the write side can take either side again, a write may need to read what is stored.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = None
+        self.waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """
+        Holds the lock as a reader during a with block.
+        """
+        if self.writer == threading.get_ident():
+            yield
+            return
+        with self.condition:
+            while self.writer is not None or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """
+        Holds the lock as the only writer during a with block.
+        """
+        thread = threading.get_ident()
+        if self.writer == thread:
+            yield
+            return
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer is not None or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = thread
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = None
+                self.condition.notify_all()
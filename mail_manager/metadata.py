@@ -0,0 +1,218 @@
+import math
+from array import array
+from collections import Counter
+from itertools import compress
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .exceptions import MailManagerException
+from .index import Index
+
+
+class MetadataStore(Index):
+    """
+    Columnar store of the email headers, used for analytics over the whole database or over a folder.
+
+    Every email gets a row. Senders and receivers are stored as integer codes, dates as timestamps in an
+    array('d'), with NaN when the date can't be parsed. Each folder has a membership map with one byte per row
+    (1 if the email is in the folder), and another map marks the rows of the emails still in the database.
+
+    Bulk queries work over whole columns: with NumPy they are vectorized, without it they rely on the C loops of
+    bytearray.count, itertools.compress and Counter. Removed rows are only cleared, and they are purged when they
+    outnumber the live ones.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty store.
+        """
+        self.ids = []
+        self.rows = {}
+        self.senders = array('I')
+        self.receivers = array('I')
+        self.timestamps = array('d')
+        self.alive = bytearray()
+        self.folders = {}
+        self.sender_codes = {}
+        self.sender_values = []
+        self.receiver_codes = {}
+        self.receiver_values = []
+
+    def add_email(self, email):
+        if email.id in self.rows:
+            return
+        self.rows[email.id] = len(self.ids)
+        self.ids.append(email.id)
+        self.senders.append(self._encode(self.sender_codes, self.sender_values, email.sender))
+        self.receivers.append(self._encode(self.receiver_codes, self.receiver_values, email.receiver))
+        self.timestamps.append(math.nan if email.timestamp is None else email.timestamp)
+        self.alive.append(1)
+
+    def remove_email(self, email):
+        self.remove_emails((email,))
+
+    def remove_emails(self, emails):
+        for email in emails:
+            row = self.rows.pop(email.id, None)
+            if row is None:
+                continue
+            self.ids[row] = None
+            self.alive[row] = 0
+            for membership in self.folders.values():
+                if row < len(membership):
+                    membership[row] = 0
+        if len(self.ids) - len(self.rows) > len(self.rows):
+            self.compact()
+
+    def create_folder(self, folder_name):
+        self.folders[folder_name] = bytearray()
+
+    def remove_folder(self, folder_name):
+        self.folders.pop(folder_name, None)
+
+    def add_to_folder(self, folder_name, email):
+        row = self.rows[email.id]
+        membership = self.folders.setdefault(folder_name, bytearray())
+        if len(membership) <= row:
+            membership.extend(bytes(row + 1 - len(membership)))
+        membership[row] = 1
+
+    def remove_from_folder(self, folder_name, email):
+        row = self.rows.get(email.id)
+        membership = self.folders.get(folder_name)
+        if row is not None and membership is not None and row < len(membership):
+            membership[row] = 0
+
+    def compact(self):
+        """
+        Purges the rows of the removed emails from every column.
+        """
+        keep = bytes(self.alive)
+        self.ids = list(compress(self.ids, keep))
+        self.rows = {email_id: row for row, email_id in enumerate(self.ids)}
+        self.senders = array('I', compress(self.senders, keep))
+        self.receivers = array('I', compress(self.receivers, keep))
+        self.timestamps = array('d', compress(self.timestamps, keep))
+        self.alive = bytearray(b'\x01' * len(self.ids))
+        for folder_name, membership in self.folders.items():
+            self.folders[folder_name] = bytearray(compress(membership, keep))
+
+    def count_per_folder(self):
+        """
+        Returns the number of emails of every folder.
+
+        :return: a dictionary from folder name to number of emails.
+        """
+        return {folder_name: membership.count(1) for folder_name, membership in self.folders.items()}
+
+    def filter_date_range(self, start, end, folder_name=None):
+        """
+        Returns the emails whose date is in the given range. Emails with a date that can't be parsed are never
+        returned.
+
+        :param start: first timestamp of the range.
+        :param end: timestamp where the range ends (not included).
+        :param folder_name: if provided, only the emails of that folder are considered.
+        :return: the list of email ids, in database order.
+        """
+        mask = self._mask(folder_name)
+        if not self.ids:
+            return []
+        if numpy is not None:
+            timestamps = numpy.frombuffer(self.timestamps, dtype=numpy.float64)
+            selected = numpy.frombuffer(mask, dtype=numpy.uint8).astype(bool)
+            selected &= (timestamps >= start) & (timestamps < end)
+            return [self.ids[row] for row in numpy.flatnonzero(selected)]
+        return [self.ids[row] for row, (selected, timestamp) in enumerate(zip(mask, self.timestamps))
+                if selected and start <= timestamp < end]
+
+    def group_by_sender(self, folder_name=None):
+        """
+        Counts the emails sent by each sender.
+
+        :param folder_name: if provided, only the emails of that folder are considered.
+        :return: a dictionary from sender to number of emails.
+        """
+        return self._group(self.senders, self.sender_values, folder_name)
+
+    def group_by_receiver(self, folder_name=None):
+        """
+        Counts the emails received by each receiver.
+
+        :param folder_name: if provided, only the emails of that folder are considered.
+        :return: a dictionary from receiver to number of emails.
+        """
+        return self._group(self.receivers, self.receiver_values, folder_name)
+
+    def date_histogram(self, bucket_seconds, folder_name=None):
+        """
+        Counts the emails whose date falls in each bucket of the given length.
+
+        :param bucket_seconds: length of the buckets in seconds, for example 86400 for days.
+        :param folder_name: if provided, only the emails of that folder are considered.
+        :return: a dictionary from the timestamp where each bucket starts to its number of emails.
+        """
+        mask = self._mask(folder_name)
+        if not self.ids:
+            return {}
+        if numpy is not None:
+            timestamps = numpy.frombuffer(self.timestamps, dtype=numpy.float64)
+            selected = numpy.frombuffer(mask, dtype=numpy.uint8).astype(bool) & ~numpy.isnan(timestamps)
+            buckets, counts = numpy.unique(numpy.floor(timestamps[selected] / bucket_seconds), return_counts=True)
+            return {float(bucket) * bucket_seconds: int(count) for bucket, count in zip(buckets, counts)}
+        counts = Counter(timestamp // bucket_seconds for timestamp in compress(self.timestamps, mask)
+                         if timestamp == timestamp)
+        return {bucket * bucket_seconds: count for bucket, count in sorted(counts.items())}
+
+    def sort_by_date(self, folder_name=None, newest_first=False):
+        """
+        Returns the emails sorted by date. Emails with a date that can't be parsed go at the end.
+
+        :param folder_name: if provided, only the emails of that folder are returned.
+        :param newest_first: if True the newest emails go first.
+        :return: the list of email ids.
+        """
+        mask = self._mask(folder_name)
+        if not self.ids:
+            return []
+        if numpy is not None:
+            timestamps = numpy.frombuffer(self.timestamps, dtype=numpy.float64)
+            rows = numpy.flatnonzero(numpy.frombuffer(mask, dtype=numpy.uint8))
+            keys = timestamps[rows]
+            order = numpy.argsort(-keys if newest_first else keys, kind="stable")
+            return [self.ids[row] for row in rows[order]]
+        rows = list(compress(range(len(self.ids)), mask))
+        undated = [row for row in rows if self.timestamps[row] != self.timestamps[row]]
+        dated = [row for row in rows if self.timestamps[row] == self.timestamps[row]]
+        dated.sort(key=self.timestamps.__getitem__, reverse=newest_first)
+        return [self.ids[row] for row in dated + undated]
+
+    def _mask(self, folder_name):
+        if folder_name is None:
+            return self.alive
+        if folder_name not in self.folders:
+            raise MailManagerException("There is not folder in the Database with that name")
+        membership = self.folders[folder_name]
+        return membership + bytes(len(self.ids) - len(membership))
+
+    def _group(self, column, values, folder_name):
+        mask = self._mask(folder_name)
+        if not self.ids:
+            return {}
+        if numpy is not None:
+            codes = numpy.frombuffer(column, dtype=numpy.uint32)
+            selected = numpy.frombuffer(mask, dtype=numpy.uint8).astype(bool)
+            counts = numpy.bincount(codes[selected], minlength=len(values))
+            return {values[code]: int(counts[code]) for code in numpy.flatnonzero(counts)}
+        return {values[code]: count for code, count in Counter(compress(column, mask)).items()}
+
+    @staticmethod
+    def _encode(codes, values, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
@@ -0,0 +1,76 @@
+"""
+Copies an email database to another directory or to another storage, for example from the emailDB layout with a
+text file per email to the pack storage.
+
+Usage: python -m mail_manager.migrate SOURCE TARGET [--from files] [--to pack] [--compression zlib] [--dictionary]
+       [--deduplicate] [--compact]
+"""
+import argparse
+import os
+from itertools import islice
+
+from . import utils
+from .database import DatabaseConfiguration
+
+
+DICTIONARY_SAMPLES = 2000
+
+
+def migrate(source_config, target_config):
+    """
+    Copies every email of the source database to the storage of the target configuration, and writes the
+    configuration file of the target. The journal of the source, if it has one, is replayed and folded into the
+    configuration file of the source first, so the copy has every change.
+
+    The source and the target can share the directory if they use different storages, then the original email
+    files are left untouched. If the target compresses with a dictionary and has none yet, one is trained with
+    the first emails of the source.
+
+    :param source_config: Database Configuration of the existing database.
+    :param target_config: Database Configuration of the new database.
+    :return: the number of copied emails.
+    """
+    db = utils.load_database(source_config)
+    if db.journal is not None:
+        db.checkpoint()
+    os.makedirs(target_config.database_dir, exist_ok=True)
+    os.makedirs(target_config.email_dir, exist_ok=True)
+    storage = utils.get_storage(db, target_config)
+    if target_config.compression_dictionary and storage.dictionary is None:
+        storage.train_dictionary(islice(db.emails, DICTIONARY_SAMPLES))
+    for email in db.emails:
+        storage.write(email)
+    storage.close()
+    utils.write_database(db, target_config)
+    db.close()
+    return len(db.emails)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="directory of the existing database")
+    parser.add_argument("target", help="directory of the new database, it can be the same as the source")
+    parser.add_argument("--from", dest="source_storage", choices=("files", "pack"), default="files")
+    parser.add_argument("--to", dest="target_storage", choices=("files", "pack"), default="pack")
+    parser.add_argument("--compression", choices=("zlib", "lzma"), help="compression of the bodies in the target")
+    parser.add_argument("--dictionary", action="store_true", help="compress small bodies with a trained dictionary")
+    parser.add_argument("--deduplicate", action="store_true", help="store identical bodies once in the target")
+    parser.add_argument("--config-filename", default="EMConfig.txt")
+    parser.add_argument("--compact", action="store_true", help="compact the target storage once it is written")
+    args = parser.parse_args()
+
+    source_config = DatabaseConfiguration(args.source, args.config_filename, storage=args.source_storage,
+                                          lazy_bodies=True, journal=True)
+    target_config = DatabaseConfiguration(args.target, args.config_filename, storage=args.target_storage,
+                                          compression=args.compression, compression_dictionary=args.dictionary,
+                                          deduplicate_bodies=args.deduplicate)
+    count = migrate(source_config, target_config)
+    if args.compact:
+        db = utils.load_database(target_config)
+        db.compact_storage()
+        db.close()
+    print("Migrated {} emails from {} to {}".format(count, args.source, args.target))
+
+
+if __name__ == "__main__":
+    main()
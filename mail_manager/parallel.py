@@ -0,0 +1,102 @@
+"""
+Parallel scan of the emails of a database on a pool of worker processes, for the searches that no index can
+narrow.
+"""
+import threading
+
+from .locks import ReadWriteLock
+from .query import parse_query
+
+
+# Below this number of emails per shard a scan is faster in a single process
+MIN_SHARD_SIZE = 2000
+
+_emails = ()
+
+
+def _start_worker(emails, locked):
+    global _emails
+    _emails = emails
+    # A lock held by another thread of the parent when it forked would stay held forever in the worker
+    for owner in locked:
+        owner.lock = ReadWriteLock() if isinstance(owner.lock, ReadWriteLock) else threading.Lock()
+
+
+def _scan_shard(start, end, text, is_query):
+    from .database import Database
+    if is_query:
+        matches = parse_query(text).matches
+    else:
+        def matches(email):
+            return Database.contains_text(email, text)
+    return [position for position in range(start, end) if matches(_emails[position])]
+
+
+class ParallelSearch:
+    """
+    Pool of worker processes that scan shards of the emails of a database.
+
+    The workers are forked from the process of the database and receive the tuple of emails of a view when they
+    start, so they share the emails with the database instead of receiving them pickled, and lazy bodies are
+    read from disk by the workers themselves. Every scan splits the tuple into shards and sends only their bounds
+    and the text, and the workers return the positions of the matching emails, which are merged in the order of
+    the shards. The pool is kept while the emails of the database stay the same, and started again when they
+    change, so it pays off on databases that are searched more often than they change.
+
+    Several threads can scan at the same time. The pool is started and replaced, and the shards are submitted,
+    under a lock, and every scan keeps the pool it submitted to together with the tuple its workers received. A
+    replaced pool finishes the shards already submitted to it before its workers stop.
+
+    Forking is only available on POSIX platforms, elsewhere every scan is left to the caller.
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: number of worker processes.
+        """
+        self.workers = workers
+        self.executor = None
+        self.emails = None
+        self.lock = threading.Lock()
+
+    def scan(self, emails, text, is_query=False, locked=()):
+        """
+        Finds the emails that contain a text, or that match a query.
+
+        :param emails: tuple of the emails to be scanned, from a DatabaseView. Views share the same tuple while the
+         emails of the database don't change.
+        :param text: the text to be searched, or the query.
+        :param is_query: if True, the text is a query with the syntax of parse_query.
+        :param locked: objects shared with the workers whose 'lock' attribute must be renewed in them.
+        :return: the list of matching emails in the order of the tuple, or None if the tuple is too small to be
+         split or the platform can't fork, and the caller has to scan it.
+        """
+        # Imported here, multiprocessing and the executors take longer to import than the rest of the package
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        shards = min(self.workers * 4, len(emails) // MIN_SHARD_SIZE)
+        if shards < 2 or "fork" not in multiprocessing.get_all_start_methods():
+            return None
+        size = -(-len(emails) // shards)
+        with self.lock:
+            if self.executor is None or self.emails is not emails:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=multiprocessing.get_context("fork"),
+                                                    initializer=_start_worker, initargs=(emails, tuple(locked)))
+                self.emails = emails
+            futures = [self.executor.submit(_scan_shard, start, min(start + size, len(emails)), text, is_query)
+                       for start in range(0, len(emails), size)]
+        return [emails[position] for future in futures for position in future.result()]
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+                self.emails = None
@@ -0,0 +1,265 @@
+import json
+import os
+import random
+import time
+from functools import wraps
+
+from . import storage, utils
+from .database import Database
+from .storage import PackStorage, body_file_path, file_signature
+
+
+DATABASE_METHODS = ("add_email", "remove_email", "move_email", "add_emails", "remove_emails", "move_emails",
+                    "create_folder", "remove_folder", "get_email", "get_email_ids", "search", "search_words",
+                    "search_phrase", "query", "stats", "commit", "checkpoint", "compact_storage", "close")
+
+
+def _size(path):
+    signature = file_signature(path)
+    return signature[1] if signature is not None else 0
+
+
+def _stored_size(db, email_id, db_config=None):
+    if db_config is None or db_config is db.db_config:
+        signature = db.storage.signature(email_id)
+    else:
+        signature = file_signature(db_config.get_email_path(email_id))
+    return signature[-1] if signature is not None else 0
+
+
+def _load_database_bytes(db, db_config):
+    # Lazy bodies are not counted, only their headers are read
+    size = sum(_size(path) for path in (db_config.get_config_path(), db_config.get_journal_path(),
+                                        db_config.get_snapshot_path()))
+    return size + sum(_stored_size(db, email.id) for email in db.emails if email.body_path is None)
+
+
+def _read_email_file_bytes(email, path, email_id, lazy=False, *args, **kwargs):
+    size = _size(path)
+    if not lazy and email.body_ref is not None:
+        size += _size(body_file_path(os.path.dirname(path), email.body_ref))
+    return size
+
+
+def _pack_load_bytes(email, pack, email_id, lazy=False, *args, **kwargs):
+    signature = pack.signature(email_id)
+    size = signature[-1] if signature is not None else 0
+    if not lazy and email.body_ref is not None:
+        size += pack.body_size(email.body_ref) or 0
+    return size
+
+
+def _write_email_bytes(result, email, db, db_config=None):
+    return _stored_size(db, email.id, db_config)
+
+
+def _write_database_bytes(result, db, db_config=None):
+    db_config = db_config or db.db_config
+    return _size(db_config.get_config_path()) + (_size(db_config.get_snapshot_path()) if db_config.snapshot else 0)
+
+
+UTILS_FUNCTIONS = (
+    ("load_database", _load_database_bytes),
+    ("write_email", _write_email_bytes),
+    ("write_database", _write_database_bytes),
+)
+
+# Every email read from disk goes through one of these, whatever function of utils loads it
+STORAGE_FUNCTIONS = (
+    (storage, "read_email_file", "storage.read_email_file", _read_email_file_bytes),
+    (PackStorage, "load", "PackStorage.load", _pack_load_bytes),
+)
+
+
+class OperationStats:
+    """
+    Statistics of the calls to an operation. The latencies are kept in a reservoir sample of bounded size, so long
+    sessions don't grow it without limit and the percentiles stay representative of the whole session.
+    """
+
+    __slots__ = ("calls", "errors", "total", "maximum", "bytes", "samples", "sample_size")
+
+    def __init__(self, sample_size):
+        """
+        :param sample_size: maximum number of latencies kept to compute the percentiles.
+        """
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.bytes = 0
+        self.samples = []
+        self.sample_size = sample_size
+
+    def record(self, seconds, size=0, failed=False):
+        """
+        Records a call.
+
+        :param seconds: latency of the call.
+        :param size: bytes read or written by the call.
+        :param failed: True if the call raised an exception.
+        """
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total += seconds
+        self.bytes += size
+        if seconds > self.maximum:
+            self.maximum = seconds
+        if len(self.samples) < self.sample_size:
+            self.samples.append(seconds)
+        else:
+            position = random.randrange(self.calls)
+            if position < self.sample_size:
+                self.samples[position] = seconds
+
+    def percentile(self, fraction):
+        """
+        Returns a percentile of the sampled latencies, by the nearest rank.
+
+        :param fraction: the percentile, from 0 to 1.
+        :return: the latency in seconds, or 0 if there are no calls.
+        """
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def to_dict(self):
+        """
+        :return: a dictionary with the statistics, latencies in seconds.
+        """
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total": self.total,
+            "mean": self.total / self.calls if self.calls else 0.0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": self.maximum,
+            "bytes": self.bytes,
+        }
+
+
+class Profiler:
+    """
+    Records how many times the operations of the database and the I/O functions of utils and of the storages are
+    called, how long they take and how many bytes they read or write.
+
+    The operations are instrumented by replacing the methods of Database and the functions of utils and of the
+    storages with wrappers when the profiler is installed, and restoring them when it is uninstalled. While no
+    profiler is installed the original code runs untouched, so instrumentation costs nothing when it is disabled.
+    Calls made from within another instrumented call are recorded too, so the latency of an operation includes the
+    ones it calls. Calls that raise an exception are recorded as well, and counted as errors.
+
+    The bytes of an I/O function are taken from the sizes of the files it reads or writes once it returns, and only
+    while the profiler is installed.
+    """
+
+    def __init__(self, sample_size=10000):
+        """
+        :param sample_size: maximum number of latencies kept per operation to compute the percentiles.
+        """
+        self.sample_size = sample_size
+        self.operations = {}
+        self.originals = []
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def install(self):
+        """
+        Replaces the instrumented methods and functions with wrappers that record their calls.
+        """
+        if self.originals:
+            return
+        for name in DATABASE_METHODS:
+            self._replace(Database, name, "Database." + name)
+        for name, measure in UTILS_FUNCTIONS:
+            self._replace(utils, name, "utils." + name, measure)
+        for owner, name, operation, measure in STORAGE_FUNCTIONS:
+            self._replace(owner, name, operation, measure)
+
+    def uninstall(self):
+        """
+        Restores the original methods and functions.
+        """
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = []
+
+    def record(self, operation, seconds, size=0, failed=False):
+        """
+        Records a call to an operation.
+
+        :param operation: name of the operation.
+        :param seconds: latency of the call.
+        :param size: bytes read or written by the call.
+        :param failed: True if the call raised an exception.
+        """
+        stats = self.operations.get(operation)
+        if stats is None:
+            stats = self.operations[operation] = OperationStats(self.sample_size)
+        stats.record(seconds, size, failed)
+
+    def wrap(self, operation, function, measure=None):
+        """
+        Returns a wrapper of a function that records its calls.
+
+        :param operation: name under which the calls are recorded.
+        :param function: the function.
+        :param measure: optional function that receives the result and the arguments of a call and returns the
+         bytes it has read or written. It is not called for the calls that raise an exception.
+        :return: the wrapper.
+        """
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                size = measure(result, *args, **kwargs) if measure is not None and not failed else 0
+                self.record(operation, elapsed, size, failed)
+        return wrapper
+
+    def report(self):
+        """
+        :return: a dictionary from operation name to its statistics, see OperationStats.to_dict.
+        """
+        return {operation: stats.to_dict() for operation, stats in sorted(self.operations.items())}
+
+    def format_report(self):
+        """
+        :return: the report as a text table, with the latencies in milliseconds.
+        """
+        lines = ["{:<26} {:>8} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9} {:>9} {:>12}".format(
+            "operation", "calls", "errors", "total ms", "mean ms", "p50 ms", "p90 ms", "p99 ms", "max ms", "bytes")]
+        for operation, stats in self.report().items():
+            lines.append("{:<26} {:>8} {:>7} {:>10.2f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>12}".format(
+                operation, stats["calls"], stats["errors"], stats["total"] * 1000, stats["mean"] * 1000, stats["p50"] * 1000,
+                stats["p90"] * 1000, stats["p99"] * 1000, stats["max"] * 1000, stats["bytes"]))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """
+        Writes the report as JSON.
+
+        :param path: path of the JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+    def _replace(self, owner, name, operation, measure=None):
+        original = getattr(owner, name)
+        self.originals.append((owner, name, original))
+        setattr(owner, name, self.wrap(operation, original, measure))
@@ -0,0 +1,188 @@
+import re
+
+from .address_index import address_matches
+from .exceptions import MailManagerException
+
+
+FIELDS = {"from": "sender", "to": "receiver", "subject": "subject", "body": "body"}
+
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|(?:(\w+):)?(?:"([^"]*)"|([^\s()"]+)))')
+
+
+class Term:
+    """
+    Query term. Terms of the sender and receiver fields match addresses and names ignoring case, like
+    address_matches. The rest of the terms match when their text appears in the field, and terms without field
+    match when the text appears in any field, like Database.search.
+    """
+
+    def __init__(self, field, value):
+        """
+        :param field: name of the email attribute, or None to match any field.
+        :param value: the value to look for.
+        """
+        self.field = field
+        self.value = value
+
+    def matches(self, email):
+        if self.field in ("sender", "receiver"):
+            return address_matches(getattr(email, self.field), self.value)
+        if self.field is None:
+            fields = (email.subject, email.sender, email.body, email.receiver)
+        else:
+            fields = (getattr(email, self.field),)
+        return any(field is not None and field.find(self.value) > -1 for field in fields)
+
+    def plan(self, db):
+        if self.field in ("sender", "receiver"):
+            index = db.sender_index if self.field == "sender" else db.receiver_index
+            return index.lookup(self.value) if index is not None else None
+
+        candidates = None
+        for index in db.indexes:
+            found = index.candidates(self.value)
+            if found is not None and (candidates is None or len(found) < len(candidates)):
+                candidates = found
+        if candidates is None:
+            return None
+        return {email.id: email for email in candidates}
+
+    def __str__(self):
+        return self.value if self.field is None else self.field + ":" + self.value
+
+
+class And:
+    """
+    Query matching the emails that match all of its queries.
+    """
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def matches(self, email):
+        return all(query.matches(email) for query in self.queries)
+
+    def plan(self, db):
+        plans = [plan for plan in (query.plan(db) for query in self.queries) if plan is not None]
+        if not plans:
+            return None
+        plans.sort(key=len)
+        smallest, others = plans[0], plans[1:]
+        return {email_id: email for email_id, email in smallest.items()
+                if all(email_id in other for other in others)}
+
+    def __str__(self):
+        return "(" + " AND ".join(map(str, self.queries)) + ")"
+
+
+class Or:
+    """
+    Query matching the emails that match any of its queries.
+    """
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def matches(self, email):
+        return any(query.matches(email) for query in self.queries)
+
+    def plan(self, db):
+        found = {}
+        for query in self.queries:
+            plan = query.plan(db)
+            if plan is None:
+                return None
+            found.update(plan)
+        return found
+
+    def __str__(self):
+        return "(" + " OR ".join(map(str, self.queries)) + ")"
+
+
+def tokenize(text):
+    """
+    Splits a query into parentheses, operators and terms.
+
+    :param text: the query.
+    :return: a list of tokens: '(' and ')', 'AND' and 'OR', or Term objects.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise MailManagerException("Invalid query near \'" + text[position:] + "\'")
+        position = match.end()
+        opening, closing, field, quoted, word = match.groups()
+        if opening or closing:
+            tokens.append(opening or closing)
+        elif field is None and quoted is None and word in ("AND", "OR"):
+            tokens.append(word)
+        else:
+            value = word if quoted is None else quoted
+            if field is not None and field.lower() not in FIELDS:
+                value = field + ":" + value
+                field = None
+            elif field is not None:
+                field = FIELDS[field.lower()]
+            tokens.append(Term(field, value))
+    return tokens
+
+
+def parse_query(text):
+    """
+    Parses a query like 'from:bank@bank.bank.com AND (subject:invoice OR body:"bank manager")'.
+
+    A query is made of terms joined by AND and OR, where AND binds tighter than OR and terms with nothing between
+    them are joined by AND. Parentheses group queries. A term is a text, optionally quoted and prefixed by one of
+    the fields from:, to:, subject: or body:.
+
+    :param text: the query.
+    :return: a Term, And or Or object.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        raise MailManagerException("The query is empty")
+    query, position = _parse_or(tokens, 0)
+    if position < len(tokens):
+        raise MailManagerException("Invalid query, unexpected \'" + str(tokens[position]) + "\'")
+    return query
+
+
+def _parse_or(tokens, position):
+    queries = []
+    while True:
+        query, position = _parse_and(tokens, position)
+        queries.append(query)
+        if position < len(tokens) and tokens[position] == "OR":
+            position += 1
+        else:
+            break
+    return (queries[0] if len(queries) == 1 else Or(queries)), position
+
+
+def _parse_and(tokens, position):
+    queries = []
+    while True:
+        query, position = _parse_term(tokens, position)
+        queries.append(query)
+        if position < len(tokens) and tokens[position] == "AND":
+            position += 1
+        elif position >= len(tokens) or tokens[position] in (")", "OR"):
+            break
+    return (queries[0] if len(queries) == 1 else And(queries)), position
+
+
+def _parse_term(tokens, position):
+    if position >= len(tokens):
+        raise MailManagerException("Invalid query, it ends after an operator")
+    token = tokens[position]
+    if token == "(":
+        query, position = _parse_or(tokens, position + 1)
+        if position >= len(tokens) or tokens[position] != ")":
+            raise MailManagerException("Invalid query, missing \')\'")
+        return query, position + 1
+    if not isinstance(token, Term):
+        raise MailManagerException("Invalid query, unexpected \'" + token + "\'")
+    return token, position + 1
@@ -0,0 +1,173 @@
+import re
+
+from .index import Index
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Splits a text into lower case word tokens.
+
+    :param text: text to be tokenized, it can be None.
+    :return: the list of tokens of the text.
+    """
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex(Index):
+    """
+    Inverted index over the searchable fields of the emails (subject, sender, body and receiver).
+
+    Every term points to a posting list that maps the document number of each email containing the term to the
+    positions where the term appears. Document numbers grow with every indexed email, so sorting them gives back
+    the order in which the emails were added to the database.
+    """
+
+    fields = ("subject", "sender", "body", "receiver")
+
+    def __init__(self):
+        """
+        Initializes an empty index.
+        """
+        self.postings = {}
+        self.documents = {}
+        self.document_ids = {}
+        self.document_terms = {}
+        self.next_document = 0
+
+    def add_email(self, email):
+        """
+        Indexes the given email. Emails that are already indexed are ignored.
+
+        :param email: email to be indexed.
+        """
+        if email.id in self.document_ids:
+            return
+
+        document = self.next_document
+        self.next_document += 1
+        self.documents[document] = email
+        self.document_ids[email.id] = document
+
+        terms = set()
+        position = 0
+        for field in SearchIndex.fields:
+            for term in tokenize(getattr(email, field)):
+                self.postings.setdefault(term, {}).setdefault(document, []).append(position)
+                terms.add(term)
+                position += 1
+            # Leave a gap between fields so a phrase never matches across two of them
+            position += 1
+        self.document_terms[document] = tuple(terms)
+
+    def remove_email(self, email):
+        """
+        Removes the given email from the index. Emails that are not indexed are ignored.
+
+        :param email: email to be removed.
+        """
+        document = self.document_ids.pop(email.id, None)
+        if document is None:
+            return
+
+        for term in self.document_terms.pop(document):
+            posting = self.postings[term]
+            del posting[document]
+            if not posting:
+                del self.postings[term]
+        del self.documents[document]
+
+    def search_terms(self, query):
+        """
+        Returns the emails that contain all the words of the query, in any order and any field.
+
+        :param query: words to be searched.
+        :return: the list of emails, in database order.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        return self._emails(self._intersect([self.postings.get(term, {}).keys() for term in terms]))
+
+    def search_phrase(self, phrase):
+        """
+        Returns the emails that contain the words of the phrase consecutively in the same field.
+
+        :param phrase: phrase to be searched.
+        :return: the list of emails, in database order.
+        """
+        terms = tokenize(phrase)
+        if not terms:
+            return []
+
+        postings = [self.postings.get(term, {}) for term in terms]
+        found = []
+        for document in self._intersect([posting.keys() for posting in postings]):
+            starts = set(postings[0][document])
+            for offset, posting in enumerate(postings[1:], 1):
+                starts.intersection_update(position - offset for position in posting[document])
+                if not starts:
+                    break
+            if starts:
+                found.append(document)
+        return self._emails(found)
+
+    def candidates(self, text):
+        """
+        Returns the emails that may contain the text as a substring of one of their fields. The result is a
+        superset of the real matches, so every candidate still has to be checked with the substring search.
+
+        Words of the query that are surrounded by other characters of the query must be whole words of the email,
+        so they are looked up directly. Words at the edges of the query may be a piece of a longer word, so they
+        are looked up in the vocabulary of the index.
+
+        :param text: text to be searched.
+        :return: the list of candidate emails in database order, or None if the index cannot narrow the search.
+        """
+        lowered = text.lower()
+        matches = list(TOKEN_PATTERN.finditer(lowered))
+        if not matches:
+            return None
+
+        documents = []
+        for match in matches:
+            term = match.group()
+            open_start = match.start() == 0
+            open_end = match.end() == len(lowered)
+            if not open_start and not open_end:
+                documents.append(self.postings.get(term, {}).keys())
+            else:
+                documents.append(self._expand(term, open_start, open_end))
+        return self._emails(self._intersect(documents))
+
+    def _expand(self, fragment, open_start, open_end):
+        """
+        Returns the documents containing any indexed term that the fragment can be a piece of.
+        """
+        documents = set()
+        for term, posting in self.postings.items():
+            if open_start and open_end:
+                matched = fragment in term
+            elif open_start:
+                matched = term.endswith(fragment)
+            else:
+                matched = term.startswith(fragment)
+            if matched:
+                documents.update(posting)
+        return documents
+
+    @staticmethod
+    def _intersect(document_sets):
+        document_sets = sorted(document_sets, key=len)
+        found = set(document_sets[0])
+        for documents in document_sets[1:]:
+            if not found:
+                break
+            found.intersection_update(documents)
+        return found
+
+    def _emails(self, documents):
+        return [self.documents[document] for document in sorted(documents)]
@@ -0,0 +1,229 @@
+"""
+Server that keeps a database loaded and answers requests over a Unix domain socket, so every request costs an index
+lookup instead of loading the database.
+
+The protocol is one JSON object per line in each direction. A request is {"command": name, "args": {...}}, and the
+response is {"ok": true, "result": ...} or {"ok": false, "error": message}. A connection can send any number of
+requests. The client side is client.Client.
+"""
+import json
+import os
+import signal
+import socketserver
+import threading
+from email.utils import formatdate
+
+from .email import Email
+from .exceptions import MailManagerException
+from .locks import ReadWriteLock
+from .storage import read_email_file
+from .utils import delete_email, write_database, write_email
+
+
+def summary(email):
+    """
+    Returns the fields of an email shown in lists.
+
+    :param email: the email.
+    :return: a list with the id, the date, the sender and the subject.
+    """
+    return [email.id, email.date, email.sender, email.subject]
+
+
+def batch_results(results):
+    """
+    Converts the results of a batch operation of the database to values that can be sent as JSON.
+
+    :param results: list of results, where errors are MailManagerExceptions.
+    :return: the list, with the errors replaced by their messages.
+    """
+    return [str(result) if isinstance(result, MailManagerException) else result for result in results]
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles the requests of a connection, one per line, until the client closes it.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                result = self.server.execute(request["command"], request.get("args") or {})
+                response = {"ok": True, "result": result}
+            except (MailManagerException, OSError, KeyError, TypeError, ValueError) as e:
+                response = {"ok": False, "error": str(e) or type(e).__name__}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class DatabaseServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server of a loaded database. Every connection is served by its own thread. Reads run in parallel under the read
+    side of a ReadWriteLock, and writes run one at a time under its write side. Every write is committed to the
+    journal before it is answered, or folded into the configuration file if the database has no journal.
+
+    The commands are the methods whose names start with 'read_' or 'write_', which tells the side of the lock they
+    need.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, db, socket_path):
+        """
+        Listens on the given socket path, replacing a stale socket file left by a server that didn't stop cleanly.
+
+        :param db: the database.
+        :param socket_path: path of the Unix domain socket.
+        """
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, RequestHandler)
+        self.db = db
+        self.socket_path = socket_path
+        self.lock = ReadWriteLock()
+
+    def execute(self, command, args):
+        """
+        Runs a command under the side of the lock it needs.
+
+        :param command: name of the command.
+        :param args: dictionary with the arguments of the command.
+        :return: the result of the command.
+        """
+        name = command.replace("-", "_")
+        method = getattr(self, "read_" + name, None)
+        if method is not None:
+            with self.lock.read():
+                return method(**args)
+        method = getattr(self, "write_" + name, None)
+        if method is None:
+            raise MailManagerException("Unknown command \'" + str(command) + "\'")
+        with self.lock.write():
+            result = method(**args)
+            self.persist()
+            return result
+
+    def persist(self):
+        """
+        Makes sure the changes are on disk.
+        """
+        if self.db.journal is not None:
+            self.db.commit()
+        else:
+            write_database(self.db)
+
+    def server_close(self):
+        """
+        Stops listening and removes the socket file.
+        """
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def _emails(self, folder=None):
+        if folder is None:
+            return self.db.emails
+        if folder not in self.db.folders:
+            raise MailManagerException("The folder \'" + folder + "\' does not exist")
+        return self.db.folders[folder].emails
+
+    def read_ping(self):
+        return "pong"
+
+    def read_folders(self):
+        return self.db.get_folder_names()
+
+    def read_list(self, folder=None):
+        return [summary(email) for email in self._emails(folder)]
+
+    def read_show(self, email_id):
+        email = self.db.get_email(email_id)
+        if email is None:
+            raise MailManagerException("There is no email with the id \'" + str(email_id) + "\'")
+        return str(email)
+
+    def read_search(self, text, folder=None):
+        emails = self.db.query(text)
+        if folder is not None:
+            self._emails(folder)
+            emails = [email for email in emails if email.id in self.db.folders[folder]]
+        return [summary(email) for email in emails]
+
+    def read_export(self, directory, folder=None):
+        os.makedirs(directory, exist_ok=True)
+        count = 0
+        for email in self._emails(folder):
+            with open(os.path.join(directory, email.id + ".txt"), 'w') as f:
+                f.write(str(email))
+            count += 1
+        return count
+
+    def read_stats(self):
+        return self.db.stats()
+
+    def write_create_folder(self, name):
+        return self.db.create_folder(name)
+
+    def write_remove_folder(self, name):
+        self.db.remove_folder(name)
+
+    def write_add_to_folder(self, folder, email_ids):
+        return batch_results(self.db.add_emails(email_ids, folder))
+
+    def write_remove_from_folder(self, folder, email_ids):
+        return batch_results(self.db.remove_emails(email_ids, folder))
+
+    def write_move(self, source, target, email_ids):
+        return batch_results(self.db.move_emails(email_ids, source, target))
+
+    def write_create_email(self, sender, receiver, subject, body, folder=None):
+        email = Email(str(self.db.email_id_seed) + "EDA1email", sender, receiver, subject,
+                      formatdate(localtime=True), body)
+        write_email(email, self.db)
+        self.db.add_email(email, folder)
+        self.db.email_id_seed += 1
+        return email.id
+
+    def write_delete_email(self, email_id):
+        email = self.db.get_email(email_id)
+        if email is None:
+            raise MailManagerException("There is no email with the id \'" + str(email_id) + "\'")
+        self.db.remove_email(email)
+        delete_email(email, self.db)
+
+    def write_import(self, paths, folder="Inbox"):
+        if folder not in self.db.folders:
+            raise MailManagerException("The folder \'" + folder + "\' does not exist")
+        emails = []
+        for path in paths:
+            email = read_email_file(path, str(self.db.email_id_seed) + "EDA1email")
+            write_email(email, self.db)
+            self.db.email_id_seed += 1
+            emails.append(email)
+        self.db.add_emails(emails, folder)
+        return [email.id for email in emails]
+
+    def write_shutdown(self):
+        # shutdown waits for serve_forever to return, so it can't run in the thread of a request
+        threading.Thread(target=self.shutdown).start()
+
+
+def serve(server):
+    """
+    Serves a database until a client sends the shutdown command or the process is interrupted or terminated. Then
+    the configuration file is written and the database is closed. It must be called from the main thread.
+
+    :param server: the DatabaseServer, already listening on its socket.
+    """
+    # A SIGTERM stops the server like Ctrl+C does, so the database is saved
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with server.lock.write():
+            write_database(server.db)
+            server.db.close()
@@ -0,0 +1,83 @@
+import os
+import pickle
+
+from .database import Database
+from .email import Email
+from .storage import file_signature, open_storage
+
+
+SNAPSHOT_VERSION = 3
+
+
+def write_snapshot(db, db_config=None):
+    """
+    Writes a binary snapshot of the database: the seed, the folders and the headers of every email together with
+    the offset where its body starts and the signature of the stored email. The snapshot must describe the same
+    state as the configuration file, so it should be written right after the configuration file is read or
+    written.
+
+    :param db: Database
+    :param db_config: Database Configuration
+    """
+    if db_config is None:
+        db_config = db.db_config
+    storage = db.storage if db_config is db.db_config else open_storage(db_config)
+
+    emails = []
+    for email in db.emails:
+        emails.append((email.id, email.sender, email.receiver, email.subject, email.date, email.body_offset,
+                       email.body_encoding, email.body_ref, storage.signature(email.id)))
+
+    snapshot = (
+        SNAPSHOT_VERSION,
+        file_signature(db_config.get_config_path()),
+        db.email_id_seed,
+        [(name, folder.get_email_ids()) for name, folder in db.folders.items()],
+        emails,
+    )
+
+    snapshot_path = db_config.get_snapshot_path()
+    with open(snapshot_path + ".tmp", 'wb') as f:
+        pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+
+
+def load_snapshot(db_config):
+    """
+    Loads the database from its binary snapshot. The emails are created without their bodies, which are read
+    from the storage the first time they are needed.
+
+    The snapshot is only used if the configuration file has the same modification time and size as when it was
+    written, and every stored email has the same signature.
+
+    :param db_config: Database Configuration
+    :return: Database object, or None if there is no snapshot or it is stale.
+    """
+    try:
+        with open(db_config.get_snapshot_path(), 'rb') as f:
+            version, config_signature, seed, folders, emails = pickle.loads(f.read())
+    except Exception:
+        # A truncated snapshot, or one written by another version of the classes, can fail to unpickle in many
+        # ways, and the database is then read from the configuration file
+        return None
+
+    if version != SNAPSHOT_VERSION or config_signature != file_signature(db_config.get_config_path()):
+        return None
+
+    db = Database(db_config, seed)
+    loaded = {}
+    for email_id, sender, receiver, subject, date, body_offset, body_encoding, body_ref, signature in emails:
+        if signature is None or signature != db.storage.signature(email_id):
+            return None
+        email = Email(email_id, sender, receiver, subject, date)
+        email.body_ref = body_ref
+        if not db.storage.attach_body(email, body_offset, db.body_cache):
+            return None
+        email.body_encoding = body_encoding
+        loaded[email_id] = email
+
+    for folder_name, email_ids in folders:
+        db.create_folder(folder_name)
+        for email_id in email_ids:
+            db.add_email(loaded[email_id], folder_name)
+    return db
@@ -0,0 +1,856 @@
+import hashlib
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import threading
+import zlib
+from functools import partial
+
+from .compression import Dictionary, compress, decompress, load_dictionary
+from .email import ENCODING_HEADER, REFERENCE_HEADER, Email, decode_body, parse_headers
+from .exceptions import MailManagerException
+from .locks import ReadWriteLock
+
+
+def file_signature(path):
+    """
+    Returns the modification time and the size of a file, used to detect if it has changed.
+
+    :param path: path of the file.
+    :return: a tuple with the modification time in nanoseconds and the size in bytes, or None if the file does
+     not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_email_file(path, email_id, lazy=False, body_cache=None):
+    """
+    Loads an email from its text file.
+
+    When lazy is True only the headers are parsed. The email remembers where its body starts in the file and reads
+    it the first time it is needed. If the body is stored apart, it is read from its body file instead.
+
+    :param path: path of the email file.
+    :param email_id: id of the email.
+    :param lazy: if True the body is not read until it is needed.
+    :param body_cache: optional BodyCache used by lazy emails to keep their bodies.
+    :return: the email.
+    """
+    email = Email(email_id=email_id)
+    with open(path, 'rb') as f:
+        offset = parse_headers(f, email)
+        if not lazy and email.body_ref is None:
+            data = f.read()
+
+    reference = email.body_ref
+    if reference is not None:
+        path = body_file_path(os.path.dirname(path), reference)
+        offset = 0
+    if lazy:
+        email.set_lazy_body(path, offset, body_cache)
+        return email
+
+    if reference is not None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    encoding = email.body_encoding
+    if encoding is not None:
+        data = decompress(data, encoding, os.path.dirname(path))
+    email.body = decode_body(data)
+    email.body_offset = offset
+    email.body_encoding = encoding
+    email.body_ref = reference
+    return email
+
+
+def stored_body(email, offset, encoding):
+    """
+    Records where the body of an email that has just been written starts in the stored email, and its encoding,
+    so a snapshot written afterwards can make it be read on demand. Lazy emails keep the location they are read
+    from.
+
+    :param email: the written email.
+    :param offset: number of bytes of the stored headers.
+    :param encoding: compression of the stored body, or None.
+    """
+    if email.body_path is None:
+        email.body_offset = offset
+        email.body_encoding = encoding
+
+
+def body_file_path(directory, reference):
+    """
+    Returns the path of the file where a FileStorage keeps a body stored apart.
+
+    :param directory: email directory of the storage.
+    :param reference: reference of the body, the SHA-1 of its stored bytes.
+    :return: the path of the body file.
+    """
+    return os.path.join(directory, reference + ".body")
+
+
+def find_reference(data):
+    """
+    Returns the reference to the body written in the headers of a stored email, if there is one.
+
+    :param data: stored bytes of the email.
+    :return: the reference, or None if the body is stored with the email.
+    """
+    header = b"\n" + REFERENCE_HEADER.encode()
+    start = data.find(header, 0, data.find(b"\n\n") + 1)
+    if start < 0:
+        return None
+    start += len(header)
+    return sys.intern(data[start:data.index(b"\n", start)].decode())
+
+
+def open_storage(db_config):
+    """
+    Creates the storage selected by the database configuration.
+
+    :param db_config: Database Configuration
+    :return: a FileStorage or a PackStorage.
+    """
+    if db_config.storage == "pack":
+        return PackStorage(db_config)
+    return FileStorage(db_config)
+
+
+class Storage:
+    """
+    Base class of the storages, with the compression and the deduplication of the bodies they share.
+
+    When the configuration enables compression, the headers of every email are still written as text, followed
+    by an X-Body-Encoding header with the encoding of the body, so loading only the headers doesn't need to
+    decompress anything. Bodies that don't get smaller are written uncompressed. With a trained dictionary, bodies
+    smaller than the dictionary threshold are compressed with it.
+
+    When the configuration enables deduplication, the (possibly compressed) body is stored apart, addressed by the
+    SHA-1 of its bytes, and the email only has an X-Body-Ref header with that reference. Emails with identical
+    bodies then share a single stored copy. A body is kept while some email refers to it, and reclaimed by compact
+    once none does.
+    """
+
+    def __init__(self, db_config):
+        """
+        :param db_config: Database Configuration
+        """
+        self.db_config = db_config
+        self.directory = db_config.email_dir
+        self.compression = db_config.compression
+        self.deduplicate = db_config.deduplicate_bodies
+        self.dictionary = None
+        if db_config.compression_dictionary:
+            self.dictionary = load_dictionary(self.directory)
+
+    def encode(self, email):
+        """
+        Returns the bytes stored for an email: its text, with the body compressed if the storage compresses them,
+        or only its headers if the storage deduplicates bodies. In that case the body is stored apart with
+        store_body, and its reference is kept in the body_ref attribute of the email.
+
+        The email is told where its body starts in the stored bytes and how it is encoded (see stored_body).
+
+        :param email: the email.
+        :return: the bytes of the email.
+        """
+        headers = Email.header_template.format(email)
+        body = str(email.body).encode()
+        encoding = None
+        if self.compression is not None:
+            data = (email.body or "").encode()
+            dictionary = self.dictionary
+            if dictionary is not None and len(data) > self.db_config.dictionary_threshold:
+                dictionary = None
+            data, encoding = compress(data, self.compression, self.db_config.compression_level, dictionary)
+            if len(data) < len(body):
+                headers += ENCODING_HEADER + encoding + "\n"
+                body = data
+            else:
+                encoding = None
+
+        email.body_ref = None
+        if self.deduplicate:
+            email.body_ref = self.store_body(body)
+            headers += REFERENCE_HEADER + email.body_ref + "\n"
+            body = b""
+        headers = (headers + "\n").encode()
+        stored_body(email, len(headers), encoding)
+        return headers + body
+
+    def store_body(self, data):
+        """
+        Stores a body apart, unless an identical one is already stored.
+
+        :param data: stored bytes of the body.
+        :return: the reference of the body, the SHA-1 of its bytes.
+        """
+        raise NotImplementedError
+
+    def body_size(self, reference):
+        """
+        Returns the number of bytes of a body stored apart.
+
+        :param reference: reference of the body.
+        :return: the size, or None if the body is not stored.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Returns the size of the storage.
+
+        :return: a dictionary with the statistics the storage keeps, empty by default.
+        """
+        return {}
+
+    def train_dictionary(self, emails, size=32 * 1024):
+        """
+        Trains a compression dictionary with the bodies smaller than the dictionary threshold of the given emails,
+        and uses it for the emails written from now on. Emails written with other dictionaries can still be read.
+
+        :param emails: iterable of sample emails.
+        :param size: maximum size of the dictionary in bytes.
+        :return: the Dictionary, or None if the samples have nothing in common.
+        """
+        threshold = self.db_config.dictionary_threshold
+        samples = [body for body in ((email.body or "").encode() for email in emails) if len(body) <= threshold]
+        dictionary = Dictionary.train(samples, size)
+        if dictionary is not None:
+            dictionary.save(self.directory)
+            self.dictionary = dictionary
+        return dictionary
+
+
+class FileStorage(Storage):
+    """
+    Storage that keeps every email in its own text file of the email directory, the original emailDB layout.
+    """
+
+    def load(self, email_id, lazy=False, body_cache=None):
+        """
+        Loads an email.
+
+        :param email_id: id of the email.
+        :param lazy: if True the body is not read until it is needed.
+        :param body_cache: optional BodyCache used by lazy emails to keep their bodies.
+        :return: the email.
+        """
+        return read_email_file(self.db_config.get_email_path(email_id), email_id, lazy, body_cache)
+
+    def load_emails(self, email_ids, lazy=False):
+        """
+        Loads several emails. If the configuration sets a number of load workers, the email files are read and
+        parsed concurrently on a thread or process pool.
+
+        :param email_ids: list of email ids to be loaded.
+        :param lazy: if True the bodies are not read until they are needed.
+        :return: the list of loaded emails, in the same order as the ids.
+        """
+        db_config = self.db_config
+        load = partial(read_email_file, lazy=lazy)
+        paths = [db_config.get_email_path(email_id) for email_id in email_ids]
+        if not db_config.load_workers or len(email_ids) < 2:
+            return list(map(load, paths, email_ids))
+
+        # Imported here, the executors pull in multiprocessing and most loads don't use them
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        if db_config.load_mode == "processes":
+            executor = ProcessPoolExecutor(max_workers=db_config.load_workers)
+            chunksize = max(1, len(email_ids) // (db_config.load_workers * 4))
+        else:
+            executor = ThreadPoolExecutor(max_workers=db_config.load_workers)
+            chunksize = 1
+        with executor:
+            return list(executor.map(load, paths, email_ids, chunksize=chunksize))
+
+    def write(self, email):
+        """
+        Writes an email, replacing the previous version if there is one. The email is written to a temporary file
+        that then replaces the previous one, so a lazy body read from that file is read before it changes, and a
+        crash doesn't leave half an email.
+
+        :param email: email to be written.
+        """
+        path = self.db_config.get_email_path(email.id)
+        if self.compression is None and not self.deduplicate:
+            email.body_ref = None
+            text = str(email)
+            with open(path + ".tmp", 'w') as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
+            stored_body(email, len((Email.header_template.format(email) + "\n").encode()), None)
+        else:
+            data = self.encode(email)
+            with open(path + ".tmp", 'wb') as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+
+    def store_body(self, data):
+        """
+        Stores a body apart in a <reference>.body file, unless an identical one is already stored.
+
+        :param data: stored bytes of the body.
+        :return: the reference of the body, the SHA-1 of its bytes.
+        """
+        reference = hashlib.sha1(data).hexdigest()
+        path = body_file_path(self.directory, reference)
+        if not os.path.exists(path):
+            with open(path + ".tmp", 'wb') as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        return reference
+
+    def body_size(self, reference):
+        """
+        Returns the number of bytes of a body stored apart.
+
+        :param reference: reference of the body.
+        :return: the size, or None if the body is not stored.
+        """
+        signature = file_signature(body_file_path(self.directory, reference))
+        return signature[1] if signature is not None else None
+
+    def delete(self, email_id):
+        """
+        Deletes an email. It raises a MailManagerException if the email is not stored. A body stored apart is kept
+        until compact, it may be shared with other emails.
+
+        :param email_id: id of the email.
+        """
+        path = self.db_config.get_email_path(email_id)
+        if os.path.exists(path):
+            os.remove(path)
+        else:
+            raise MailManagerException("There is no file with that id")
+
+    def signature(self, email_id):
+        """
+        Returns a value that changes whenever the stored email changes, used to validate snapshots.
+
+        :param email_id: id of the email.
+        :return: the signature, or None if the email is not stored.
+        """
+        return file_signature(self.db_config.get_email_path(email_id))
+
+    def attach_body(self, email, offset, body_cache=None):
+        """
+        Makes the body of an email created from a snapshot to be read on demand from this storage.
+
+        :param email: the email.
+        :param offset: offset where the body starts, as it was when the snapshot was written.
+        :param body_cache: optional BodyCache where the read bodies are kept.
+        :return: True if the body can be read, False otherwise.
+        """
+        if offset is None:
+            return False
+        if email.body_ref is not None:
+            email.set_lazy_body(body_file_path(self.directory, email.body_ref), 0, body_cache)
+        else:
+            email.set_lazy_body(self.db_config.get_email_path(email.id), offset, body_cache)
+        return True
+
+    def compact(self):
+        """
+        Reclaims the space of deleted emails. Email files are removed as soon as the email is deleted, so only the
+        body files no email refers to are left to remove. They are found by reading the headers of every email
+        file of the directory.
+        """
+        names = os.listdir(self.directory)
+        bodies = [name for name in names if name.endswith(".body")]
+        if not bodies:
+            return
+        referenced = set()
+        for name in names:
+            if name.endswith(self.db_config.email_extension):
+                email = Email()
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    parse_headers(f, email)
+                referenced.add(email.body_ref)
+        for name in bodies:
+            if name[:-len(".body")] not in referenced:
+                os.remove(os.path.join(self.directory, name))
+
+    def close(self):
+        """
+        Releases the resources of the storage. Email files are never kept open, so there is nothing to do.
+        """
+
+
+class Segment:
+    """
+    Segment file of a PackStorage, mapped in memory the first time it is read. Views can be taken by several
+    threads at the same time.
+    """
+
+    def __init__(self, path, number):
+        """
+        :param path: path of the segment file.
+        :param number: number of the segment, which gives the order of the segments.
+        """
+        self.path = path
+        self.number = number
+        self.map = None
+        self.lock = threading.Lock()
+
+    def view(self, offset, length):
+        """
+        Returns a view of a range of the file, without copying it.
+
+        :param offset: first byte of the range.
+        :param length: number of bytes of the range.
+        :return: a memoryview of the range.
+        """
+        with self.lock:
+            self.ensure(offset + length)
+            return memoryview(self.map)[offset:offset + length]
+
+    def lines(self, start, end):
+        """
+        Iterates over the lines of a range of the file, as bytes.
+
+        :param start: first byte of the range.
+        :param end: byte where the range ends (not included).
+        """
+        with self.lock:
+            self.ensure(end)
+            data = self.map
+            # The view keeps the map open if another thread maps the file again while the lines are read
+            view = memoryview(data)
+        try:
+            while start < end:
+                newline = data.find(b'\n', start, end)
+                stop = end if newline < 0 else newline + 1
+                yield data[start:stop]
+                start = stop
+        finally:
+            view.release()
+
+    def ensure(self, size):
+        """
+        Makes sure the map covers at least the given number of bytes, mapping the file again if it has grown. The
+        lock must be held.
+
+        :param size: number of bytes that must be mapped.
+        """
+        if self.map is not None and len(self.map) >= size:
+            return
+        self.unmap()
+        with open(self.path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def unmap(self):
+        """
+        Closes the map of the file. If a view of it is still alive, the map is freed together with the last view.
+        """
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass
+            self.map = None
+
+
+class PackStorage(Storage):
+    """
+    Storage that appends the emails to a few large segment files instead of using a file per email.
+
+    Every email is written as a record with a small header (kind, length of the id, length of the data and CRC32 of
+    the data), followed by the id and by the same text an email file would contain. Writing an email again appends
+    a new record that replaces the old one, and deleting it appends a tombstone record. When the active segment
+    reaches the configured size a new one is started.
+
+    An offset index from email id to (segment, offset, length) is kept in memory and saved to disk when the storage
+    is closed. When the storage is opened, the records written after the index was saved are read from the end of
+    the segments, and a record left half written by a crash is cut off. Reads go through a memory map of the
+    segments, so bodies are decoded straight from the mapped pages.
+
+    Bodies stored apart are written as body records, with their reference in place of the id. The storage counts
+    the emails that refer to every body, and the bodies no email refers to are reclaimed with the rest.
+
+    Replaced and deleted records are only reclaimed by compact, which copies the live records into new segments.
+    Loads and reads hold the read side of a ReadWriteLock, and every change (writes, deletes, compact, close and
+    the training of a dictionary) its write side, so lazy bodies can be read and emails written by other threads
+    while the storage is compacted.
+    """
+
+    record = struct.Struct("<BHII")
+
+    MESSAGE = 1
+    TOMBSTONE = 2
+    BODY = 3
+
+    index_version = 2
+    segment_pattern = re.compile(r"^segment-(\d+)\.pack$")
+
+    def __init__(self, db_config):
+        """
+        Opens the storage kept in the email directory of the configuration, creating the directory if needed.
+
+        :param db_config: Database Configuration
+        """
+        os.makedirs(db_config.email_dir, exist_ok=True)
+        super().__init__(db_config)
+        self.segment_size = db_config.pack_segment_size
+        self.index = {}
+        self.bodies = {}
+        self.references = {}
+        self.reference_counts = {}
+        self.segments = {}
+        self.sizes = {}
+        self.garbage = 0
+        self.file = None
+        self.last_number = 0
+        self.lock = ReadWriteLock()
+        self._open()
+
+    def load(self, email_id, lazy=False, body_cache=None):
+        """
+        Loads an email.
+
+        :param email_id: id of the email.
+        :param lazy: if True the body is not read until it is needed.
+        :param body_cache: optional BodyCache used by lazy emails to keep their bodies.
+        :return: the email.
+        """
+        email = Email(email_id=email_id)
+        with self.lock.read():
+            number, start, length = self._entry(email_id)
+            offset = parse_headers(self.segments[number].lines(start, start + length), email)
+        email.set_lazy_body(self, offset, body_cache)
+        if not lazy:
+            encoding = email.body_encoding
+            reference = email.body_ref
+            email.body = email.read_body()
+            email.body_offset = offset
+            email.body_encoding = encoding
+            email.body_ref = reference
+        return email
+
+    def load_emails(self, email_ids, lazy=False):
+        """
+        Loads several emails. They are read from the memory maps of the segments, so no worker pool is used.
+
+        :param email_ids: list of email ids to be loaded.
+        :param lazy: if True the bodies are not read until they are needed.
+        :return: the list of loaded emails, in the same order as the ids.
+        """
+        return [self.load(email_id, lazy) for email_id in email_ids]
+
+    def read(self, email_id, offset=0):
+        """
+        Returns the stored text of an email from the given offset, without copying it. If the body of the email is
+        stored apart, the whole body is returned instead.
+
+        :param email_id: id of the email.
+        :param offset: offset in the text of the email.
+        :return: a memoryview of the text.
+        """
+        # The view stays valid after a compaction removes its segment, the map is freed with the last view
+        with self.lock.read():
+            reference = self.references.get(email_id)
+            if reference is not None:
+                number, start, length = self.bodies[reference]
+                return self.segments[number].view(start, length)
+            number, start, length = self._entry(email_id)
+            return self.segments[number].view(start + offset, length - offset)
+
+    def write(self, email):
+        """
+        Appends an email to the active segment, replacing the previous version if there is one.
+
+        :param email: email to be written.
+        """
+        # A body stored apart by encode must not be reclaimed by a compaction before the email refers to it
+        with self.lock.write():
+            data = self.encode(email)
+            self._append(PackStorage.MESSAGE, email.id, data, email.body_ref)
+
+    def store_body(self, data):
+        """
+        Appends a body record to the active segment, unless an identical body is already stored.
+
+        :param data: stored bytes of the body.
+        :return: the reference of the body, the SHA-1 of its bytes.
+        """
+        reference = hashlib.sha1(data).hexdigest()
+        with self.lock.write():
+            if reference not in self.bodies:
+                self._append(PackStorage.BODY, reference, data)
+        return reference
+
+    def body_size(self, reference):
+        """
+        Returns the number of bytes of a body stored apart.
+
+        :param reference: reference of the body.
+        :return: the size, or None if the body is not stored.
+        """
+        entry = self.bodies.get(reference)
+        return entry[2] if entry is not None else None
+
+    def delete(self, email_id):
+        """
+        Deletes an email by appending a tombstone. It raises a MailManagerException if the email is not stored.
+
+        :param email_id: id of the email.
+        """
+        with self.lock.write():
+            if email_id not in self.index:
+                raise MailManagerException("There is no file with that id")
+            self._append(PackStorage.TOMBSTONE, email_id, b"")
+
+    def signature(self, email_id):
+        """
+        Returns a value that changes whenever the stored email changes, used to validate snapshots.
+
+        :param email_id: id of the email.
+        :return: the signature, or None if the email is not stored.
+        """
+        return self.index.get(email_id)
+
+    def attach_body(self, email, offset, body_cache=None):
+        """
+        Makes the body of an email created from a snapshot to be read on demand from this storage.
+
+        :param email: the email.
+        :param offset: offset where the body starts in the email, as it was when the snapshot was written.
+        :param body_cache: optional BodyCache where the read bodies are kept.
+        :return: True if the body can be read, False otherwise.
+        """
+        if offset is None or email.id not in self.index:
+            return False
+        email.set_lazy_body(self, offset, body_cache)
+        return True
+
+    def stats(self):
+        """
+        Returns the size of the storage.
+
+        :return: a dictionary with the number of emails, bodies stored apart and segments, the bytes of the
+         segments and the bytes of replaced and deleted records and of unreferenced bodies that compact would
+         reclaim.
+        """
+        with self.lock.read():
+            unreferenced = sum(PackStorage.record.size + len(reference) + length
+                               for reference, (number, start, length) in self.bodies.items()
+                               if reference not in self.reference_counts)
+            return {
+                "emails": len(self.index),
+                "bodies": len(self.bodies),
+                "segments": len(self.segments),
+                "bytes": sum(self.sizes.values()),
+                "garbage_bytes": self.garbage + unreferenced,
+            }
+
+    def train_dictionary(self, emails, size=32 * 1024):
+        """
+        Trains a compression dictionary as Storage.train_dictionary does, without emails being written meanwhile.
+
+        :param emails: iterable of sample emails.
+        :param size: maximum size of the dictionary in bytes.
+        :return: the Dictionary, or None if the samples have nothing in common.
+        """
+        with self.lock.write():
+            return super().train_dictionary(emails, size)
+
+    def compact(self):
+        """
+        Copies the live records into new segments and removes the old ones, reclaiming the space of the replaced
+        and deleted emails. The new index is saved before the old segments are removed, so a crash in the middle
+        leaves either the old or the new segments in use.
+        """
+        with self.lock.write():
+            self._compact()
+
+    def _compact(self):
+        live = sorted(self.index.items(), key=lambda item: item[1][:2])
+        live_bodies = sorted(((reference, self.bodies[reference]) for reference in self.reference_counts),
+                             key=lambda item: item[1][:2])
+        references = self.references
+        old_segments = self.segments
+        self._close_file()
+        self.index = {}
+        self.bodies = {}
+        self.references = {}
+        self.reference_counts = {}
+        self.segments = {}
+        self.sizes = {}
+        self.garbage = 0
+
+        data = None
+        for reference, (number, start, length) in live_bodies:
+            data = old_segments[number].view(start, length)
+            self._append(PackStorage.BODY, reference, data)
+        for email_id, (number, start, length) in live:
+            data = old_segments[number].view(start, length)
+            self._append(PackStorage.MESSAGE, email_id, data, references.get(email_id))
+        del data
+        self._close_file()
+        self._write_index()
+
+        for segment in old_segments.values():
+            segment.unmap()
+            os.remove(segment.path)
+
+    def close(self):
+        """
+        Syncs the active segment, saves the offset index and unmaps the segments.
+        """
+        with self.lock.write():
+            self._close_file()
+            self._write_index()
+            for segment in self.segments.values():
+                segment.unmap()
+
+    def _entry(self, email_id):
+        entry = self.index.get(email_id)
+        if entry is None:
+            raise MailManagerException("There is no email with the id \'" + str(email_id) + "\'")
+        return entry
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, "segment-%06d.pack" % number)
+
+    def _index_path(self):
+        return os.path.join(self.directory, "pack.index")
+
+    def _open(self):
+        numbers = sorted(int(match.group(1)) for match in map(self.segment_pattern.match, os.listdir(self.directory))
+                         if match)
+
+        scanned = {}
+        saved = self._read_index()
+        if saved is not None:
+            sizes, index, garbage, bodies, references = saved
+            valid = all(number in numbers and os.path.getsize(self._segment_path(number)) >= size
+                        for number, size in sizes.items())
+            if valid:
+                self.index = index
+                self.garbage = garbage
+                self.bodies = bodies
+                self.references = references
+                for reference in references.values():
+                    self.reference_counts[reference] = self.reference_counts.get(reference, 0) + 1
+                scanned = sizes
+                # Segments older than the saved ones were left by a compaction that crashed before removing them
+                first = min(sizes) if sizes else (numbers[-1] + 1 if numbers else 1)
+                for number in [number for number in numbers if number < first]:
+                    os.remove(self._segment_path(number))
+                    numbers.remove(number)
+
+        for number in numbers:
+            self.segments[number] = Segment(self._segment_path(number), number)
+            self.sizes[number] = self._scan(number, scanned.get(number, 0))
+        if numbers:
+            self.last_number = numbers[-1]
+
+    def _read_index(self):
+        try:
+            with open(self._index_path(), 'rb') as f:
+                version, sizes, index, garbage, bodies, references = pickle.load(f)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+        if version != PackStorage.index_version:
+            return None
+        return sizes, index, garbage, bodies, references
+
+    def _write_index(self):
+        path = self._index_path()
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump((PackStorage.index_version, self.sizes, self.index, self.garbage, self.bodies,
+                         self.references), f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _scan(self, number, position):
+        """
+        Reads the records of a segment from the given position, adding them to the index. A truncated or corrupt
+        record at the end of the segment is cut off.
+
+        :return: the size of the segment.
+        """
+        path = self._segment_path(number)
+        header_size = PackStorage.record.size
+        with open(path, 'rb') as f:
+            f.seek(position)
+            while True:
+                header = f.read(header_size)
+                if len(header) < header_size:
+                    break
+                kind, id_length, length, checksum = PackStorage.record.unpack(header)
+                key = f.read(id_length)
+                data = f.read(length)
+                if len(key) < id_length or len(data) < length or zlib.crc32(data) != checksum or \
+                        kind not in (PackStorage.MESSAGE, PackStorage.TOMBSTONE, PackStorage.BODY):
+                    break
+                reference = find_reference(data) if kind == PackStorage.MESSAGE else None
+                self._apply(kind, key.decode(), number, position + header_size + id_length, length, reference)
+                position += header_size + id_length + length
+
+        if position < os.path.getsize(path):
+            os.truncate(path, position)
+        return position
+
+    def _append(self, kind, email_id, data, reference=None):
+        # The write lock must be held
+        if self.file is None or self.sizes[self.last_number] >= self.segment_size:
+            self._open_file()
+        number = self.last_number
+        key = email_id.encode()
+        self.file.write(PackStorage.record.pack(kind, len(key), len(data), zlib.crc32(data)))
+        self.file.write(key)
+        self.file.write(data)
+        self.file.flush()
+
+        start = self.sizes[number] + PackStorage.record.size + len(key)
+        self.sizes[number] = start + len(data)
+        self._apply(kind, email_id, number, start, len(data), reference)
+
+    def _apply(self, kind, email_id, number, start, length, reference=None):
+        if kind == PackStorage.BODY:
+            # A body is only written again if a crash lost the index entry of the first copy
+            old = self.bodies.get(email_id)
+            if old is not None:
+                self.garbage += PackStorage.record.size + len(email_id) + old[2]
+            self.bodies[email_id] = (number, start, length)
+            return
+
+        old = self.index.pop(email_id, None)
+        if old is not None:
+            self.garbage += PackStorage.record.size + len(email_id.encode()) + old[2]
+            old_reference = self.references.pop(email_id, None)
+            if old_reference is not None:
+                self.reference_counts[old_reference] -= 1
+                if not self.reference_counts[old_reference]:
+                    del self.reference_counts[old_reference]
+        if kind == PackStorage.MESSAGE:
+            self.index[email_id] = (number, start, length)
+            if reference is not None:
+                self.references[email_id] = reference
+                self.reference_counts[reference] = self.reference_counts.get(reference, 0) + 1
+        else:
+            self.garbage += PackStorage.record.size + len(email_id.encode())
+
+    def _open_file(self):
+        self._close_file()
+        if not self.segments or self.sizes[self.last_number] >= self.segment_size:
+            self.last_number += 1
+            self.segments[self.last_number] = Segment(self._segment_path(self.last_number), self.last_number)
+            self.sizes[self.last_number] = 0
+        self.file = open(self._segment_path(self.last_number), 'ab')
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
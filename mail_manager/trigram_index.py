@@ -0,0 +1,202 @@
+from array import array
+from bisect import bisect_left
+
+from .index import Index
+
+
+def trigrams(text):
+    """
+    Returns the set of trigrams (substrings of three characters) of a text.
+
+    :param text: text to be split, it can be None.
+    :return: the set of trigrams of the text.
+    """
+    if not text:
+        return set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex(Index):
+    """
+    Trigram index over the searchable fields of the emails (subject, sender, body and receiver).
+
+    Every trigram points to the sorted document numbers of the emails containing it, stored in an array of
+    unsigned integers. Any email that contains a text contains all the trigrams of that text, so intersecting
+    their posting lists gives the candidates of an exact substring search.
+
+    Removed emails are only marked as removed and are purged from the posting lists when they become a large part
+    of the index. If a memory limit is given, the longest posting lists are dropped when the limit is exceeded:
+    those trigrams are common enough to barely narrow a search, and they are ignored from then on.
+    """
+
+    fields = ("subject", "sender", "body", "receiver")
+
+    def __init__(self, memory_limit=None):
+        """
+        Initializes an empty index.
+
+        :param memory_limit: Maximum number of bytes used by the posting lists, defaults to no limit.
+        """
+        self.memory_limit = memory_limit
+        self.postings = {}
+        self.documents = {}
+        self.document_ids = {}
+        self.removed = set()
+        self.stopped = set()
+        self.next_document = 0
+        self.posting_count = 0
+
+    def add_email(self, email):
+        """
+        Indexes the given email. Emails that are already indexed are ignored.
+
+        :param email: email to be indexed.
+        """
+        self.add_emails((email,))
+
+    def add_emails(self, emails):
+        """
+        Indexes the given emails, checking the memory limit once all of them are indexed.
+
+        :param emails: emails to be indexed.
+        """
+        for email in emails:
+            self._add(email)
+
+        if self.memory_limit is not None and self.memory_usage() > self.memory_limit:
+            # Leave some headroom so the next emails don't trigger another shrink straight away
+            self.shrink(self.memory_limit * 9 // 10)
+
+    def _add(self, email):
+        if email.id in self.document_ids:
+            return
+
+        document = self.next_document
+        self.next_document += 1
+        self.documents[document] = email
+        self.document_ids[email.id] = document
+
+        email_trigrams = set()
+        for field in TrigramIndex.fields:
+            email_trigrams.update(trigrams(getattr(email, field)))
+        email_trigrams.difference_update(self.stopped)
+
+        for trigram in email_trigrams:
+            posting = self.postings.get(trigram)
+            if posting is None:
+                posting = self.postings[trigram] = array("I")
+            posting.append(document)
+        self.posting_count += len(email_trigrams)
+
+    def remove_email(self, email):
+        """
+        Removes the given email from the index. Emails that are not indexed are ignored.
+
+        :param email: email to be removed.
+        """
+        self.remove_emails((email,))
+
+    def remove_emails(self, emails):
+        """
+        Removes the given emails from the index, compacting it at most once. Emails that are not indexed are
+        ignored.
+
+        :param emails: emails to be removed.
+        """
+        for email in emails:
+            document = self.document_ids.pop(email.id, None)
+            if document is not None:
+                del self.documents[document]
+                self.removed.add(document)
+        if len(self.removed) > len(self.documents):
+            self.compact()
+
+    def candidates(self, text):
+        """
+        Returns the emails that contain every trigram of the text. The result is a superset of the real matches,
+        so every candidate still has to be checked with the substring search.
+
+        :param text: text to be searched.
+        :return: the list of candidate emails in database order, or None if the text is shorter than three
+         characters or all its trigrams have been dropped from the index.
+        """
+        text_trigrams = trigrams(text)
+        text_trigrams.difference_update(self.stopped)
+        if not text_trigrams:
+            return None
+
+        postings = []
+        for trigram in text_trigrams:
+            posting = self.postings.get(trigram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        found = []
+        for document in postings[0]:
+            if document in self.removed:
+                continue
+            for posting in postings[1:]:
+                position = bisect_left(posting, document)
+                if position == len(posting) or posting[position] != document:
+                    break
+            else:
+                found.append(self.documents[document])
+        return found
+
+    def compact(self):
+        """
+        Purges the removed emails from the posting lists.
+        """
+        if not self.removed:
+            return
+
+        removed = self.removed
+        self.posting_count = 0
+        for trigram in list(self.postings):
+            posting = array("I", (document for document in self.postings[trigram] if document not in removed))
+            if posting:
+                self.postings[trigram] = posting
+                self.posting_count += len(posting)
+            else:
+                del self.postings[trigram]
+        self.removed = set()
+
+    def shrink(self, memory_limit):
+        """
+        Drops the longest posting lists until the index fits in the given number of bytes. The dropped trigrams
+        are not indexed anymore.
+
+        :param memory_limit: Maximum number of bytes used by the posting lists.
+        """
+        self.compact()
+        itemsize = array("I").itemsize
+        for trigram in sorted(self.postings, key=lambda key: len(self.postings[key]), reverse=True):
+            if self.posting_count * itemsize <= memory_limit:
+                break
+            self.posting_count -= len(self.postings.pop(trigram))
+            self.stopped.add(trigram)
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes used by the posting lists.
+
+        :return: the size of the posting lists in bytes.
+        """
+        return self.posting_count * array("I").itemsize
+
+    def stats(self):
+        """
+        Returns a summary of the size of the index.
+
+        :return: a dictionary with the number of emails, trigrams, stored postings, dropped trigrams and the bytes
+         used by the posting lists.
+        """
+        return {
+            "emails": len(self.documents),
+            "trigrams": len(self.postings),
+            "postings": self.posting_count,
+            "stopped_trigrams": len(self.stopped),
+            "posting_bytes": self.memory_usage(),
+        }
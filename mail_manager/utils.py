@@ -3,56 +3,44 @@ import re
 import logging
 
 from .database import Database, DatabaseConfiguration
-from .email import Email
 from .exceptions import MailManagerException
+from .journal import Journal
+from .snapshot import load_snapshot, write_snapshot
+from .storage import open_storage, read_email_file
 
 
-def load_email(email_dir, email_id, email_extension='.txt'):
+def load_email(email_dir, email_id, email_extension='.txt', lazy=False, body_cache=None):
     """
     This function loads the corresponding email object from an email text file.
 
+    When lazy is True only the headers are parsed. The email remembers where its body starts in the file and reads
+    it the first time it is needed.
+
+    Senders and receivers are interned, so every email from the same address shares the same string.
+
     :param email_dir: path of the email
     :param email_id:
     :param email_extension:
+    :param lazy: if True the body is not read until it is needed.
+    :param body_cache: optional BodyCache used by lazy emails to keep their bodies.
     :return: it returns an email object
     """
 
-    f = open(os.path.join(email_dir, str(email_id) + email_extension), 'r')
-    email = Email(email_id=email_id)
-    line = f.readline()
-    start_body = False
-    while line:
-        if start_body:
-            if not email.body:
-                email.body = line
-            else:
-                email.body += line
-        if line.startswith('Date: '):
-           email.date = line[6:len(line)].strip('\n')
-        elif line.startswith('From: '):
-           email.sender = line[6:len(line)].strip('\n')
-        elif line.startswith('To: '):
-            email.receiver = line[4:len(line)].strip('\n')
-        elif line.startswith('Subject: '):
-            email.subject = line[9:len(line)].strip('\n')
-        elif line.startswith('\n'):
-            start_body = True
-        line = f.readline()
-
-    return email
+    path = os.path.join(email_dir, str(email_id) + email_extension)
+    return read_email_file(path, email_id, lazy, body_cache)
 
 
 def write_email(email, db, db_config=None):
     """
-    This function writes the email text file corresponding to a given email object.
+    This function writes the email text file corresponding to a given email object, or appends the email to the
+    segment files if the database uses the pack storage.
 
     :param email: email
     :param db: Database
     :param db_config: Database Configuration
     """
-    f = open(os.path.join(db_config.email_dir, str(email.id) + db_config.email_extension), 'w')
-    f.write(str(email))
-    f.close()
+    with db.locked():
+        get_storage(db, db_config).write(email)
 
 
 def delete_email(email, db, db_config=None):
@@ -63,14 +51,71 @@ def delete_email(email, db, db_config=None):
     :param db: Database
     :param db_config: Database Configuration
     """
+    with db.locked():
+        get_storage(db, db_config).delete(email.id)
 
-    if db_config is None:
-        db_config = db.db_config
-    path = os.path.join(db_config.email_dir, email.id + db_config.email_extension)
-    if os.path.exists(path):
-        os.remove(path)
-    else:
-        raise MailManagerException("There is no file with that id")
+
+def get_storage(db, db_config=None):
+    """
+    Returns the storage of the emails for the given configuration, which is the one of the database unless a
+    different configuration is provided.
+
+    :param db: Database
+    :param db_config: Database Configuration
+    :return: a FileStorage or a PackStorage.
+    """
+    if db_config is None or db_config is db.db_config:
+        return db.storage
+    return open_storage(db_config)
+
+
+def read_config(config_path):
+    """
+    Reads an Email Config File (text file) without loading any email.
+
+    It raises a MailManagerException if it finds an invalid configuration format.
+
+    :param config_path: path of the configuration file.
+    :return: a tuple with the email id seed and the list of folders, each one as a tuple with the folder name and
+     the list of its email ids, in the order they appear in the file.
+    """
+    folders = []
+    with open(config_path, 'r') as f:
+        text = f.read()
+    try:
+        # The file is split in blocks separated by blank lines, and every block in lines, instead of walking the
+        # lines one by one, as configuration files of big databases have a line per email
+        start = 0 if text.startswith('Message-ID: ') else text.index('\nMessage-ID: ') + 1
+        end = text.find('\n', start)
+        seed = int(text[start + 12:end if end >= 0 else len(text)])
+        start = text.index('\nFolders:', end - 1) + 1
+        start = text.index('\n', start) + 1
+
+        for block in text[start:].split('\n\n'):
+            lines = block.split('\n')
+            if lines[0].endswith("Messages:"):
+                email_ids = list(map(str.strip, lines[1:]))
+                if email_ids and not email_ids[-1]:
+                    email_ids.pop()
+                folders.append((lines[0][0:len(lines[0]) - 9].strip(), email_ids))
+    except:
+        raise MailManagerException("Invalid configuration file")
+    return seed, folders
+
+
+def load_emails(db_config, email_ids, storage=None):
+    """
+    Loads the emails with the given ids. If the configuration sets a number of load workers, the email files are
+    read and parsed concurrently on a thread or process pool.
+
+    :param db_config: Database Configuration
+    :param email_ids: list of email ids to be loaded.
+    :param storage: storage of the emails, defaults to the one selected by the configuration.
+    :return: the list of loaded emails, in the same order as the ids.
+    """
+    if storage is None:
+        storage = open_storage(db_config)
+    return storage.load_emails(email_ids, db_config.lazy_bodies)
 
 
 def load_database(db_config):
@@ -80,55 +125,198 @@ def load_database(db_config):
     information found there (folders, emails etc...). For that purpose you will need to make use of the load_email
     function.
 
-    It raises a MailManagerException if it finds an invalid configuration format.
+    If the configuration enables snapshots and there is an up to date one, the database is loaded from it.
+    Otherwise the configuration file is read first, then every email is loaded once, even if it belongs to several
+    folders, and finally the folders are filled in the order of the file.
+
+    The journal, if the configuration enables it, is read before anything else: the files of the emails it
+    removes may have been deleted since the configuration file was written (see read_database).
 
-    This is going to be a long function. Please, try to use as many functions as you can to encapsulate your code in a
-    meaningul way.
+    It raises a MailManagerException if it finds an invalid configuration format.
 
     :param db_config:
     :return: Database object
     """
-    with open(db_config.get_config_path(), 'r') as f:
+    entries = None
+    if db_config.journal:
+        entries = Journal(db_config.get_journal_path(), db_config.journal_sync_every).read()
+
+    db = None
+    if db_config.snapshot:
+        db = load_snapshot(db_config)
+    if db is None:
+        db = read_database(db_config, entries)
+        if db_config.snapshot:
+            write_snapshot(db, db_config)
+
+    if db_config.journal:
+        open_journal(db, entries)
+    return db
+
+
+def read_database(db_config, journal_entries=None):
+    """
+    Creates a Database object from the configuration file and the email files.
+
+    The emails removed by the journal that is going to be replayed over the database may have lost their files.
+    Those emails are left out of the database instead of making the load fail, as the journal removes them anyway.
+
+    It raises a MailManagerException if it finds an invalid configuration format.
+
+    :param db_config: Database Configuration
+    :param journal_entries: entries of the journal of the database, if it has one.
+    :return: Database object
+    """
+    seed, folders = read_config(db_config.get_config_path())
+    db = Database(db_config, seed)
+    missing = {email_id for email_id in replay_folders(folders, journal_entries or [])[1]
+               if db.storage.signature(email_id) is None}
+    try:
+        email_ids = list(dict.fromkeys(email_id for _, folder_ids in folders for email_id in folder_ids
+                                       if email_id not in missing))
+        emails = {}
+        for email in load_emails(db_config, email_ids, db.storage):
+            if email.body_path is not None:
+                email.body_cache = db.body_cache
+            emails[email.id] = email
+
+        for folder_name, folder_ids in folders:
+            folder = db.create_folder(folder_name)
+            for email_id in folder_ids:
+                if email_id not in missing:
+                    db.add_email(emails[email_id], folder)
+    except:
+        raise MailManagerException("Invalid configuration file")
+
+    if not ('Inbox' or 'OutBox') in db.folders:
+        raise MailManagerException("Invalid configuration file")
+    return db
+
+
+def replay_folders(folders, entries):
+    """
+    Applies the entries of a journal to the folders read from a configuration file, without loading any email.
+
+    :param folders: list of folders of the configuration file, as returned by read_config.
+    :param entries: list of journal entries.
+    :return: a tuple with a dictionary from folder name to the set of ids of its emails, and the set of ids of the
+     emails that the journal removes from a folder or from the database, including the emails of the folders it
+     removes.
+    """
+    folder_ids = {folder_name: set(email_ids) for folder_name, email_ids in folders}
+    removed = set()
+    for entry in entries:
+        operation, args = entry[0], entry[1:]
+        try:
+            if operation == "create_folder":
+                folder_ids.setdefault(args[0], set())
+            elif operation == "remove_folder":
+                removed.update(folder_ids.pop(args[0], ()))
+            elif operation == "add_email":
+                folder_ids.setdefault(args[1], set()).add(args[0])
+            elif operation == "remove_email":
+                for email_ids in (folder_ids.values() if not args[1] else [folder_ids.get(args[1], set())]):
+                    email_ids.discard(args[0])
+                removed.add(args[0])
+            elif operation == "add_emails":
+                folder_ids.setdefault(args[0], set()).update(args[1])
+            elif operation == "remove_emails":
+                for email_ids in (folder_ids.values() if not args[0] else [folder_ids.get(args[0], set())]):
+                    email_ids.difference_update(args[1])
+                removed.update(args[1])
+            elif operation == "move_emails":
+                folder_ids.get(args[0], set()).difference_update(args[2])
+                folder_ids.setdefault(args[1], set()).update(args[2])
+        except (IndexError, TypeError):
+            continue
+    return folder_ids, removed
+
+
+def replay_journal(db, entries):
+    """
+    Applies the entries of a journal to a database. Entries that can't be applied anymore, like adding an email
+    whose file has been deleted, are skipped.
+
+    :param db: Database
+    :param entries: list of journal entries, each one with the operation name followed by its arguments.
+    """
+    db_config = db.db_config
+    for entry in entries:
+        operation, args = entry[0], entry[1:]
         try:
-            line = f.readline()
-            while not line.startswith('Message-ID: '):
-                line = f.readline()
-            db = Database(db_config, int(line[12:]))
-
-            while not line.startswith('Folders:'):
-                line = f.readline()
-            line = f.readline()
-
-            inside_folder = False
-            while line:
-                if line == "\n":
-                    inside_folder = False
-                if inside_folder:
-                    email = load_email(db_config.email_dir, line.strip(), db_config.email_extension)
-                    db.add_email(email, folder)
-                if line.endswith("Messages:\n"):
-                    folder = db.create_folder(line[0:len(line) - 10].strip())
-                    inside_folder = True
-                line = f.readline()
-            f.close()
-            if not ('Inbox' or 'OutBox') in db.folders:
-                raise MailManagerException("Invalid configuration file")
-            return db
-        except:
-            raise MailManagerException("Invalid configuration file")
+            if operation == "create_folder":
+                if args[0] not in db.folders:
+                    db.create_folder(args[0])
+            elif operation == "remove_folder":
+                if args[0] in db.folders:
+                    db.remove_folder(args[0])
+            elif operation == "add_email":
+                email = db.get_email(args[0])
+                if email is None:
+                    email = db.storage.load(args[0], db_config.lazy_bodies, db.body_cache)
+                db.add_email(email, args[1])
+            elif operation == "remove_email":
+                email = db.get_email(args[0])
+                if email is not None and (not args[1] or args[0] in db.folders.get(args[1], ())):
+                    db.remove_email(email, args[1])
+            elif operation == "add_emails":
+                emails = []
+                for email_id in args[1]:
+                    email = db.get_email(email_id)
+                    if email is None:
+                        try:
+                            email = db.storage.load(email_id, db_config.lazy_bodies, db.body_cache)
+                        except (MailManagerException, OSError):
+                            logging.warning("Skipping email %s of journal entry %s", email_id, entry[:2])
+                            continue
+                    emails.append(email)
+                db.add_emails(emails, args[0])
+            elif operation == "remove_emails":
+                db.remove_emails(args[1], args[0])
+            elif operation == "move_emails":
+                db.move_emails(args[2], args[0], args[1])
+            elif operation == "seed":
+                db.email_id_seed = args[0]
+        except (MailManagerException, OSError):
+            logging.warning("Skipping journal entry %s", entry)
+
+
+def open_journal(db, entries=None):
+    """
+    Replays the journal of the database over the state loaded from the configuration file, and starts recording
+    the new changes in it. If the journal has grown past the compaction threshold, it is folded into a new
+    configuration file.
+
+    :param db: Database
+    :param entries: entries of the journal, if they have been read already.
+    """
+    journal = Journal(db.db_config.get_journal_path(), db.db_config.journal_sync_every)
+    if entries is None:
+        entries = journal.read()
+    replay_journal(db, entries)
+
+    db.journal = journal
+    if len(entries) >= db.db_config.journal_compact_threshold:
+        db.checkpoint()
+    else:
+        journal.open()
 
 
 def write_database(db, db_config=None):
     """
     Writes the corresponding Email Config File (text file) from a given Database
 
+    The file is written next to the old one and then moved over it, so a crash never leaves a half written
+    configuration. Once it is written, the journal of the database is emptied.
+
     :param db: Database
     :param db_config: Database Configuration
     """
     if db_config is None:
         db_config = db.db_config
 
-    with open(db_config.get_config_path(), 'w') as f:
+    config_path = db_config.get_config_path()
+    with open(config_path + ".tmp", 'w') as f:
         f.write("Message-ID: " + str(db.email_id_seed) + '\n\n')
         f.write("Folders:\n")
         for k in db.get_folder_names():
@@ -139,4 +327,12 @@ def write_database(db, db_config=None):
             for e in db.get_email_ids(k):
                 f.write(e + '\n')
         f.write("\nEnd\n")
-        f.close()
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(config_path + ".tmp", config_path)
+
+    if db_config.snapshot:
+        write_snapshot(db, db_config)
+
+    if db.journal is not None and db_config is db.db_config:
+        db.journal.truncate()
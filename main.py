@@ -1,12 +1,19 @@
-import logging
-import datetime
+import argparse
+import os
 import sys
 
-from mail_manager import utils
-from mail_manager.database import Database, DatabaseConfiguration
-from mail_manager.email import Email
-from mail_manager.exceptions import MailManagerException
-from mail_manager.linked_list import LinkedList
+# The modules of mail_manager are imported by the functions that use them, so a subcommand only pays for the
+# modules it needs and starts quickly.
+
+DATABASE_OPTIONS = dict(journal=True, snapshot=True)
+
+# Subcommands don't keep the database open, so they skip the in-memory indexes, which are rebuilt on every load,
+# and read the bodies only when they need them.
+COMMAND_OPTIONS = dict(journal=True, snapshot=True, lazy_bodies=True)
+
+# While 'main.py serve' is running, the other subcommands are sent to it through this socket of the database
+# directory instead of loading the database.
+SOCKET_NAME = "mail-manager.sock"
 
 
 def read_int_option(message, start, end):
@@ -33,33 +40,33 @@ def read_int_option(message, start, end):
     return option
 
 
-def choose_email(email_ids):
+def choose_email(emails):
     """
     Shows the emails contained in the database and asks the user to choose one
 
-    :param email_ids: list of email ids
+    :param emails: indexed linked list of emails, the chosen one is accessed by position without copying the list
     :return: the email id chosen by the user
     """
 
     email_id = None
-    if not email_ids:
+    if not emails:
         print("There are no emails in the database yet.")
 
     else:
         print("The database contains the following emails:")
-        for idx, email_id in enumerate(email_ids):
-            print("  {}. {}".format(idx + 1, email_id))
+        for idx, email in enumerate(emails):
+            print("  {}. {}".format(idx + 1, email.id))
 
         email_id = None
         cancel = False
         while not cancel and not email_id:
-            option = read_int_option("Choose an email: (0 to cancel)\n", 0, len(email_ids) + 1)
+            option = read_int_option("Choose an email: (0 to cancel)\n", 0, len(emails) + 1)
 
-            if option > len(email_ids):
+            if option is None or option > len(emails):
                 print("Invalid option, try again.")
 
             elif option:
-                email_id = email_ids[option - 1]
+                email_id = emails[option - 1].id
 
             elif option == 0:
                 cancel = True
@@ -128,7 +135,7 @@ def show_email(db):
     :param db: An email database.
     """
 
-    email_id = choose_email(db.get_email_ids())
+    email_id = choose_email(db.emails)
     if email_id is not None:
         print(db.get_email(email_id))
 
@@ -154,9 +161,11 @@ def create_email(db):
     while line != "EOF":
         body += line + '\n'
         line = input()
-    date = datetime.datetime.utcnow()
+    from email.utils import formatdate
+    from mail_manager import utils
+    from mail_manager.email import Email
 
-    email = Email(str(db.email_id_seed) + "EDA1email", sender, receiver, subject, date.strftime("%a, %d %Y %X + +0100 (CET)"), body)
+    email = Email(str(db.email_id_seed) + "EDA1email", sender, receiver, subject, formatdate(localtime=True), body)
 
     utils.write_email(email, db, db.db_config)
 
@@ -171,7 +180,9 @@ def delete_email(db):
 
     :param db: An email database.
     """
-    email_id = choose_email(db.get_email_ids())
+    from mail_manager import utils
+
+    email_id = choose_email(db.emails)
     if email_id is not None:
         email = db.get_email(email_id)
         db.remove_email(email)
@@ -237,12 +248,11 @@ def add_email_to_folder(db):
 
     :param db: An email database.
     """
-    email_id = choose_email(db.get_email_ids())
+    email_id = choose_email(db.emails)
     if email_id is not None:
         folder_name = choose_folder(db.folders)
         if folder_name is not None:
-            db.folders[folder_name].append(db.get_email(email_id))
-            db.get_email(email_id).references += 1
+            db.add_email(db.get_email(email_id), folder_name)
 
 
 def remove_email_from_folder(db):
@@ -255,18 +265,18 @@ def remove_email_from_folder(db):
     """
 
     folder = choose_folder(db.folders)
-    emails = db.get_email_ids(folder)
     if folder is not None:
+        emails = db.folders[folder].emails
         print("The folder contains the following emails:")
-        for idx, email_id in enumerate(emails):
-            print("  {}. {}".format(idx + 1, email_id))
+        for idx, email in enumerate(emails):
+            print("  {}. {}".format(idx + 1, email.id))
 
         email_id = None
         cancel = False
         while not cancel and not email_id:
-            option = read_int_option("Choose an email: (0 to cancel)\n", 0, len(emails) + 1)
+            option = read_int_option("Choose an email: (0 to cancel)\n", 0, len(emails))
             if option:
-                email_id = emails[option - 1]
+                email_id = emails[option - 1].id
 
             elif option == 0:
                 cancel = True
@@ -277,9 +287,7 @@ def remove_email_from_folder(db):
                 print("Invalid option, try again.")
 
         email = db.get_email(email_id)
-        db.remove_email(email, folder)
-        db.get_email(email_id).references -= 1
-        if email.references == 0:
+        if db.remove_email(email, folder) == 0:
             db.remove_email(email)
 
 
@@ -291,8 +299,34 @@ def search(db):
     :param db: An email database.
     """
     search_text = input("What do you want to search?\n")
-    founds = db.search(search_text)
+    print_founds(db.search(search_text))
+
+
+def query_search(db):
+    """
+    Ask the user for a query and searches the emails that match it, showing them. The query syntax is described
+    in mail_manager.query.parse_query. An invalid query is reported without leaving the menu.
+
+    :param db: An email database.
+    """
+    from mail_manager.exceptions import MailManagerException
+
+    search_text = input("What do you want to search? (from:, to:, subject: and body: search a single field, and "
+                        "terms can be joined with AND and OR)\n")
+    try:
+        founds = db.query(search_text)
+    except MailManagerException as mme:
+        print(mme)
+        return
+    print_founds(founds)
+
+
+def print_founds(founds):
+    """
+    Shows a line for every email found by a search.
 
+    :param founds: linked list of the emails found.
+    """
     if len(founds) > 0:
         current = founds.first
         i = 1
@@ -313,6 +347,8 @@ def show_menu(db):
 
     :param db: An email database.
     """
+    from mail_manager.exceptions import MailManagerException
+
     options = [
         {"message": "Exit", "function": None},
         {"message": "List emails", "function": list_emails},
@@ -325,6 +361,7 @@ def show_menu(db):
         {"message": "Add email to folder", "function": add_email_to_folder},
         {"message": "Remove email from folder", "function": remove_email_from_folder},
         {"message": "Search", "function": search},
+        {"message": "Search with a query", "function": query_search},
     ]
 
     exit_program = False
@@ -347,6 +384,7 @@ def show_menu(db):
             option_function = options[option]["function"]
             try:
                 option_function(db)
+                db.commit()
 
             except MailManagerException as mme:
                 print("Error: {}", mme)
@@ -367,14 +405,29 @@ def show_inbox(db):
         print(emails)
 
 
-def main():
+def index_options(args):
     """
-    MAIN function of the email manager.
+    Returns the options of the configuration that enable the indexes asked for on the command line. The indexes
+    are built on every load and read every body, so they are only worth it for sessions that search a lot.
+
+    :param args: parsed command line arguments.
+    :return: a dictionary of DatabaseConfiguration options.
+    """
+    return dict(search_index=args.search_index, trigram_index=args.trigram_index, address_index=args.address_index)
+
+
+def run_session(args):
     """
+    Loads the database, shows the menu until the user exits and saves the database.
+
+    :param args: parsed command line arguments, with the directory of the database and the indexes to build.
+    """
+    from mail_manager import utils
+    from mail_manager.database import DatabaseConfiguration
 
     # We create a Database Configuration object with the name of the folder where our emails and configuration files are
-    # going to be stored. In our case all of them are placed inside "emailDB".
-    db_config = DatabaseConfiguration("emailDB")
+    # going to be stored. By default all of them are placed inside "emailDB".
+    db_config = DatabaseConfiguration(args.database, **DATABASE_OPTIONS, **index_options(args))
 
     # This function reads the EMConfig file and returns a Database object with all the information about
     # the state of the email manager.
@@ -388,7 +441,408 @@ def main():
 
     # When the user decides to exit the program it has to save all the information related to the changes done in the
     # email manager. So it writes a new EMConfig file with the new state of folders, emails and Message-Id.
+    # Meanwhile every change has been recorded in the journal, so a crash doesn't lose the session.
     utils.write_database(db)
+    db.close()
+
+
+def open_database(args):
+    """
+    Loads the database of a subcommand, with the options of COMMAND_OPTIONS and the indexes asked for.
+
+    :param args: parsed command line arguments.
+    :return: the database.
+    """
+    from mail_manager import utils
+    from mail_manager.database import DatabaseConfiguration
+
+    return utils.load_database(DatabaseConfiguration(args.database, **COMMAND_OPTIONS, **index_options(args)))
+
+
+def connect(args):
+    """
+    Connects to the server of the database, if one is running (see 'serve').
+
+    :param args: parsed command line arguments.
+    :return: a Client, or None if there is no server. It exits with an error if a socket was given with --socket
+     and there is no server listening on it.
+    """
+    socket_path = args.socket or os.path.join(args.database, SOCKET_NAME)
+    if args.socket is None and not os.path.exists(socket_path):
+        return None
+    from mail_manager.client import Client
+    try:
+        return Client(socket_path)
+    except OSError as e:
+        if args.socket is not None:
+            print("Error: can't connect to {}: {}".format(socket_path, e), file=sys.stderr)
+            sys.exit(1)
+        return None
+
+
+def command_emails(db, folder_name):
+    """
+    Returns the emails of a folder, or of the whole database if no folder is given.
+
+    :param db: An email database.
+    :param folder_name: name of the folder, or None.
+    :return: the linked list of emails.
+    """
+    from mail_manager.exceptions import MailManagerException
+
+    if folder_name is None:
+        return db.emails
+    if folder_name not in db.folders:
+        raise MailManagerException("The folder \'" + folder_name + "\' does not exist")
+    return db.folders[folder_name].emails
+
+
+def print_email_line(fields):
+    """
+    Prints an email as a line with its id, date, sender and subject separated by tabs.
+
+    :param fields: sequence with the id, date, sender and subject of the email.
+    """
+    print("\t".join(str(field) for field in fields), flush=True)
+
+
+def list_command(args):
+    """
+    Prints a line for every email of the database or of a folder.
+
+    :param args: parsed command line arguments.
+    """
+    client = connect(args)
+    if client is not None:
+        with client:
+            for fields in client.request("list", folder=args.folder):
+                print_email_line(fields)
+        return
+
+    db = open_database(args)
+    try:
+        for email in command_emails(db, args.folder):
+            print_email_line((email.id, email.date, email.sender, email.subject))
+    finally:
+        db.close()
+
+
+def show_command(args):
+    """
+    Prints an email. Only the configuration file, the journal and the requested email are read. The journal is
+    applied to the folders of the configuration file to know whether the email is still in the database.
+
+    :param args: parsed command line arguments.
+    """
+    from mail_manager.database import DatabaseConfiguration
+    from mail_manager.exceptions import MailManagerException
+    from mail_manager.journal import Journal
+    from mail_manager.storage import open_storage
+    from mail_manager.utils import read_config, replay_folders
+
+    client = connect(args)
+    if client is not None:
+        with client:
+            print(client.request("show", email_id=args.email_id))
+        return
+
+    db_config = DatabaseConfiguration(args.database, **COMMAND_OPTIONS)
+    _, folders = read_config(db_config.get_config_path())
+    entries = Journal(db_config.get_journal_path()).read() if db_config.journal else []
+    folder_ids, _ = replay_folders(folders, entries)
+    missing = MailManagerException("There is no email with the id \'" + args.email_id + "\'")
+    if not any(args.email_id in email_ids for email_ids in folder_ids.values()):
+        raise missing
+
+    storage = open_storage(db_config)
+    try:
+        email = storage.load(args.email_id)
+    except FileNotFoundError:
+        raise missing
+    except OSError as e:
+        raise MailManagerException("The email \'" + args.email_id + "\' can't be read: " + str(e))
+    finally:
+        storage.close()
+    print(email)
+
+
+def search_command(args):
+    """
+    Prints a line for every email that matches a query, as soon as it is found. The query syntax is described in
+    mail_manager.query.parse_query.
+
+    :param args: parsed command line arguments.
+    """
+    from mail_manager.query import parse_query
+
+    client = connect(args)
+    if client is not None:
+        with client:
+            for fields in client.request("search", text=args.text, folder=args.folder):
+                print_email_line(fields)
+        return
+
+    query = parse_query(args.text)
+    db = open_database(args)
+    try:
+        for email in command_emails(db, args.folder):
+            if query.matches(email):
+                print_email_line((email.id, email.date, email.sender, email.subject))
+    finally:
+        db.close()
+
+
+def add_to_folder_command(args):
+    """
+    Adds emails of the database to a folder.
+
+    :param args: parsed command line arguments.
+    """
+    from mail_manager.exceptions import MailManagerException
+
+    client = connect(args)
+    if client is not None:
+        with client:
+            results = client.request("add-to-folder", folder=args.folder, email_ids=args.email_ids)
+    else:
+        db = open_database(args)
+        try:
+            results = db.add_emails(args.email_ids, args.folder)
+            db.commit()
+        finally:
+            db.close()
+
+    failed = False
+    for email_id, result in zip(args.email_ids, results):
+        if isinstance(result, (MailManagerException, str)):
+            print("Error: {}: {}".format(email_id, result), file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def import_command(args):
+    """
+    Imports email files, written in the format of the email files of the database, as new emails of a folder. The
+    new id of every email is printed as soon as it is imported.
+
+    :param args: parsed command line arguments.
+    """
+    from mail_manager import utils
+    from mail_manager.exceptions import MailManagerException
+    from mail_manager.storage import read_email_file
+
+    client = connect(args)
+    if client is not None:
+        with client:
+            for email_id in client.request("import", paths=[os.path.abspath(path) for path in args.files],
+                                           folder=args.folder):
+                print(email_id)
+        return
+
+    db = open_database(args)
+    try:
+        if args.folder not in db.folders:
+            raise MailManagerException("The folder \'" + args.folder + "\' does not exist")
+        emails = []
+        for path in args.files:
+            email = read_email_file(path, str(db.email_id_seed) + "EDA1email")
+            utils.write_email(email, db)
+            db.email_id_seed += 1
+            emails.append(email)
+            print(email.id, flush=True)
+        db.add_emails(emails, args.folder)
+        db.commit()
+    finally:
+        db.close()
+
+
+def export_command(args):
+    """
+    Writes the emails of the database or of a folder to a directory, as text files named after their ids.
+
+    :param args: parsed command line arguments.
+    """
+    client = connect(args)
+    if client is not None:
+        with client:
+            count = client.request("export", directory=os.path.abspath(args.directory), folder=args.folder)
+        print("Exported {} emails to {}".format(count, args.directory))
+        return
+
+    db = open_database(args)
+    try:
+        os.makedirs(args.directory, exist_ok=True)
+        count = 0
+        for email in command_emails(db, args.folder):
+            with open(os.path.join(args.directory, email.id + ".txt"), 'w') as f:
+                f.write(str(email))
+            count += 1
+    finally:
+        db.close()
+    print("Exported {} emails to {}".format(count, args.directory))
+
+
+def stats_command(args):
+    """
+    Prints the statistics of the database as JSON, see Database.stats.
+
+    :param args: parsed command line arguments.
+    """
+    import json
+
+    client = connect(args)
+    if client is not None:
+        with client:
+            print(json.dumps(client.request("stats"), indent=2))
+        return
+
+    db = open_database(args)
+    try:
+        print(json.dumps(db.stats(), indent=2))
+    finally:
+        db.close()
+
+
+def serve_command(args):
+    """
+    Loads the database with the options of the interactive menu and serves it on a Unix domain socket until it is
+    stopped with Ctrl+C, a SIGTERM or 'main.py stop'. Meanwhile the other subcommands are sent to it.
+
+    :param args: parsed command line arguments.
+    """
+    from mail_manager import utils
+    from mail_manager.database import DatabaseConfiguration
+    from mail_manager.server import DatabaseServer, serve
+
+    socket_path = args.socket or os.path.join(args.database, SOCKET_NAME)
+    db = utils.load_database(DatabaseConfiguration(args.database, **DATABASE_OPTIONS, **index_options(args)))
+    server = DatabaseServer(db, socket_path)
+    print("Serving {} on {}".format(args.database, socket_path), flush=True)
+    serve(server)
+
+
+def stop_command(args):
+    """
+    Stops the server of the database.
+
+    :param args: parsed command line arguments.
+    """
+    from mail_manager.exceptions import MailManagerException
+
+    client = connect(args)
+    if client is None:
+        raise MailManagerException("There is no server running")
+    with client:
+        client.request("shutdown")
+
+
+def parse_arguments():
+    """
+    Parses the command line. Without a subcommand, the interactive menu is shown.
+
+    :return: the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Email manager")
+    parser.add_argument("--database", default="emailDB", help="directory of the database, defaults to emailDB")
+    parser.add_argument("--socket", help="socket of the server, defaults to " + SOCKET_NAME + " in the database")
+    parser.add_argument("--search-index", action="store_true", help="keep an index of words to speed up searches")
+    parser.add_argument("--trigram-index", action="store_true",
+                        help="keep a trigram index to speed up substring searches")
+    parser.add_argument("--address-index", action="store_true",
+                        help="keep indexes of the addresses to speed up from: and to: queries")
+    parser.add_argument("--profile", action="store_true", help="print the latency of every operation at exit")
+    parser.add_argument("--profile-json", metavar="PATH", help="write the profile report as JSON, implies --profile")
+    parser.add_argument("--cprofile", metavar="PATH", help="write a cProfile capture of the session to PATH")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    command = commands.add_parser("list", help="list the emails")
+    command.add_argument("--folder", help="only list the emails of this folder")
+    command.set_defaults(function=list_command)
+
+    command = commands.add_parser("show", help="show an email")
+    command.add_argument("email_id", metavar="ID")
+    command.set_defaults(function=show_command)
+
+    command = commands.add_parser("search", help="list the emails that match a query")
+    command.add_argument("text", metavar="TEXT", help="query, like 'from:bank subject:invoice'")
+    command.add_argument("--folder", help="only search the emails of this folder")
+    command.set_defaults(function=search_command)
+
+    command = commands.add_parser("add-to-folder", help="add emails to a folder")
+    command.add_argument("folder", metavar="FOLDER")
+    command.add_argument("email_ids", metavar="ID", nargs="+")
+    command.set_defaults(function=add_to_folder_command)
+
+    command = commands.add_parser("import", help="import email files as new emails")
+    command.add_argument("files", metavar="FILE", nargs="+")
+    command.add_argument("--folder", default="Inbox", help="folder of the new emails, defaults to Inbox")
+    command.set_defaults(function=import_command)
+
+    command = commands.add_parser("export", help="write the emails as text files to a directory")
+    command.add_argument("directory", metavar="DIRECTORY")
+    command.add_argument("--folder", help="only export the emails of this folder")
+    command.set_defaults(function=export_command)
+
+    command = commands.add_parser("stats", help="print the statistics of the database as JSON")
+    command.set_defaults(function=stats_command)
+
+    command = commands.add_parser("serve", help="keep the database loaded and serve the other subcommands")
+    command.set_defaults(function=serve_command)
+
+    command = commands.add_parser("stop", help="stop the server of the database")
+    command.set_defaults(function=stop_command)
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    MAIN function of the email manager.
+
+    Without a subcommand it shows the interactive menu. A subcommand, like 'list' or 'show ID', loads only what it
+    needs, prints its output and exits, so it can be used from scripts. Errors are printed to stderr and make the
+    program exit with status 1.
+
+    With --profile the calls to the database and to the I/O functions are timed, and the report is printed at exit
+    (and written as JSON with --profile-json). With --cprofile the whole session is recorded with cProfile.
+    """
+    args = parse_arguments()
+
+    profiler = None
+    if args.profile or args.profile_json:
+        from mail_manager.profiling import Profiler
+        profiler = Profiler()
+        profiler.install()
+    session_profile = None
+    if args.cprofile:
+        import cProfile
+        session_profile = cProfile.Profile()
+        session_profile.enable()
+
+    try:
+        if args.command is None:
+            run_session(args)
+        else:
+            from mail_manager.exceptions import MailManagerException
+            try:
+                args.function(args)
+            except MailManagerException as mme:
+                print("Error: {}".format(mme), file=sys.stderr)
+                sys.exit(1)
+            except BrokenPipeError:
+                # The reader of the output has gone away, like head does, so the rest of the output is discarded
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                sys.exit(1)
+    finally:
+        if session_profile is not None:
+            session_profile.disable()
+            session_profile.dump_stats(args.cprofile)
+        if profiler is not None:
+            profiler.uninstall()
+            print(profiler.format_report(), file=sys.stderr if args.command else sys.stdout)
+            if args.profile_json:
+                profiler.dump(args.profile_json)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,21 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "emailDB")
+
+
+class SampleDatabaseTestCase(unittest.TestCase):
+    """
+    Test case that works on a copy of the sample emailDB, made in a temporary directory for every test and kept in
+    self.directory.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="mail-manager-test-")
+        shutil.rmtree(self.directory)
+        shutil.copytree(SAMPLE_DIR, self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
@@ -0,0 +1,125 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+from mail_manager import compression, utils
+from mail_manager.compression import Dictionary, compress, decompress, load_dictionary
+from mail_manager.database import DatabaseConfiguration
+from mail_manager.email import Email
+from mail_manager.exceptions import MailManagerException
+from mail_manager.migrate import migrate
+
+from .support import SampleDatabaseTestCase
+
+LINES = [("Line %d of the template shared by the notifications of the bank.\n" % i).encode() for i in range(40)]
+
+
+class CompressTest(unittest.TestCase):
+    """
+    Bodies compressed with every codec are decompressed to the same bytes.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="mail-manager-test-")
+        self.body = b"".join(LINES[:20]) + "Cuenta ñ número 1234.\n".encode()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        compression._dictionaries.clear()
+
+    def test_codecs(self):
+        for codec in compression.CODECS:
+            with self.subTest(codec=codec):
+                data, encoding = compress(self.body, codec)
+                self.assertEqual(encoding, codec)
+                self.assertLess(len(data), len(self.body))
+                self.assertEqual(decompress(data, encoding, self.directory), self.body)
+
+    def test_dictionary(self):
+        dictionary = Dictionary.train([b"".join(LINES[i:i + 10]) for i in range(0, 30, 3)])
+        dictionary.save(self.directory)
+        data, encoding = compress(self.body, "zlib", dictionary=dictionary)
+        self.assertEqual(encoding, "zlib-dict:" + dictionary.id)
+        self.assertLess(len(data), len(compress(self.body, "zlib")[0]))
+
+        # Read back from the dictionary file, not from the dictionaries kept in memory
+        compression._dictionaries.clear()
+        self.assertEqual(load_dictionary(self.directory).data, dictionary.data)
+        self.assertEqual(decompress(data, encoding, self.directory), self.body)
+
+    def test_train_without_repetitions(self):
+        self.assertIsNone(Dictionary.train([b"one body", b"other text"]))
+
+    def test_missing_dictionary(self):
+        self.assertIsNone(load_dictionary(self.directory))
+        self.assertRaises(MailManagerException, load_dictionary, self.directory, "0123456789abcdef")
+        self.assertRaises(MailManagerException, decompress, b"", "zlib-dict:0123456789abcdef", self.directory)
+
+    def test_invalid_codecs(self):
+        self.assertRaises(MailManagerException, compress, self.body, "gzip")
+        self.assertRaises(MailManagerException, decompress, self.body, "gzip", self.directory)
+
+
+class CompressedStorageTest(SampleDatabaseTestCase):
+    """
+    Databases migrated to compressed storages are read back with the same bodies.
+    """
+
+    def setUp(self):
+        super().setUp()
+        db = utils.load_database(DatabaseConfiguration(self.directory))
+        emails = [Email("long", "Bank <bank@bank.bank.com>", "me <me@upf.edu>", "Statement",
+                        "Tue, 07 Feb 2017 21:32:46 +0100 (CET)", (b"".join(LINES) * 4).decode())]
+        emails += [Email("short" + str(i), "Bank <bank@bank.bank.com>", "me <me@upf.edu>", "Notification",
+                         "Tue, 07 Feb 2017 21:32:46 +0100 (CET)", b"".join(LINES[i:i + 8]).decode())
+                   for i in range(0, 30, 3)]
+        for email in emails:
+            utils.write_email(email, db)
+            db.add_email(email, "Inbox")
+        utils.write_database(db)
+        self.bodies = {email.id: email.body for email in db.emails}
+        db.close()
+
+    def tearDown(self):
+        super().tearDown()
+        compression._dictionaries.clear()
+
+    def migrate_and_reload(self, storage, codec, dictionary=False):
+        target = os.path.join(self.directory, "compressed")
+        target_config = DatabaseConfiguration(target, storage=storage, compression=codec,
+                                              compression_dictionary=dictionary, dictionary_threshold=1024)
+        migrate(DatabaseConfiguration(self.directory), target_config)
+        compression._dictionaries.clear()
+
+        db = utils.load_database(target_config)
+        self.assertEqual({email.id: email.body for email in db.emails}, self.bodies)
+        self.assertEqual(db.get_email("long").body_encoding, codec)
+        if dictionary:
+            self.assertTrue(db.get_email("short0").body_encoding.startswith("zlib-dict:"))
+        db.close()
+        return target, target_config
+
+    def test_round_trips(self):
+        for storage in ("files", "pack"):
+            for codec, dictionary in (("zlib", False), ("lzma", False), ("zlib", True)):
+                with self.subTest(storage=storage, codec=codec, dictionary=dictionary):
+                    target, _ = self.migrate_and_reload(storage, codec, dictionary)
+                    shutil.rmtree(target)
+
+    def test_missing_dictionary(self):
+        for storage in ("files", "pack"):
+            with self.subTest(storage=storage):
+                target, target_config = self.migrate_and_reload(storage, "zlib", True)
+                for path in glob.glob(os.path.join(target, "dict-*.zdict")):
+                    os.remove(path)
+                compression._dictionaries.clear()
+                with self.assertRaises(MailManagerException) as context:
+                    utils.load_database(target_config)
+                self.assertIn("compression dictionary", str(context.exception))
+                shutil.rmtree(target)
+
+
+if __name__ == "__main__":
+    unittest.main()
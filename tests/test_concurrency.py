@@ -0,0 +1,198 @@
+"""
+Stress test of a thread safe database: reader threads search it and check the consistency of its views while a
+writer thread moves, adds and removes emails, and, with the pack storage, another thread compacts the storage.
+"""
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from mail_manager import utils
+from mail_manager.database import Database, DatabaseConfiguration
+from mail_manager.email import Email
+from mail_manager.storage import open_storage
+
+EMAILS = 2000
+READERS = 4
+SECONDS = 1.5
+BATCH = 20
+
+
+class Counters:
+    """
+    Operations done and errors found by a thread.
+    """
+
+    def __init__(self):
+        self.operations = 0
+        self.errors = []
+
+    def error(self, message):
+        if len(self.errors) < 10:
+            self.errors.append(message)
+
+
+def make_emails(rng, vocabulary, prefix, count):
+    return [Email(email_id=prefix + str(i),
+                  sender=rng.choice(vocabulary) + " <" + rng.choice(vocabulary) + "@example.com>",
+                  receiver="me <me@example.com>",
+                  subject=" ".join(rng.choices(vocabulary, k=5)),
+                  date="Tue, 07 Feb 2017 21:32:46 +0100 (CET)",
+                  body=" ".join(rng.choices(vocabulary, k=80))) for i in range(count)]
+
+
+def write(db, vocabulary, stored, stop, counters):
+    """
+    Moves batches of emails between Inbox and Archive, and adds batches of new emails to Incoming and removes them
+    from the database again, until stop is set. If stored is True the new emails are also written to the storage
+    and deleted from it.
+    """
+    rng = random.Random(1)
+    created = 0
+    while not stop.is_set():
+        try:
+            choice = rng.random()
+            if choice < 0.5:
+                source, target = rng.sample(("Inbox", "Archive"), 2)
+                email_ids = db.get_email_ids(source)
+                db.move_emails(rng.sample(email_ids, min(BATCH, len(email_ids))), source, target)
+            elif choice < 0.75:
+                emails = make_emails(rng, vocabulary, "new" + str(created) + "-", BATCH)
+                if stored:
+                    for email in emails:
+                        utils.write_email(email, db)
+                db.add_emails(emails, "Incoming")
+                created += 1
+            else:
+                email_ids = list(db.get_email_ids("Incoming"))
+                emails = [db.get_email(email_id) for email_id in email_ids]
+                db.remove_emails(email_ids)
+                if stored:
+                    for email in emails:
+                        utils.delete_email(email, db)
+            counters.operations += 1
+        except Exception as e:
+            counters.error(type(e).__name__ + ": " + str(e))
+
+
+def compact(db, stop, counters):
+    """
+    Compacts the storage of the database until stop is set.
+    """
+    while not stop.is_set():
+        try:
+            db.compact_storage()
+            counters.operations += 1
+        except Exception as e:
+            counters.error(type(e).__name__ + ": " + str(e))
+
+
+def read(db, queries, seed, stop, counters):
+    """
+    Checks views, searches and lists of ids of the database until stop is set. Every email of the initial database
+    is always in exactly one of Inbox and Archive, and the database has those emails plus the ones in Incoming.
+    """
+    rng = random.Random(seed)
+    while not stop.is_set():
+        try:
+            view = db.view()
+            if len(view.folders["Inbox"]) + len(view.folders["Archive"]) != EMAILS:
+                counters.error("Inbox and Archive have " + str(len(view.folders["Inbox"]) +
+                                                               len(view.folders["Archive"])) + " emails")
+            if len(view.emails) != EMAILS + len(view.folders["Incoming"]):
+                counters.error("The view has " + str(len(view.emails)) + " emails")
+
+            text = rng.choice(queries)
+            founds = db.search(text)
+            if not all(Database.contains_text(email, text) for email in founds):
+                counters.error("The search of '" + text + "' returned an email without it")
+
+            email_ids = db.get_email_ids(rng.choice(("Inbox", "Archive", "Incoming")))
+            if len(set(email_ids)) != len(email_ids):
+                counters.error("A folder has repeated ids")
+            counters.operations += 1
+        except Exception as e:
+            counters.error(type(e).__name__ + ": " + str(e))
+
+
+class ConcurrencyTest(unittest.TestCase):
+    """
+    Readers never see an inconsistent database, and no operation fails, while other threads change it.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="mail-manager-test-")
+        rng = random.Random(0)
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        self.vocabulary = ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(2000)]
+        self.queries = [" ".join(rng.choices(self.vocabulary, k=2)) for _ in range(5)]
+        self.queries += [rng.choice(self.vocabulary)[1:] for _ in range(5)]
+        self.emails = make_emails(rng, self.vocabulary, "email", EMAILS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_threads(self, db, stored=False, compacting=False):
+        db.create_folder("Inbox")
+        db.create_folder("Archive")
+        db.create_folder("Incoming")
+        db.add_emails(self.emails, "Inbox")
+
+        stop = threading.Event()
+        counters = [Counters() for _ in range(READERS + 2)]
+        threads = [threading.Thread(target=write, args=(db, self.vocabulary, stored, stop, counters[0]))]
+        if compacting:
+            threads.append(threading.Thread(target=compact, args=(db, stop, counters[1])))
+        threads += [threading.Thread(target=read, args=(db, self.queries, i, stop, counters[i + 2]))
+                    for i in range(READERS)]
+        for thread in threads:
+            thread.start()
+        time.sleep(SECONDS)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([error for counter in counters for error in counter.errors], [])
+        self.assertGreater(counters[0].operations, 0)
+        self.assertGreater(sum(counter.operations for counter in counters[2:]), 0)
+        if compacting:
+            self.assertGreater(counters[1].operations, 0)
+
+    def test_in_memory(self):
+        db = Database(DatabaseConfiguration(self.directory, trigram_index=True, thread_safe=True), 0)
+        self.run_threads(db)
+        db.close()
+
+    @mock.patch("mail_manager.parallel.MIN_SHARD_SIZE", 100)
+    def test_parallel_search(self):
+        db = Database(DatabaseConfiguration(self.directory, search_workers=2, thread_safe=True), 0)
+        self.run_threads(db)
+        db.close()
+
+    def test_pack_compaction(self):
+        db_config = DatabaseConfiguration(self.directory, storage="pack", lazy_bodies=True, body_cache_size=100,
+                                          compression="zlib", deduplicate_bodies=True, thread_safe=True)
+        storage = open_storage(db_config)
+        for email in self.emails:
+            storage.write(email)
+        storage.close()
+        db = Database(db_config, 0)
+        self.emails = [db.storage.load(email.id, True, db.body_cache) for email in self.emails]
+        self.run_threads(db, stored=True, compacting=True)
+        utils.write_database(db)
+        db.close()
+
+        # Every email left in the database can still be read from the compacted storage
+        db = utils.load_database(DatabaseConfiguration(self.directory, storage="pack", compression="zlib",
+                                                       deduplicate_bodies=True))
+        self.assertGreaterEqual(len(db.emails), EMAILS)
+        for email in db.emails:
+            self.assertTrue(email.body)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
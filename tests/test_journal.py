@@ -0,0 +1,59 @@
+import unittest
+
+from mail_manager import utils
+from mail_manager.database import DatabaseConfiguration
+from mail_manager.migrate import migrate
+
+from .support import SampleDatabaseTestCase
+
+
+class JournalRecoveryTest(SampleDatabaseTestCase):
+    """
+    A database that stops after a journaled change, without writing its configuration file, is loaded again with
+    the change.
+    """
+
+    def delete_and_reload(self, db_config):
+        db = utils.load_database(db_config)
+        count = len(db.emails)
+        email = db.get_email("message2")
+        db.remove_email(email)
+        utils.delete_email(email, db)
+        db.commit()
+        # The process stops here, the configuration file still lists message2
+        db.close()
+
+        db = utils.load_database(db_config)
+        self.assertIsNone(db.get_email("message2"))
+        self.assertNotIn("message2", db.get_email_ids("OutBox"))
+        self.assertEqual(len(db.emails), count - 1)
+        db.close()
+
+    def test_delete_with_files(self):
+        self.delete_and_reload(DatabaseConfiguration(self.directory, journal=True))
+
+    def test_delete_with_pack(self):
+        db_config = DatabaseConfiguration(self.directory, journal=True, storage="pack")
+        migrate(DatabaseConfiguration(self.directory), db_config)
+        self.delete_and_reload(db_config)
+
+    def test_delete_with_snapshot(self):
+        self.delete_and_reload(DatabaseConfiguration(self.directory, journal=True, snapshot=True))
+
+    def test_removed_folder(self):
+        db_config = DatabaseConfiguration(self.directory, journal=True)
+        db = utils.load_database(db_config)
+        db.remove_folder("pepe")
+        db.remove_folder("OutBox")
+        utils.delete_email(db.get_email("message8") or utils.load_email(self.directory, "message8"), db)
+        db.commit()
+        db.close()
+
+        db = utils.load_database(db_config)
+        self.assertIsNone(db.get_email("message8"))
+        self.assertNotIn("OutBox", db.folders)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import random
+import unittest
+
+from mail_manager.linked_list import IndexedLinkedList
+
+
+class SmallBlocks(IndexedLinkedList):
+    """
+    Indexed linked list with tiny blocks, so a few operations split and empty them.
+    """
+
+    block_size = 4
+
+
+class IndexedLinkedListTest(unittest.TestCase):
+    """
+    An indexed linked list behaves like a Python list, compared after every random operation.
+    """
+
+    def check(self, linked, model):
+        self.assertEqual(len(linked), len(model))
+        self.assertEqual(list(linked), model)
+        self.assertEqual([linked[i] for i in range(len(model))], model)
+        self.assertEqual(linked[::3], model[::3])
+        self.assertEqual(linked[-2::-2], model[-2::-2])
+
+        positions = []
+        node = linked.first
+        while node is not None:
+            positions.append(linked.get_position(node))
+            node = node.next
+        self.assertEqual(positions, list(range(len(model))))
+        for item in set(model):
+            self.assertEqual(linked.index(item), str(model.index(item)))
+
+        if linked.blocks is not None:
+            self.assertEqual(sum(block.count for block in linked.blocks), len(model))
+            self.assertTrue(all(0 < block.count <= 2 * linked.block_size for block in linked.blocks))
+            self.assertEqual([block.position for block in linked.blocks], list(range(len(linked.blocks))))
+            if model:
+                self.assertIs(linked.blocks[0].first, linked.first)
+
+    def test_random_operations(self):
+        rng = random.Random(0)
+        linked = SmallBlocks()
+        model = []
+        most_blocks = 0
+        for step in range(3000):
+            choice = rng.random()
+            item = rng.randrange(60)
+            if choice < 0.35 or not model:
+                index = rng.randint(0, len(model))
+                linked.insert(index, item)
+                model.insert(index, item)
+            elif choice < 0.5:
+                linked.append(item)
+                model.append(item)
+            elif choice < 0.7:
+                index = rng.randrange(-len(model), len(model))
+                self.assertEqual(linked.pop(index), model.pop(index))
+            elif choice < 0.85:
+                item = rng.choice(model)
+                linked.remove(item)
+                model.remove(item)
+            else:
+                index = rng.randrange(len(model))
+                self.assertEqual(linked.remove_node(linked.get_node_at(index)), model.pop(index))
+            most_blocks = max(most_blocks, len(linked.blocks or ()))
+            if step % 50 == 0:
+                self.check(linked, model)
+        self.check(linked, model)
+        self.assertGreater(most_blocks, 10)
+
+    def test_blocks_split_and_empty(self):
+        linked = SmallBlocks()
+        model = list(range(20))
+        for item in model:
+            linked.append(item)
+        linked.get_node_at(0)
+        self.assertEqual(len(linked.blocks), 5)
+
+        # Inserting in the middle of a block grows it until it splits
+        for item in range(100, 110):
+            linked.insert(6, item)
+            model.insert(6, item)
+            self.check(linked, model)
+        self.assertGreater(len(linked.blocks), 5)
+
+        # Removing every node of a block removes the block
+        blocks = len(linked.blocks)
+        for _ in range(linked.blocks[0].count):
+            self.assertEqual(linked.pop(0), model.pop(0))
+        self.assertEqual(len(linked.blocks), blocks - 1)
+        self.check(linked, model)
+
+        while model:
+            self.assertEqual(linked.pop(), model.pop())
+        self.check(linked, model)
+        linked.append(1)
+        linked.insert(0, 2)
+        self.check(linked, [2, 1])
+
+    def test_blocks_built_on_demand(self):
+        linked = IndexedLinkedList()
+        for item in range(1000):
+            linked.append(item)
+        linked.remove(500)
+        self.assertIsNone(linked.blocks)
+        self.assertEqual(linked[500], 501)
+        self.assertEqual(len(linked.blocks), 4)
+        linked.clear()
+        self.assertIsNone(linked.blocks)
+        self.assertEqual(list(linked), [])
+
+    def test_out_of_range(self):
+        linked = SmallBlocks()
+        self.assertRaises(IndexError, linked.pop)
+        linked.append(1)
+        self.assertRaises(IndexError, linked.insert, 2, 0)
+        self.assertRaises(IndexError, linked.insert, -1, 0)
+        self.assertRaises(IndexError, linked.get_node_at, 1)
+        self.assertRaises(IndexError, linked.pop, -2)
+        self.assertRaises(ValueError, linked.index, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
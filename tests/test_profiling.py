@@ -0,0 +1,46 @@
+import unittest
+
+from mail_manager import utils
+from mail_manager.database import DatabaseConfiguration
+from mail_manager.exceptions import MailManagerException
+from mail_manager.migrate import migrate
+from mail_manager.profiling import Profiler
+
+from .support import SampleDatabaseTestCase
+
+
+class ProfilerTest(SampleDatabaseTestCase):
+    """
+    A profiled load records every email read from disk.
+    """
+
+    def profile_load(self, db_config, operation):
+        with Profiler() as profiler:
+            db = utils.load_database(db_config)
+            db.close()
+        report = profiler.report()
+        self.assertEqual(report[operation]["calls"], len(db.emails))
+        self.assertGreater(report[operation]["bytes"], 0)
+
+    def test_load_with_files(self):
+        self.profile_load(DatabaseConfiguration(self.directory), "storage.read_email_file")
+
+    def test_load_with_pack(self):
+        db_config = DatabaseConfiguration(self.directory, storage="pack")
+        migrate(DatabaseConfiguration(self.directory), db_config)
+        self.profile_load(db_config, "PackStorage.load")
+
+    def test_failed_calls(self):
+        db = utils.load_database(DatabaseConfiguration(self.directory))
+        with Profiler() as profiler:
+            self.assertRaises(MailManagerException, db.get_email_ids, "Archive")
+            db.get_email_ids("Inbox")
+        db.close()
+        stats = profiler.report()["Database.get_email_ids"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["errors"], 1)
+        self.assertIn("errors", profiler.format_report())
+
+
+if __name__ == "__main__":
+    unittest.main()
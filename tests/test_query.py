@@ -0,0 +1,95 @@
+import unittest
+
+from mail_manager.email import Email
+from mail_manager.exceptions import MailManagerException
+from mail_manager.query import And, Or, Term, parse_query, tokenize
+
+
+def describe(tokens):
+    return [token if isinstance(token, str) else (token.field, token.value) for token in tokens]
+
+
+class TokenizeTest(unittest.TestCase):
+    """
+    Queries are split into parentheses, operators and terms.
+    """
+
+    def test_terms_and_operators(self):
+        self.assertEqual(describe(tokenize('banco AND (mes OR "bank manager")')),
+                         [(None, "banco"), "AND", "(", (None, "mes"), "OR", (None, "bank manager"), ")"])
+
+    def test_field_prefixes(self):
+        self.assertEqual(describe(tokenize('from:bank To:me subject:"un mes" body:content')),
+                         [("sender", "bank"), ("receiver", "me"), ("subject", "un mes"), ("body", "content")])
+
+    def test_unknown_prefix_is_part_of_the_text(self):
+        self.assertEqual(describe(tokenize("cc:pepe http://example.com subject:")),
+                         [(None, "cc:pepe"), (None, "http://example.com"), (None, "subject:")])
+
+    def test_operators_are_upper_case(self):
+        self.assertEqual(describe(tokenize("a and b or c")),
+                         [(None, "a"), (None, "and"), (None, "b"), (None, "or"), (None, "c")])
+
+    def test_quoted_operator_is_a_term(self):
+        self.assertEqual(describe(tokenize('"AND"')), [(None, "AND")])
+
+
+class ParseQueryTest(unittest.TestCase):
+    """
+    Terms are joined by AND, which binds tighter than OR, and parentheses group queries.
+    """
+
+    def test_single_term(self):
+        query = parse_query("from:bank")
+        self.assertIsInstance(query, Term)
+        self.assertEqual(str(query), "sender:bank")
+
+    def test_and_binds_tighter_than_or(self):
+        query = parse_query("a OR b AND c")
+        self.assertIsInstance(query, Or)
+        self.assertEqual(str(query), "(a OR (b AND c))")
+
+    def test_juxtaposed_terms_are_joined_by_and(self):
+        query = parse_query("a b OR c")
+        self.assertEqual(str(query), "((a AND b) OR c)")
+        self.assertIsInstance(query.queries[0], And)
+
+    def test_parentheses(self):
+        self.assertEqual(str(parse_query("(a OR b) c")), "((a OR b) AND c)")
+        self.assertEqual(str(parse_query("((a))")), "a")
+
+    def test_malformed_queries(self):
+        for text in ("", "   ", "banco (", '"banco', "(a OR b", "a)", "()", "AND", "a OR", "a AND AND b"):
+            with self.subTest(text=text):
+                self.assertRaises(MailManagerException, parse_query, text)
+
+
+class MatchesTest(unittest.TestCase):
+    """
+    Queries match emails by their fields.
+    """
+
+    def setUp(self):
+        self.email = Email("message1", "Bank <bank@bank.bank.com>", "me <me@upf.edu>",
+                           "Le queda un mes para elegir el mejor banco.", "Tue, 07 Feb 2017 21:32:46 +0100 (CET)",
+                           "This is the bank message content!")
+
+    def test_fields(self):
+        self.assertTrue(parse_query("from:bank@bank.bank.com").matches(self.email))
+        self.assertTrue(parse_query("to:ME").matches(self.email))
+        self.assertTrue(parse_query('subject:"un mes"').matches(self.email))
+        self.assertFalse(parse_query("subject:content").matches(self.email))
+        self.assertTrue(parse_query("body:content").matches(self.email))
+
+    def test_terms_match_separately(self):
+        self.assertTrue(parse_query("banco content").matches(self.email))
+        self.assertFalse(parse_query('"banco content"').matches(self.email))
+
+    def test_operators(self):
+        self.assertTrue(parse_query("nothing OR banco").matches(self.email))
+        self.assertFalse(parse_query("nothing AND banco").matches(self.email))
+        self.assertTrue(parse_query("(nothing OR banco) AND from:bank").matches(self.email))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from mail_manager import utils
+from mail_manager.database import DatabaseConfiguration
+from mail_manager.email import Email
+from mail_manager.migrate import migrate
+from mail_manager.snapshot import load_snapshot
+
+from .support import SampleDatabaseTestCase
+
+
+class SnapshotTest(SampleDatabaseTestCase):
+    """
+    The snapshot written at the end of a session that adds emails is used by the next load.
+    """
+
+    def add_and_reload(self, db_config):
+        db = utils.load_database(db_config)
+        email = Email("new1", "Ana <ana@example.com>", "Pepe <pepe@example.com>", "New email",
+                      "Tue, 07 Feb 2017 21:32:46 +0100 (CET)", "Body of the new email, ñ.\n" * 20)
+        utils.write_email(email, db)
+        db.add_email(email, "Inbox")
+        utils.write_database(db)
+        db.close()
+
+        db = load_snapshot(db_config)
+        self.assertIsNotNone(db)
+        self.assertEqual(db.get_email("new1").body, email.body)
+        self.assertIn("new1", db.get_email_ids("Inbox"))
+        db.close()
+
+    def test_add_with_files(self):
+        self.add_and_reload(DatabaseConfiguration(self.directory, snapshot=True))
+
+    def test_add_with_compressed_pack(self):
+        db_config = DatabaseConfiguration(self.directory, snapshot=True, storage="pack", compression="zlib",
+                                          deduplicate_bodies=True)
+        migrate(DatabaseConfiguration(self.directory), db_config)
+        self.add_and_reload(db_config)
+
+    def load_broken_snapshot(self, data):
+        db_config = DatabaseConfiguration(self.directory, snapshot=True)
+        utils.load_database(db_config).close()
+        with open(db_config.get_snapshot_path(), 'wb') as f:
+            f.write(data)
+
+        self.assertIsNone(load_snapshot(db_config))
+        db = utils.load_database(db_config)
+        self.assertIn("message1", db.get_email_ids("Inbox"))
+        db.close()
+
+    def test_truncated_snapshot(self):
+        db_config = DatabaseConfiguration(self.directory, snapshot=True)
+        utils.load_database(db_config).close()
+        with open(db_config.get_snapshot_path(), 'rb') as f:
+            data = f.read()
+        self.load_broken_snapshot(data[:len(data) // 2])
+
+    def test_snapshot_of_missing_class(self):
+        self.load_broken_snapshot(b"cmail_manager.removed_module\nRemovedClass\n)\x81.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import unittest
+
+from mail_manager import utils
+from mail_manager.database import DatabaseConfiguration
+from mail_manager.email import Email
+from mail_manager.exceptions import MailManagerException
+from mail_manager.migrate import migrate
+from mail_manager.storage import PackStorage, open_storage
+
+from .support import SampleDatabaseTestCase
+
+
+class FileStorageTest(SampleDatabaseTestCase):
+    """
+    Emails kept in their own text files.
+    """
+
+    def test_write_lazy_email(self):
+        bodies = {email.id: email.body for email in utils.load_database(DatabaseConfiguration(self.directory)).emails}
+
+        db = utils.load_database(DatabaseConfiguration(self.directory, lazy_bodies=True))
+        for email in db.emails:
+            utils.write_email(email, db)
+        db.close()
+
+        db = utils.load_database(DatabaseConfiguration(self.directory))
+        self.assertEqual({email.id: email.body for email in db.emails}, bodies)
+        db.close()
+
+
+def email_fields(db):
+    return {email.id: (email.sender, email.receiver, email.subject, email.date, email.body) for email in db.emails}
+
+
+class PackStorageTest(SampleDatabaseTestCase):
+    """
+    Emails appended to the segment files of a pack storage.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.files_config = DatabaseConfiguration(self.directory)
+        self.pack_config = DatabaseConfiguration(self.directory, storage="pack")
+
+    def test_migrate_and_reload(self):
+        db = utils.load_database(self.files_config)
+        fields = email_fields(db)
+        folders = {name: db.get_email_ids(name) for name in db.get_folder_names()}
+        db.close()
+
+        target = os.path.join(self.directory, "packed")
+        pack_config = DatabaseConfiguration(target, storage="pack")
+        self.assertEqual(migrate(self.files_config, pack_config), len(fields))
+        self.assertFalse([name for name in os.listdir(target) if name.endswith(".txt") and name != "EMConfig.txt"])
+
+        for lazy_bodies in (False, True):
+            db = utils.load_database(DatabaseConfiguration(target, storage="pack", lazy_bodies=lazy_bodies))
+            self.assertEqual(email_fields(db), fields)
+            self.assertEqual({name: db.get_email_ids(name) for name in db.get_folder_names()}, folders)
+            db.close()
+
+    def test_corrupt_record_is_cut_off(self):
+        migrate(self.files_config, self.pack_config)
+        storage = open_storage(self.pack_config)
+        last_id, (number, start, length) = max(storage.index.items(), key=lambda item: item[1][:2])
+        storage.close()
+        path = storage._segment_path(number)
+        size = os.path.getsize(path)
+
+        # Without the saved index every record is read again and its CRC checked
+        os.remove(os.path.join(self.directory, "pack.index"))
+        with open(path, 'r+b') as f:
+            f.seek(start + length // 2)
+            byte = f.read(1)
+            f.seek(start + length // 2)
+            f.write(bytes([byte[0] ^ 0xff]))
+
+        storage = open_storage(self.pack_config)
+        self.assertIsNone(storage.signature(last_id))
+        self.assertRaises(MailManagerException, storage.load, last_id)
+        self.assertEqual(os.path.getsize(path), start - PackStorage.record.size - len(last_id.encode()))
+        self.assertLess(os.path.getsize(path), size)
+        for email_id in storage.index:
+            self.assertTrue(storage.load(email_id).body)
+        storage.close()
+
+    def test_deleted_email_stays_deleted(self):
+        migrate(self.files_config, self.pack_config)
+        storage = open_storage(self.pack_config)
+        count = len(storage.index)
+        storage.delete("message2")
+        self.assertRaises(MailManagerException, storage.delete, "message2")
+        storage.close()
+
+        def check_deleted():
+            storage = open_storage(self.pack_config)
+            self.assertIsNone(storage.signature("message2"))
+            self.assertRaises(MailManagerException, storage.load, "message2")
+            self.assertEqual(len(storage.index), count - 1)
+            return storage
+
+        # With the saved index, and with every record read again from the segments
+        check_deleted().close()
+        os.remove(os.path.join(self.directory, "pack.index"))
+        storage = check_deleted()
+        self.assertGreater(storage.stats()["garbage_bytes"], 0)
+
+        storage.compact()
+        self.assertEqual(storage.stats()["garbage_bytes"], 0)
+        self.assertIsNone(storage.signature("message2"))
+        storage.close()
+        check_deleted().close()
+        os.remove(os.path.join(self.directory, "pack.index"))
+        check_deleted().close()
+
+
+class DeduplicationTest(SampleDatabaseTestCase):
+    """
+    Identical bodies are stored once, and stay readable while some email refers to them.
+    """
+
+    def shared_body_survives_compaction(self, storage, stored_bodies):
+        db_config = DatabaseConfiguration(self.directory, storage=storage, deduplicate_bodies=True,
+                                          compression="zlib")
+        migrate(DatabaseConfiguration(self.directory), db_config)
+        db = utils.load_database(db_config)
+        body = "Shared body of the newsletter.\n" * 50
+        for email_id in ("copy1", "copy2"):
+            email = Email(email_id, "News <news@example.com>", "me <me@upf.edu>", "Newsletter",
+                          "Tue, 07 Feb 2017 21:32:46 +0100 (CET)", body)
+            utils.write_email(email, db)
+            db.add_email(email, "Inbox")
+        self.assertIs(db.get_email("copy1").body, db.get_email("copy2").body)
+        self.assertEqual(db.get_email("copy1").body_ref, db.get_email("copy2").body_ref)
+        bodies = stored_bodies(db.storage)
+        self.assertEqual(db.stats()["disk"]["saved_bytes"], db.storage.body_size(db.get_email("copy1").body_ref))
+
+        email = db.get_email("copy1")
+        db.remove_email(email)
+        utils.delete_email(email, db)
+        utils.write_database(db)
+        db.compact_storage()
+        self.assertEqual(stored_bodies(db.storage), bodies)
+        db.close()
+
+        for lazy_bodies in (False, True):
+            db = utils.load_database(DatabaseConfiguration(self.directory, storage=storage, deduplicate_bodies=True,
+                                                           compression="zlib", lazy_bodies=lazy_bodies))
+            self.assertIsNone(db.get_email("copy1"))
+            self.assertEqual(db.get_email("copy2").body, body)
+            db.close()
+
+        # Once no email refers to the body, compact reclaims it
+        db = utils.load_database(db_config)
+        email = db.get_email("copy2")
+        db.remove_email(email)
+        utils.delete_email(email, db)
+        utils.write_database(db)
+        db.compact_storage()
+        self.assertEqual(stored_bodies(db.storage), bodies - 1)
+        db.close()
+
+    def test_files(self):
+        self.shared_body_survives_compaction(
+            "files", lambda storage: len([name for name in os.listdir(self.directory) if name.endswith(".body")]))
+
+    def test_pack(self):
+        self.shared_body_survives_compaction("pack", lambda storage: len(storage.bodies))
+
+
+if __name__ == "__main__":
+    unittest.main()